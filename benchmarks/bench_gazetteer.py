@@ -0,0 +1,160 @@
+"""
+Gazetteer lookup time and memory, and location extraction against the old
+"first word after in/for/at" rule.
+
+Loads the bundled data/cities.tsv and a synthetic GeoNames-format file of
+--places cities (roughly the size of cities1000.txt by default), and for
+each reports load time, the index's own size, the Python heap it keeps
+(tracemalloc) and the growth of the process's resident set (which also
+holds what the allocator kept from loading), next to the same places held
+as a plain {name: Place} dict. Then times find() on weather utterances and
+on chat utterances that name no place, and lookup() on place names.
+
+    python benchmarks/bench_gazetteer.py [--places 150000] [--number 2000]
+"""
+import os
+import sys
+import random
+import string
+import timeit
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.gazetteer import Gazetteer, Place, normalize_place
+
+BUNDLED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cities.tsv")
+
+# (utterance, the city it asks about)
+WEATHER = [
+    ("what's the weather like in New York today", "New York"),
+    ("is it going to rain in Seattle", "Seattle"),
+    ("what is the temperature in Berlin", "Berlin"),
+    ("how's the weather in Rio de Janeiro this weekend", "Rio de Janeiro"),
+    ("weather for Los Angeles please", "Los Angeles"),
+    ("give me the forecast for Buenos Aires", "Buenos Aires"),
+    ("is it sunny in San Francisco right now", "San Francisco"),
+    ("Tokyo weather", "Tokyo"),
+    ("what's the humidity at Hong Kong", "Hong Kong"),
+    ("how cold is it in Saint Petersburg", "Saint Petersburg"),
+    ("weather in São Paulo", "Sao Paulo"),
+    ("will it snow in Salt Lake City tomorrow", "Salt Lake City"),
+]
+CHAT = [
+    "tell me a story about a brave little robot who learns to paint",
+    "i was wondering if you could explain how photosynthesis works",
+    "what's a good name for a golden retriever puppy",
+    "is it nice out",
+]
+
+
+def legacy_extract(text: str) -> str:
+    """extract_location_from_text before the gazetteer."""
+    text_lower = text.lower()
+    for indicator in ["in ", "for ", "at ", "weather in ", "weather for ", "temperature in "]:
+        if indicator in text_lower:
+            location_part = text.split(indicator, 1)[1].strip()
+            return (location_part.split()[0] if location_part.split() else "London").title()
+    return "London"
+
+
+def synthetic_geonames(path: str, places: int, seed: int = 7):
+    """A GeoNames-format file (19 tab-separated columns) of made-up cities."""
+    rng = random.Random(seed)
+    syllables = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 4))) for _ in range(400)]
+    with open(path, "w", encoding="utf-8") as out:
+        for geonameid in range(places):
+            words = ["".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).title()
+                     for _ in range(rng.choice((1, 1, 1, 2, 2, 3)))]
+            name = " ".join(words)
+            cols = [str(geonameid), name, name, "", f"{rng.uniform(-60, 70):.5f}", f"{rng.uniform(-180, 180):.5f}",
+                    "P", "PPL", rng.choice(["US", "IN", "BR", "DE", "CN", "NG", "FR"]), "", "", "", "", "",
+                    str(int(rng.paretovariate(1.2) * 1000)), "", "0", "Etc/UTC", "2024-01-01"]
+            out.write("\t".join(cols) + "\n")
+
+
+def rss_kb() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def naive_index(path: str) -> dict:
+    """The same places as a dict of Place tuples keyed by every name."""
+    index = {}
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if line.startswith("#") or not line.strip():
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) >= 19:
+                place = Place(cols[1], cols[8], float(cols[4]), float(cols[5]), int(cols[14] or 0))
+                names = [cols[1], cols[2]]
+            else:
+                place = Place(cols[0], cols[1], float(cols[2]), float(cols[3]), int(cols[4] or 0))
+                names = [cols[0], *cols[5].split(",")] if len(cols) > 5 else [cols[0]]
+            for name in names:
+                index.setdefault(normalize_place(name), place)
+    return index
+
+
+def measure_memory(label: str, path: str):
+    rss_before = rss_kb()
+    gazetteer = Gazetteer(path)
+    gazetteer.lookup("warm up")
+    rss = rss_kb() - rss_before
+    stats = gazetteer.stats()
+
+    # A second copy, traced, for the heap it keeps (tracing slows loading several times)
+    tracemalloc.start()
+    traced = Gazetteer(path)
+    traced.lookup("warm up")
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    tracemalloc.start()
+    naive = naive_index(path)
+    naive_heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{label}: {stats['places']} places, {stats['names']} names, loaded in {stats['load_ms']:.0f} ms")
+    print(f"  index {stats['index_bytes'] / 1024:8.0f} KiB   heap {heap / 1024:8.0f} KiB   RSS +{rss:6d} KiB   "
+          f"(dict of Place: heap {naive_heap / 1024:8.0f} KiB, {naive_heap / max(heap, 1):.1f}x)")
+    del naive
+    return gazetteer
+
+
+def per_call(label: str, func, items, number: int):
+    seconds = timeit.timeit(lambda: [func(item) for item in items], number=number) / (number * len(items))
+    print(f"  {label:<44} {seconds * 1e6:7.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--places", type=int, default=150000, help="size of the synthetic GeoNames file")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    bundled = measure_memory("bundled data/cities.tsv", BUNDLED)
+    legacy_ok = sum(legacy_extract(text) == city for text, city in WEATHER)
+    found_ok = sum((bundled.find(text) or Place("", "", 0, 0, 0)).name == city for text, city in WEATHER)
+    print(f"  location extraction correct: gazetteer {found_ok}/{len(WEATHER)}, "
+          f"first word after in/for/at {legacy_ok}/{len(WEATHER)}")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "cities.txt")
+        synthetic_geonames(path, args.places)
+        large = measure_memory(f"synthetic GeoNames ({args.places} places)", path)
+
+    names = [city for _, city in WEATHER]
+    for label, gazetteer in (("bundled", bundled), ("synthetic", large)):
+        print(f"{label}:")
+        per_call("find(), weather utterance", gazetteer.find, [text for text, _ in WEATHER], args.number)
+        per_call("find(), chat utterance (no place)", gazetteer.find, CHAT, args.number)
+        per_call("lookup(), place name", gazetteer.lookup, names, args.number)
+    per_call("legacy first-word extraction", legacy_extract, [text for text, _ in WEATHER], args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for per-utterance intent routing cost.
+
+Compares the old `any(word in text for word in [...])` chain (one substring
+scan per phrase per skill) with the compiled IntentRouter as the number of
+registered skills and phrases grows.
+
+    python benchmarks/bench_intent_router.py
+"""
+import os
+import sys
+import random
+import string
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.intents import IntentRouter
+
+UTTERANCES = [
+    "what's the weather like in tokyo this afternoon",
+    "tell me the latest technology news",
+    "can you search for the best pizza places near me",
+    "how much memory is my computer using",
+    "what time is it in london right now",
+    "tell me a story about a brave little robot who learns to paint",
+    "i was wondering if you could explain how photosynthesis works",
+]
+
+
+def random_word(rng, length=7):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def build_skills(num_skills, phrases_per_skill, seed=7):
+    rng = random.Random(seed)
+    skills = []
+    for i in range(num_skills):
+        phrases = [random_word(rng) for _ in range(phrases_per_skill)]
+        if rng.random() < 0.3:
+            phrases.append(f"{random_word(rng)} {random_word(rng, 5)}")
+        skills.append((f"skill_{i}", phrases))
+    return skills
+
+
+def legacy_route(skills, text):
+    text_lower = text.lower()
+    for name, phrases in skills:
+        if any(word in text_lower for word in phrases):
+            return name
+    return None
+
+
+def bench(num_skills, phrases_per_skill, number=2000):
+    skills = build_skills(num_skills, phrases_per_skill)
+    router = IntentRouter()
+    for priority, (name, phrases) in enumerate(skills):
+        router.register(name, phrases, priority=priority)
+    router.route("warm up")
+
+    def run_legacy():
+        for text in UTTERANCES:
+            legacy_route(skills, text)
+
+    def run_router():
+        for text in UTTERANCES:
+            router.route(text)
+
+    per_call = number * len(UTTERANCES)
+    legacy = min(timeit.repeat(run_legacy, number=number, repeat=3)) / per_call
+    compiled = min(timeit.repeat(run_router, number=number, repeat=3)) / per_call
+    return legacy * 1e6, compiled * 1e6
+
+
+def main():
+    import logging
+    logging.disable(logging.INFO)
+
+    print(f"{'skills':>6} {'phrases':>8} {'legacy us':>10} {'router us':>10} {'speedup':>8}")
+    for num_skills in (5, 20, 50, 200):
+        for phrases_per_skill in (5, 20):
+            legacy, compiled = bench(num_skills, phrases_per_skill)
+            print(f"{num_skills:>6} {num_skills * phrases_per_skill:>8} {legacy:>10.2f} {compiled:>10.2f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cost of the /metrics instrumentation: per-call time of Counter.inc,
+Histogram.observe and Histogram.time(), the records one streamed chat turn
+makes (with browser speech, and with server speech, which adds a TTS
+request and audio frames per sentence), the same under contention from
+worker threads, and the time to render a scrape.
+
+    python benchmarks/bench_metrics.py [--calls 200000] [--threads 4]
+
+The budget is 1% of the CPU the app spends on a turn. --browser-turn-ms and
+--server-turn-ms default to what uvicorn main:app used per turn under
+load_test.py on a single-core dev box (CPU time of the app process divided
+by completed turns).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.metrics import Counter, Gauge, Histogram, SIZE_BUCKETS, render_metrics
+
+STAGES = Histogram("bench_stage_seconds", "stage latency", ["stage"])
+SKILLS = Histogram("bench_skill_seconds", "skill latency", ["skill"])
+TURNS = Counter("bench_turns_total", "turns", ["intent", "outcome"])
+CALLS = Counter("bench_gemini_calls_total", "gemini calls", ["call", "status"])
+HISTORY = Histogram("bench_history_messages", "history", ["kind"], buckets=SIZE_BUCKETS)
+SENDS = Histogram("bench_ws_send_seconds", "ws sends", ["kind"])
+UPSTREAM = Counter("bench_upstream_responses_total", "upstream", ["upstream", "status"])
+UPSTREAM_SECONDS = Histogram("bench_upstream_seconds", "upstream latency", ["upstream"])
+SOCKETS = Gauge("bench_active_websockets", "sockets")
+SEND_EVENTS = SENDS.labels("events")  # Bound once, as services/protocol.py does
+SEND_AUDIO = SENDS.labels("audio")
+
+# What main.py records for one streamed chat turn of 4 sentences
+SENTENCES = 4
+AUDIO_FRAMES_PER_SENTENCE = 8
+
+
+def one_turn(server_tts: bool) -> int:
+    """Makes the records of one turn and returns how many it made."""
+    with STAGES.time("intent"):
+        pass
+    HISTORY.observe(14, "session")
+    HISTORY.observe(12, "request")
+    with STAGES.time("llm"):
+        STAGES.observe(0.4, "llm_first_chunk")
+    CALLS.inc("stream", "ok")
+    for _ in range(SENTENCES + 2):  # Event frames: ack + final, chunks, llm_done + audio_end
+        SEND_EVENTS.observe(0.00002)
+    TURNS.inc("chat", "ok")
+    STAGES.observe(1.2, "turn")
+    records = 9 + SENTENCES + 2
+    if server_tts:
+        for _ in range(SENTENCES):  # TTS requests through the HTTP pool, tts_sentence frames
+            UPSTREAM.inc("generativelanguage.googleapis.com", "200")
+            UPSTREAM_SECONDS.observe(0.6, "generativelanguage.googleapis.com")
+            SEND_EVENTS.observe(0.00002)
+        for _ in range(SENTENCES * AUDIO_FRAMES_PER_SENTENCE):
+            SEND_AUDIO.observe(0.00001)
+        with STAGES.time("tts"):
+            pass
+        records += SENTENCES * 3 + SENTENCES * AUDIO_FRAMES_PER_SENTENCE + 1
+    return records
+
+
+def per_call(label, func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / calls * 1e9:8.0f} ns/call")
+    return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--browser-turn-ms", type=float, default=2.3)
+    parser.add_argument("--server-turn-ms", type=float, default=26.0)
+    args = parser.parse_args()
+
+    values = [random.lognormvariate(-3, 2) for _ in range(1024)]
+    index = iter(range(10 ** 12))
+    per_call("Counter.inc (2 labels)", lambda: TURNS.inc("chat", "ok"), args.calls)
+    per_call("Gauge.inc (no labels)", lambda: SOCKETS.inc(), args.calls)
+    per_call("Histogram.observe (1 label)", lambda: STAGES.observe(values[next(index) & 1023], "turn"), args.calls)
+    per_call("bound child .observe", lambda: SEND_AUDIO.observe(values[next(index) & 1023]), args.calls)
+
+    def timed():
+        with STAGES.time("intent"):
+            pass
+    per_call("Histogram.time() block", timed, args.calls)
+
+    turns = max(1, args.calls // 50)
+    costs = {}
+    for server_tts, budget_ms in ((False, args.browser_turn_ms), (True, args.server_turn_ms)):
+        label = f"turn, {'server' if server_tts else 'browser'} speech ({one_turn(server_tts)} records)"
+        costs[server_tts] = (per_call(label, lambda: one_turn(server_tts), turns), budget_ms)
+
+    # Server-speech turns from several threads at once, as skill and TTS workers would
+    done = threading.Barrier(args.threads + 1)
+
+    def worker():
+        for _ in range(turns // args.threads):
+            one_turn(True)
+        done.wait()
+    start = time.perf_counter()
+    for _ in range(args.threads):
+        threading.Thread(target=worker, daemon=True).start()
+    done.wait()
+    contended = (time.perf_counter() - start) / (turns // args.threads * args.threads)
+    print(f"{'same, ' + str(args.threads) + ' threads at once':<34} {contended * 1e9:8.0f} ns/call")
+
+    start = time.perf_counter()
+    body = render_metrics()
+    print(f"{'render_metrics (' + str(len(body.splitlines())) + ' lines)':<34} {(time.perf_counter() - start) * 1e6:8.0f} us")
+    print()
+    for server_tts, (cost, budget_ms) in costs.items():
+        print(f"{'server' if server_tts else 'browser'} speech: {cost * 1e6:5.1f} us per turn = "
+              f"{cost * 1e3 / budget_ms:.2%} of a {budget_ms} ms turn (budget 1%)")
+
+
+if __name__ == "__main__":
+    main()
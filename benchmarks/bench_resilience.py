@@ -0,0 +1,122 @@
+"""
+What a degraded upstream costs a turn with a fixed timeout and with the
+resilience layer (services/resilience.py), against the local OpenWeatherMap
+stub.
+
+Runs --calls weather lookups, --concurrency at a time, through each phase:
+healthy, hung (the stub answers after --hang seconds), failing (every
+request a 502), recovered (the first calls after the breaker's reset
+time, while its single probe is out) and recovered for good. Then, with
+heavy-tailed (log-normal) stub latency, compares hedged GETs with plain
+ones. For each phase it reports the time per call and how many requests
+reached the stub. The fixed client is the old
+`session.get(url, timeout=10)`.
+
+    python benchmarks/bench_resilience.py [--calls 40] [--concurrency 8] [--hang 12]
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import start_fake_openweather
+from services.http_pool import get_http_session
+from services.resilience import Upstream, UpstreamUnavailable
+
+FIXED_TIMEOUT = 10
+
+
+def fixed_get(url: str, key: str) -> str:
+    try:
+        response = get_http_session(url).get(url, params={"q": "London", "appid": key}, timeout=FIXED_TIMEOUT)
+        return "ok" if response.status_code == 200 else "error"
+    except Exception:
+        return "error"
+
+
+def resilient_get(upstream: Upstream, hedge: bool):
+    def get(url: str, key: str) -> str:
+        try:
+            response = upstream.request("GET", url, key, hedge=hedge, params={"q": "London", "appid": key})
+            return "ok" if response.status_code == 200 else "error"
+        except UpstreamUnavailable:
+            return "fast_fail"
+        except Exception:
+            return "error"
+    return get
+
+
+def run_phase(label: str, server, get, url: str, calls: int, concurrency: int):
+    before = server.requests["weather"]
+    durations, outcomes = [], {}
+
+    def one(_):
+        started = time.perf_counter()
+        outcome = get(url, "bench-key")
+        return time.perf_counter() - started, outcome
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for seconds, outcome in pool.map(one, range(calls)):
+            durations.append(seconds)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    wall = time.perf_counter() - started
+    durations.sort()
+    p50 = durations[len(durations) // 2]
+    p99 = durations[min(len(durations) - 1, int(0.99 * len(durations)))]
+    print(f"  {label:<22} wall {wall:6.2f}s   p50 {p50 * 1000:8.1f} ms   p99 {p99 * 1000:8.1f} ms   "
+          f"max {durations[-1] * 1000:8.1f} ms   upstream requests {server.requests['weather'] - before:4d}   "
+          + " ".join(f"{key}={value}" for key, value in sorted(outcomes.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="median stub latency when healthy")
+    parser.add_argument("--hang", type=float, default=12.0, help="stub latency while hung")
+    parser.add_argument("--reset", type=float, default=2.0, help="breaker reset seconds for the run")
+    args = parser.parse_args()
+
+    server = start_fake_openweather(latency=args.latency, jitter=0.3)
+    url = f"{server.url}/data/2.5/weather"
+    phases = [
+        ("healthy", dict(latency=args.latency, jitter=0.3, error_rate=0.0)),
+        ("hung", dict(latency=args.hang, jitter=0.0, error_rate=0.0)),
+        ("failing (502)", dict(latency=args.latency, jitter=0.3, error_rate=1.0)),
+        ("recovered (probe)", dict(latency=args.latency, jitter=0.3, error_rate=0.0)),
+        ("recovered", dict(latency=args.latency, jitter=0.3, error_rate=0.0)),
+    ]
+    clients = [
+        ("fixed timeout", lambda: fixed_get),
+        ("resilient", lambda: resilient_get(
+            Upstream("bench", default_timeout=FIXED_TIMEOUT, min_timeout=1, reset_seconds=args.reset), hedge=False
+        )),
+    ]
+    for name, make in clients:
+        print(f"{name}:")
+        get = make()
+        for label, settings in phases:
+            if label == "recovered (probe)":
+                time.sleep(args.reset)  # Let an open breaker go half-open
+            vars(server).update(settings)
+            run_phase(label, server, get, url, args.calls, args.concurrency)
+
+    # Heavy tail: most answers quick, a few very slow
+    vars(server).update(latency=args.latency, jitter=1.2, error_rate=0.0)
+    print("heavy-tailed latency (log-normal sigma 1.2):")
+    for label, hedge in (("plain GET", False), ("hedged GET", True)):
+        upstream = Upstream(f"bench_{label}", default_timeout=FIXED_TIMEOUT, min_timeout=1)
+        get = resilient_get(upstream, hedge)
+        run_phase("warm-up", server, get, url, args.calls, args.concurrency)
+        run_phase(label, server, get, url, args.calls * 5, args.concurrency)
+        stats = upstream.stats()
+        print(f"    timeout {stats['timeout_s']}s, hedges {stats['hedges']}, hedge wins {stats['hedge_wins']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Per-turn overhead of the session backends.
+
+A "turn" does what run_complete_pipeline does to the store: load the session,
+peek at its API keys (as the skill functions do), append the user/model
+exchange and, every few turns, fold old history into the summary.
+
+    python benchmarks/bench_session_backends.py [--sessions 200] [--turns 20] [--workers 4]
+
+The sqlite backend is also run from several processes at once to show the
+cost of sharing one database between uvicorn workers.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sessions import SessionStore
+from services.session_backend import create_session_backend
+
+FOLD_EVERY = 8
+REPLY = "Here is a reasonably sized assistant answer that mentions a few facts. " * 4
+
+
+def run_turns(backend_name, db_path, sessions, turns, prefix):
+    store = SessionStore(create_session_backend(backend_name, db_path), max_sessions=10 ** 6)
+    ids = [f"{prefix}-{i}" for i in range(sessions)]
+    for session_id in ids:
+        store.create(session_id)
+        store.set_api_keys(session_id, {"gemini": "k" * 39})
+
+    timings = []
+    for turn in range(turns):
+        for session_id in ids:
+            start = time.perf_counter()
+            session = store.get_or_create(session_id)
+            store.peek(session_id).api_keys.get("gemini")
+            new_turns = [
+                {"role": "user", "parts": [{"text": f"question number {turn}"}]},
+                {"role": "model", "parts": [{"text": REPLY}]},
+            ]
+            store.append_turns(session_id, new_turns)
+            if turn and turn % FOLD_EVERY == 0:
+                store.fold_history(session_id, 0, min(len(session.history), 12), "summary so far")
+            timings.append(time.perf_counter() - start)
+    store.backend.close()
+    return timings
+
+
+def _worker(args):
+    return run_turns(*args)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, timings, wall):
+    print(f"{label:<28} turns={len(timings):>6}  p50={percentile(timings, 50) * 1e6:>8.1f}us  "
+          f"p99={percentile(timings, 99) * 1e6:>8.1f}us  throughput={len(timings) / wall:>9.0f} turns/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sessions.db")
+
+        start = time.perf_counter()
+        timings = run_turns("memory", None, args.sessions, args.turns, "mem")
+        report("memory (1 process)", timings, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        timings = run_turns("sqlite", db_path, args.sessions, args.turns, "single")
+        report("sqlite (1 process)", timings, time.perf_counter() - start)
+
+        jobs = [("sqlite", db_path, args.sessions // args.workers, args.turns, f"w{i}") for i in range(args.workers)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            results = pool.map(_worker, jobs)
+        wall = time.perf_counter() - start
+        report(f"sqlite ({args.workers} processes)", [t for result in results for t in result], wall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Transcription latency and polling cost against the local fake AssemblyAI.
+
+Runs the same burst of jobs two ways:
+  - legacy: the old blocking flow (upload, request, then a status GET every
+    2 s) with one thread per job, and
+  - manager: TranscriptionManager with adaptive polling and batched status
+    checks.
+
+    python benchmarks/bench_stt_jobs.py [--jobs 24] [--keys 3] [--latency 1.0]
+
+Latency is measured from submission to transcript. Status requests count the
+polls the fake server answered, list calls included.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_assemblyai import start_fake_assemblyai
+
+BYTES_PER_SECOND = 32000  # 16 kHz 16-bit audio
+
+
+def clip(i: int) -> bytes:
+    """Utterances of 1 to 8 seconds, so transcripts finish at different times."""
+    return b"\0" * BYTES_PER_SECOND * (1 + i % 8)
+
+
+def legacy_transcribe(base_url: str, api_key: str, audio: bytes) -> str:
+    headers = {"authorization": api_key}
+    upload_url = requests.post(f"{base_url}/upload", headers=headers, data=audio).json()["upload_url"]
+    transcript_id = requests.post(f"{base_url}/transcript", json={"audio_url": upload_url}, headers=headers).json()["id"]
+    while True:
+        status_check = requests.get(f"{base_url}/transcript/{transcript_id}", headers=headers).json()
+        if status_check["status"] == "completed":
+            return status_check["text"]
+        time.sleep(2)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, latencies, server, wall):
+    polls = server.requests["status"] + server.requests["list"]
+    print(f"{label:<8} jobs={len(latencies):>3}  mean={sum(latencies) / len(latencies):5.2f}s  p50={percentile(latencies, 50):5.2f}s  "
+          f"p95={percentile(latencies, 95):5.2f}s  wall={wall:5.2f}s  status requests={polls:>4} "
+          f"({polls / len(latencies):.1f}/job, {server.requests['list']} batched)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    keys = [f"key-{i}" for i in range(args.keys)]
+
+    server = start_fake_assemblyai(latency=args.latency)
+    start = time.perf_counter()
+
+    def timed_legacy(i):
+        t = time.perf_counter()
+        legacy_transcribe(server.base_url, keys[i % len(keys)], clip(i))
+        return time.perf_counter() - t
+
+    with ThreadPoolExecutor(args.jobs) as pool:
+        latencies = list(pool.map(timed_legacy, range(args.jobs)))
+    report("legacy", latencies, server, time.perf_counter() - start)
+    server.shutdown()
+
+    server = start_fake_assemblyai(latency=args.latency)
+    os.environ["ASSEMBLYAI_BASE_URL"] = server.base_url
+    from services.stt import TranscriptionManager
+    manager = TranscriptionManager(max_concurrent=args.jobs, max_per_key=args.jobs)
+
+    async def timed_manager(i):
+        t = time.perf_counter()
+        await manager.transcribe(clip(i), api_key=keys[i % len(keys)])
+        return time.perf_counter() - t
+
+    async def run():
+        return await asyncio.gather(*(timed_manager(i) for i in range(args.jobs)))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    report("manager", latencies, server, time.perf_counter() - start)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
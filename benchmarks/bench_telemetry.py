@@ -0,0 +1,64 @@
+"""
+What a "system" question costs with the old inline get_system_info (import
+platform and psutil, platform.processor(), virtual_memory(), disk_usage()
+on every call) and with the telemetry sampler (services/telemetry.py),
+which reads the latest sample from its ring buffers. Also times one
+background sample and a min/max/avg trend over a full hour of history.
+
+    python benchmarks/bench_telemetry.py [--calls 200] [--interval 5]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.telemetry import TelemetrySampler, FIELDS
+
+
+def inline_system_info() -> dict:
+    import platform
+    import psutil
+    return {
+        "system": platform.system(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "memory_usage": f"{psutil.virtual_memory().percent}%",
+        "disk_usage": f"{psutil.disk_usage('/').percent}%"
+    }
+
+
+def per_call_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=5.0, help="Sample interval for the history size")
+    args = parser.parse_args()
+
+    sampler = TelemetrySampler(interval=args.interval, history_seconds=3600)
+    sampler.sample()
+    print(f"{'operation':<36}{'us/call':>12}")
+    print(f"{'inline get_system_info':<36}{per_call_us(inline_system_info, args.calls):>12.1f}")
+    print(f"{'sampler.sample() (background)':<36}{per_call_us(sampler.sample, args.calls):>12.1f}")
+    print(f"{'sampler.latest() (per question)':<36}{per_call_us(sampler.latest, args.calls * 100):>12.1f}")
+
+    # Fill the whole hour of history and ask for its trend
+    now = time.time()
+    capacity = sampler.series.capacity
+    for i in range(capacity):
+        sampler.series.append(now - (capacity - i) * args.interval, {field: float(i % 100) for field in FIELDS})
+    for seconds in (60, 600, 3600):
+        cost = per_call_us(lambda: sampler.window(seconds), max(1, args.calls // 10))
+        print(f"{f'window({seconds}s), {capacity} samples':<36}{cost:>12.1f}")
+    print(f"\nhistory: {capacity} samples x {len(FIELDS)} fields, {sampler.series.nbytes / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
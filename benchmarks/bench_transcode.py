@@ -0,0 +1,104 @@
+"""
+Throughput of AudioTranscoder on the recorded browser clips in
+benchmarks/samples (Opus in WebM, as MediaRecorder uploads them).
+
+For each worker count, every clip is transcoded --repeat times through one
+AudioTranscoder, all jobs submitted at once. Reports clips/s and seconds of
+audio per second of wall time, plus payload sizes per output format and the
+throughput of the ffmpeg-free WAV path on 48 kHz stereo WAV renditions of
+the same clips.
+
+    FFMPEG_PATH=/usr/bin/ffmpeg python benchmarks/bench_transcode.py [--workers 1,2,4] [--repeat 10]
+
+Worker counts above the number of cores only help while ffmpeg is waiting
+on pipes; CPU-bound decoding stops scaling at the core count.
+"""
+import io
+import os
+import sys
+import glob
+import wave
+import time
+import asyncio
+import argparse
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.transcode import AudioTranscoder, ffmpeg_transcode, wav_transcode, resolve_ffmpeg, FFMPEG_PATH
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default 1,2,4..cores)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    ffmpeg = resolve_ffmpeg(FFMPEG_PATH)
+    if ffmpeg is None:
+        sys.exit("ffmpeg not found; set FFMPEG_PATH")
+    clips = [open(path, "rb").read() for path in sorted(glob.glob(os.path.join(args.samples, "*")))]
+    if not clips:
+        sys.exit(f"No sample clips in {args.samples}")
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(n) for n in args.workers.split(",")]
+    else:
+        worker_counts = sorted({1, 2, 4, cores, cores * 2})
+
+    pcm = [ffmpeg_transcode(ffmpeg, clip, "wav") for clip in clips]
+    audio_seconds = sum((len(wav) - 44) / 32000 for wav in pcm)
+    flac = [ffmpeg_transcode(ffmpeg, clip, "flac") for clip in clips]
+    print(f"{len(clips)} clips, {audio_seconds:.1f} s of audio, {cores} core(s)")
+    print(f"  opus/webm {sum(map(len, clips)):>8} bytes")
+    print(f"  flac 16k  {sum(map(len, flac)):>8} bytes")
+    print(f"  wav 16k   {sum(map(len, pcm)):>8} bytes")
+
+    async def run(transcoder, jobs):
+        return await asyncio.gather(*(transcoder.transcode(job) for job in jobs))
+
+    jobs = clips * args.repeat
+    for output in ("flac", "wav"):
+        for workers in worker_counts:
+            transcoder = AudioTranscoder(ffmpeg, max_workers=workers, output=output)
+            start = time.perf_counter()
+            asyncio.run(run(transcoder, jobs))
+            elapsed = time.perf_counter() - start
+            transcoder.close()
+            print(f"ffmpeg -> {output:<4} workers={workers:<2} {len(jobs) / elapsed:7.1f} clips/s  "
+                  f"{audio_seconds * args.repeat / elapsed:7.1f}x real time")
+
+    # The fallback only handles WAV; feed it what a desktop recorder produces
+    wav48 = [_stereo(ffmpeg_transcode(ffmpeg, clip, "wav", sample_rate=48000)) for clip in clips]
+    print(f"  wav 48k stereo {sum(map(len, wav48)):>8} bytes -> 16k mono {sum(len(wav_transcode(w)) for w in wav48)} bytes")
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for wav in wav48:
+            wav_transcode(wav)
+    elapsed = time.perf_counter() - start
+    print(f"in-process wav 48k stereo -> 16k mono  {len(wav48) * args.repeat / elapsed:7.1f} clips/s  "
+          f"{audio_seconds * args.repeat / elapsed:7.1f}x real time")
+
+
+def _stereo(mono_wav: bytes) -> bytes:
+    with wave.open(io.BytesIO(mono_wav)) as wav:
+        rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(samples, 2).tobytes())
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    main()
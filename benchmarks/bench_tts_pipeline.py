@@ -0,0 +1,91 @@
+"""
+Time to first audio for server-side TTS against the local fake Gemini.
+
+Compares one TTS request for the whole answer (the old generate_audio path)
+with SentenceTTSPipeline, which synthesizes sentences concurrently and
+streams them in order, and the pipeline backed by a TTSAudioCache in a
+temporary directory: once cold (every sentence synthesized and stored) and
+once warm (every sentence read back from disk).
+
+    python benchmarks/bench_tts_pipeline.py [--parallel 3] [--latency 0.4]
+
+"first audio" is when the first PCM bytes are available to send; "done" is
+when the last sentence has been delivered.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gemini import start_fake_gemini
+
+ANSWER = (
+    "Photosynthesis is how plants turn light into food. "
+    "Chlorophyll in the leaves absorbs mostly red and blue light. "
+    "That energy splits water molecules and releases oxygen as a by-product. "
+    "The plant then uses carbon dioxide from the air to build sugars. "
+    "Those sugars fuel growth and are stored as starch for later. "
+    "In short, sunlight, water and air become the plant's food and the oxygen we breathe."
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallel", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--per-char", type=float, default=0.004)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    server = start_fake_gemini(latency=args.latency, per_char=args.per_char)
+    os.environ["GEMINI_API_BASE_URL"] = server.base_url
+    from services.tts import SentenceTTSPipeline, synthesize_stream
+    from services.tts_cache import TTSAudioCache
+    from services.http_pool import iterate_blocking
+
+    async def whole():
+        start = time.perf_counter()
+        first = None
+        total = 0
+        async for audio in iterate_blocking(synthesize_stream, ANSWER, "fake-key"):
+            first = first or time.perf_counter() - start
+            total += len(audio)
+        return first, time.perf_counter() - start, total
+
+    cache = TTSAudioCache(tempfile.mkdtemp(prefix="tts-cache-"))
+
+    async def pipelined(cache=None):
+        start = time.perf_counter()
+        pipeline = SentenceTTSPipeline("fake-key", max_parallel=args.parallel, cache=cache)
+        pipeline.add(ANSWER)
+        pipeline.close()
+        first = None
+        total = 0
+        async for _, _, frame in pipeline.frames():
+            if frame is not None:
+                first = first or time.perf_counter() - start
+                total += len(frame)
+        return first, time.perf_counter() - start, total
+
+    runs = (
+        ("whole answer", whole),
+        (f"pipeline x{args.parallel}", pipelined),
+        ("cache cold", lambda: pipelined(cache)),
+        ("cache warm", lambda: pipelined(cache)),
+    )
+    for label, run in runs:
+        first, done, total = asyncio.run(run())
+        print(f"{label:<14} first audio={first * 1000:7.0f} ms  done={done * 1000:7.0f} ms  "
+              f"audio={total / 48000:5.1f} s")
+    print(f"cache: {cache.stats()}  TTS requests: {server.requests['tts']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Silence trimming and VAD throughput on the recordings in benchmarks/samples.
+
+Each .webm file is decoded to 16 kHz mono PCM with ffmpeg (FFMPEG_PATH, as
+used by services/stt.py), then streamed through AudioRingBuffer and
+StreamingVAD in 20 ms websocket-sized frames. For every file it reports the
+bytes a whole-file upload would send versus the VAD-trimmed WAV utterances,
+and how many times faster than real time the VAD runs.
+
+    FFMPEG_PATH=/usr/bin/ffmpeg python benchmarks/bench_vad.py [--frame-ms 20] [--samples DIR]
+
+With --synthetic, or no ffmpeg, it runs on a synthetic recording (noise,
+speech-like bursts, pauses) instead. A missing samples directory is an
+error rather than a silent switch to synthetic audio.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.audio import AudioRingBuffer, StreamingVAD, pcm_to_wav
+
+SAMPLE_RATE = 16000
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+def decode(path: str, ffmpeg: str) -> np.ndarray:
+    result = subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", path, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"],
+        capture_output=True, check=True,
+    )
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def synthetic(seconds: float = 12.0, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    audio = rng.normal(0, 60, int(seconds * SAMPLE_RATE))
+    t = np.arange(SAMPLE_RATE * 2) / SAMPLE_RATE
+    for start in (1.5, 6.0):
+        burst = 4000 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+        i = int(start * SAMPLE_RATE)
+        audio[i:i + len(burst)] += burst
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+def stream_through_vad(samples: np.ndarray, frame_ms: int):
+    ring = AudioRingBuffer(SAMPLE_RATE * 30)
+    vad = StreamingVAD(sample_rate=SAMPLE_RATE)
+    data = samples.tobytes()
+    step = SAMPLE_RATE * frame_ms // 1000 * 2
+    utterances = []
+    start = time.perf_counter()
+    for offset in range(0, len(data), step):
+        ring.write(data[offset:offset + step])
+        utterances.extend(ring.read(s, e) for s, e in vad.process(ring))
+    tail = vad.flush(ring)
+    if tail:
+        utterances.append(ring.read(*tail))
+    return utterances, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frame-ms", type=int, default=20)
+    parser.add_argument("--samples", default=SAMPLES_DIR)
+    parser.add_argument("--synthetic", action="store_true", help="Benchmark a synthetic recording only")
+    args = parser.parse_args()
+
+    ffmpeg = os.getenv("FFMPEG_PATH", "ffmpeg")
+    recordings = []
+    paths = [] if args.synthetic else sorted(glob.glob(os.path.join(args.samples, "*.webm")))
+    if not paths and not args.synthetic:
+        sys.exit(f"No .webm recordings in {args.samples} (use --synthetic for a generated one)")
+    for path in paths:
+        try:
+            recordings.append((os.path.basename(path)[:8], os.path.getsize(path), decode(path, ffmpeg)))
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Could not decode {path} with {ffmpeg}: {e}")
+            break
+    if not recordings:
+        print(f"Using a synthetic recording{'' if args.synthetic else ' instead of ' + args.samples}")
+        samples = synthetic()
+        recordings.append(("synthetic", len(pcm_to_wav(samples)), samples))
+
+    print(f"{'file':<10} {'audio':>7} {'speech':>7} {'utt':>4} {'webm':>9} {'full wav':>9} {'trimmed':>9} {'saved':>6} {'x realtime':>11}")
+    totals = np.zeros(4)
+    for name, webm_bytes, samples in recordings:
+        utterances, elapsed = stream_through_vad(samples, args.frame_ms)
+        full = len(pcm_to_wav(samples))
+        trimmed = sum(len(pcm_to_wav(u)) for u in utterances)
+        seconds = len(samples) / SAMPLE_RATE
+        speech = sum(len(u) for u in utterances) / SAMPLE_RATE
+        totals += (seconds, speech, full, trimmed)
+        print(f"{name:<10} {seconds:>6.1f}s {speech:>6.1f}s {len(utterances):>4} {webm_bytes:>9} {full:>9} {trimmed:>9} "
+              f"{1 - trimmed / full:>6.0%} {seconds / max(elapsed, 1e-9):>10.0f}x")
+    print(f"{'total':<10} {totals[0]:>6.1f}s {totals[1]:>6.1f}s {'':>4} {'':>9} {int(totals[2]):>9} {int(totals[3]):>9} "
+          f"{1 - totals[3] / totals[2]:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
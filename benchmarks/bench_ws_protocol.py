@@ -0,0 +1,111 @@
+"""
+Bytes on the wire and serialization CPU per turn for each websocket
+protocol: v1 (one JSON frame per event), v2 with JSON batches and v2 with
+MessagePack (when msgpack is installed).
+
+A turn is the event sequence main.py sends for a streamed answer: ack,
+final, sentence chunks, llm_done with key status, audio_end. Frames go
+through a real Starlette WebSocket whose ASGI send serializes them with the
+websockets library (as uvicorn does), so per-frame costs are included;
+socket writes and syscalls, which batching also saves, are not.
+
+    python benchmarks/bench_ws_protocol.py [--turns 2000] [--chunks 4]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.websockets import WebSocket, WebSocketState
+from websockets.frames import Frame, Opcode
+
+from services.protocol import MessageChannel, msgpack
+
+SENTENCES = [
+    "Photosynthesis is how plants turn light into food.",
+    "Chlorophyll in the leaves absorbs mostly red and blue light.",
+    "That energy splits water molecules and releases oxygen.",
+    "The plant then uses carbon dioxide from the air to build sugars.",
+    "Those sugars fuel growth and are stored as starch for later.",
+]
+
+
+class FrameCounter:
+    """ASGI send callable that serializes websocket frames and counts them."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def __call__(self, message: dict):
+        if message.get("text") is not None:
+            frame = Frame(Opcode.TEXT, message["text"].encode())
+        else:
+            frame = Frame(Opcode.BINARY, message["bytes"])
+        self.frames += 1
+        self.bytes += len(frame.serialize(mask=False))
+
+
+def connected_socket(counter: FrameCounter) -> WebSocket:
+    async def receive():
+        return {"type": "websocket.connect"}
+    websocket = WebSocket({"type": "websocket", "path": "/ws", "headers": []}, receive, counter)
+    websocket.client_state = websocket.application_state = WebSocketState.CONNECTED
+    return websocket
+
+
+async def turn(channel: MessageChannel, chunks: int):
+    await channel.send({"type": "ack_transcript"})
+    await channel.send({"type": "final", "text": "how does photosynthesis work"})
+    await asyncio.sleep(0)
+    for index in range(chunks):
+        await channel.send({"type": "llm_chunk", "text": SENTENCES[index % len(SENTENCES)], "index": index,
+                            "persona": "friendly_teacher"})
+        await asyncio.sleep(0)  # The model produces the next chunk
+    await channel.send({
+        "type": "llm_done",
+        "text": " ".join(SENTENCES[i % len(SENTENCES)] for i in range(chunks)),
+        "persona": "friendly_teacher",
+        "message_count": 3,
+        "has_functions": False,
+        "function_used": False,
+        "api_keys_status": {"gemini": True, "openweather": True, "tavily": False},
+    })
+    await channel.send({"type": "audio_end", "source": "browser_tts_fallback", "message": "Using browser voice"})
+    await channel.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=4)
+    args = parser.parse_args()
+
+    variants = [("v1 json", 1, "json"), ("v2 json", 2, "json")]
+    if msgpack is not None:
+        variants.append(("v2 msgpack", 2, "msgpack"))
+    else:
+        print("msgpack not installed; skipping the MessagePack variant")
+
+    async def run(version, encoding):
+        counter = FrameCounter()
+        channel = MessageChannel(connected_socket(counter), version, encoding)
+        start = time.process_time()
+        for _ in range(args.turns):
+            await turn(channel, args.chunks)
+        return counter, time.process_time() - start
+
+    baseline = None
+    for label, version, encoding in variants:
+        socket, cpu = asyncio.run(run(version, encoding))
+        per_turn = socket.bytes / args.turns
+        baseline = baseline or per_turn
+        print(f"{label:<11} {socket.frames / args.turns:5.1f} frames/turn  {per_turn:7.0f} bytes/turn "
+              f"({per_turn / baseline:4.0%})  {cpu / args.turns * 1e6:6.1f} us CPU/turn")
+
+
+if __name__ == "__main__":
+    main()
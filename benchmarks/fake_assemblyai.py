@@ -0,0 +1,164 @@
+"""
+Local stand-in for the AssemblyAI v2 REST API, for exercising services/stt.py
+without network access or billing.
+
+Supports POST /v2/upload, POST /v2/transcript, GET /v2/transcript/{id} and
+GET /v2/transcript?limit=N. A transcript stays "queued" briefly, then
+"processing", and completes after --latency seconds plus --per-audio-second
+for each second of uploaded 16 kHz 16-bit audio. Request counts per endpoint
+are kept in FakeAssemblyAI.requests.
+
+    python benchmarks/fake_assemblyai.py --port 8765
+    ASSEMBLYAI_BASE_URL=http://127.0.0.1:8765/v2 uvicorn main:app
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+BYTES_PER_AUDIO_SECOND = 32000
+
+
+class FakeAssemblyAI(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency: float = 1.0, per_audio_second: float = 0.2, error_rate: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.per_audio_second = per_audio_second
+        self.error_rate = error_rate
+        self.uploads = {}  # upload_url -> size
+        self.transcripts = {}  # id -> (created, ready_at, failed)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients dropping keep-alive connections is expected
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def status(self, transcript_id: str) -> str:
+        created, ready_at, failed = self.transcripts[transcript_id]
+        now = time.monotonic()
+        if now >= ready_at:
+            return "error" if failed else "completed"
+        return "queued" if now - created < 0.2 else "processing"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _authorized(self) -> bool:
+        if self.headers.get("authorization"):
+            return True
+        self._body()
+        self._send(401, {"error": "Authentication error, API token missing/invalid"})
+        return False
+
+    def do_POST(self):
+        server = self.server
+        if not self._authorized():
+            return
+        path = urlsplit(self.path).path
+        if path == "/v2/upload":
+            size = len(self._body())
+            upload_url = f"{server.base_url}/files/{uuid.uuid4().hex}"
+            with server.lock:
+                server.requests["upload"] += 1
+                server.uploads[upload_url] = size
+            self._send(200, {"upload_url": upload_url})
+        elif path == "/v2/transcript":
+            audio_url = json.loads(self._body() or b"{}").get("audio_url")
+            with server.lock:
+                server.requests["transcript"] += 1
+                size = server.uploads.get(audio_url)
+                if size is None:
+                    self._send(400, {"error": "audio_url not found"})
+                    return
+                transcript_id = uuid.uuid4().hex
+                now = time.monotonic()
+                ready_at = now + server.latency + server.per_audio_second * size / BYTES_PER_AUDIO_SECOND
+                server.transcripts[transcript_id] = (now, ready_at, random.random() < server.error_rate)
+            self._send(200, {"id": transcript_id, "status": "queued"})
+        else:
+            self._body()
+            self._send(404, {"error": "not found"})
+
+    def do_GET(self):
+        server = self.server
+        if not self._authorized():
+            return
+        parts = urlsplit(self.path)
+        if parts.path == "/v2/transcript":
+            limit = min(200, int(parse_qs(parts.query).get("limit", ["10"])[0]))
+            with server.lock:
+                server.requests["list"] += 1
+                newest = sorted(server.transcripts, key=lambda t: server.transcripts[t][0], reverse=True)[:limit]
+                items = [{"id": t, "status": server.status(t)} for t in newest]
+            self._send(200, {"transcripts": items, "page_details": {"limit": limit, "result_count": len(items)}})
+        elif parts.path.startswith("/v2/transcript/"):
+            transcript_id = parts.path.rsplit("/", 1)[1]
+            with server.lock:
+                server.requests["status"] += 1
+                if transcript_id not in server.transcripts:
+                    self._send(404, {"error": "transcript not found"})
+                    return
+                status = server.status(transcript_id)
+            payload = {"id": transcript_id, "status": status}
+            if status == "completed":
+                payload["text"] = f"Fake transcript {transcript_id[:6]}."
+            elif status == "error":
+                payload["error"] = "Simulated transcription failure"
+            self._send(200, payload)
+        else:
+            self._send(404, {"error": "not found"})
+
+
+def start_fake_assemblyai(port: int = 0, **options) -> FakeAssemblyAI:
+    """Starts the fake server on a daemon thread; see FakeAssemblyAI.base_url."""
+    server = FakeAssemblyAI(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--per-audio-second", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeAssemblyAI(("127.0.0.1", args.port), latency=args.latency,
+                            per_audio_second=args.per_audio_second, error_rate=args.error_rate)
+    print(f"Fake AssemblyAI listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Local stand-in for the Gemini REST API, for exercising services/tts.py
+and the chat path without network access or billing.
+
+POST /v1beta/models/{model}:generateContent with responseModalities AUDIO
+answers like Gemini TTS: after --latency seconds plus --per-char for each
+character of text, it returns base64 16-bit 24 kHz PCM (a quiet tone
+lasting about --speech-rate characters per second). Text requests get a
+short canned answer; :streamGenerateContent sends it sentence by sentence
+as the JSON array google-generativeai's REST transport reads. --jitter
+spreads every delay log-normally and --error-rate answers that share of
+requests with 503 UNAVAILABLE. Request counts are kept in
+FakeGemini.requests.
+
+    python benchmarks/fake_gemini.py --port 8766
+    GEMINI_API_BASE_URL=http://127.0.0.1:8766/v1beta \
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8766 GEMINI_TRANSPORT=rest uvicorn main:app
+"""
+import json
+import math
+import time
+import random
+import base64
+import struct
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+SAMPLE_RATE = 24000
+# Spoken in the stream as separate chunks, like a model emitting sentences
+CHAT_SENTENCES = (
+    "Here is a short answer from the local Gemini stub.",
+    "It is long enough to be split into a few sentences.",
+    "Each one arrives as its own streamed chunk.",
+)
+
+
+def tone(seconds: float) -> bytes:
+    """A quiet 220 Hz tone, so played-back audio is audible but obviously fake."""
+    period = [int(2000 * math.sin(2 * math.pi * i / (SAMPLE_RATE / 220))) for i in range(SAMPLE_RATE // 220)]
+    samples = (period * (int(seconds * SAMPLE_RATE) // len(period) + 1))[:int(seconds * SAMPLE_RATE)]
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+class FakeGemini(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency: float = 0.4, per_char: float = 0.004, speech_rate: float = 15.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, chunk_delay: float = 0.05):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.per_char = per_char
+        self.speech_rate = speech_rate
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients dropping keep-alive connections is expected
+
+    def wait(self, seconds: float):
+        """Sleeps seconds, spread log-normally (median seconds) when jitter is set."""
+        if seconds > 0:
+            time.sleep(seconds * random.lognormvariate(0.0, self.jitter) if self.jitter else seconds)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict, chunk_size: int = 16384):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for offset in range(0, len(body), chunk_size):
+            self.wfile.write(body[offset:offset + chunk_size])
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not (self.headers.get("x-goog-api-key") or "key=" in self.path):
+            self._send(403, {"error": {"code": 403, "message": "API key missing"}})
+            return
+        path = urlsplit(self.path).path
+        stream = path.endswith(":streamGenerateContent")
+        if not (stream or path.endswith(":generateContent")):
+            self._send(404, {"error": {"code": 404, "message": "not found"}})
+            return
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.requests["errors"] += 1
+            server.wait(server.latency)
+            self._send(503, {"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+            return
+
+        text = " ".join(part.get("text", "") for content in body.get("contents", ()) for part in content.get("parts", ()))
+        if "AUDIO" in body.get("generationConfig", {}).get("responseModalities", ()):
+            with server.lock:
+                server.requests["tts"] += 1
+            server.wait(server.latency + server.per_char * len(text))
+            audio = tone(max(0.2, len(text) / server.speech_rate))
+            self._send(200, {"candidates": [{"content": {"parts": [{"inlineData": {
+                "mimeType": f"audio/L16;codec=pcm;rate={SAMPLE_RATE}",
+                "data": base64.b64encode(audio).decode()
+            }}], "role": "model"}, "finishReason": "STOP"}]})
+            return
+
+        with server.lock:
+            server.requests["stream" if stream else "generate"] += 1
+        server.wait(server.latency)
+        if not stream:
+            self._send(200, _text_response(f"Echo: {text[-200:]}"))
+            return
+
+        # Chunked JSON array, one element per sentence, flushed as produced
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, sentence in enumerate(CHAT_SENTENCES):
+            if index:
+                server.wait(server.chunk_delay)
+            last = index == len(CHAT_SENTENCES) - 1
+            piece = ("[" if index == 0 else ",") + json.dumps(_text_response(sentence + " ", last)) + ("]" if last else "")
+            data = piece.encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def _text_response(text: str, last: bool = True) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if last:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+def start_fake_gemini(port: int = 0, **options) -> FakeGemini:
+    """Starts the fake server on a daemon thread; see FakeGemini.base_url."""
+    server = FakeGemini(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--per-char", type=float, default=0.004)
+    parser.add_argument("--speech-rate", type=float, default=15.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    server = FakeGemini(("127.0.0.1", args.port), latency=args.latency, per_char=args.per_char,
+                        speech_rate=args.speech_rate, jitter=args.jitter, error_rate=args.error_rate,
+                        chunk_delay=args.chunk_delay)
+    print(f"Fake Gemini listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Local stand-ins for OpenWeatherMap and Tavily, plus a launcher that starts
+them together with the fake Gemini server, for load testing main:app
+without network access or billing.
+
+GET /data/2.5/weather?q=<city>&appid=<key> (or lat=<lat>&lon=<lon>) answers
+like OpenWeatherMap's current weather endpoint; POST /search answers like
+Tavily's search API. Every stub waits --latency seconds (median), spread by
+--jitter (sigma of a log-normal; 0 means fixed), and fails with a 5xx for
+--error-rate of the requests. Request counts are kept in server.requests.
+
+    python benchmarks/fake_upstreams.py --latency 0.2 --jitter 0.5 --error-rate 0.01
+    # then start the app with the environment variables it prints
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def sample_delay(latency: float, jitter: float = 0.0) -> float:
+    """latency as the median of a log-normal with sigma jitter (fixed when 0)."""
+    if latency <= 0:
+        return 0.0
+    return latency * random.lognormvariate(0.0, jitter) if jitter else latency
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, handler, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0):
+        super().__init__(address, handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        pass  # Clients dropping keep-alive connections is expected
+
+    def count(self, name: str):
+        with self.lock:
+            self.requests[name] += 1
+
+    def wait(self):
+        time.sleep(sample_delay(self.latency, self.jitter))
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+
+
+class _WeatherHandler(_JSONHandler):
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path != "/data/2.5/weather":
+            self._send(404, {"cod": "404", "message": "not found"})
+            return
+        server.count("weather")
+        server.wait()
+        if not query.get("appid"):
+            self._send(401, {"cod": 401, "message": "Invalid API key."})
+            return
+        if server.should_fail():
+            self._send(502, {"cod": "502", "message": "upstream failure"})
+            return
+        if "lat" in query and "lon" in query:
+            city, country = f"{float(query['lat']):.2f},{float(query['lon']):.2f}", ""
+        else:
+            city, _, country = query.get("q", "London").partition(",")
+        seed = sum(map(ord, city.lower()))
+        now = int(time.time())
+        self._send(200, {
+            "name": city.strip().title(),
+            "sys": {"country": (country.strip() or "XX").upper(), "sunrise": now - 21600, "sunset": now + 21600},
+            "main": {"temp": 5 + seed % 25, "feels_like": 4 + seed % 25, "humidity": 40 + seed % 50,
+                     "pressure": 1000 + seed % 30},
+            "weather": [{"main": "Clouds", "description": "scattered clouds"}],
+            "wind": {"speed": round(1 + seed % 9 * 0.7, 1), "deg": seed % 360},
+            "visibility": 10000,
+        })
+
+
+class _TavilyHandler(_JSONHandler):
+    def do_POST(self):
+        server = self.server
+        body = self._body()
+        if urlsplit(self.path).path != "/search":
+            self._send(404, {"detail": "not found"})
+            return
+        server.count("search")
+        server.wait()
+        if not body.get("api_key"):
+            self._send(401, {"detail": {"error": "Unauthorized: missing or invalid API key."}})
+            return
+        if server.should_fail():
+            self._send(500, {"detail": {"error": "Internal server error"}})
+            return
+        query = body.get("query", "")
+        results = [{
+            "title": f"Result {i + 1} for {query}",
+            "url": f"https://example.com/{i + 1}",
+            "content": f"Stub content about {query}. " * 3,
+            "score": round(0.9 - i * 0.1, 2),
+        } for i in range(int(body.get("max_results") or 3))]
+        self._send(200, {"query": query, "answer": f"A short stub answer about {query}.", "results": results})
+
+
+def start_fake_openweather(port: int = 0, **options) -> FakeUpstream:
+    """Starts the OpenWeatherMap stub on a daemon thread; base URL is server.url + "/data/2.5"."""
+    server = FakeUpstream(("127.0.0.1", port), _WeatherHandler, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fake_tavily(port: int = 0, **options) -> FakeUpstream:
+    """Starts the Tavily stub on a daemon thread; base URL is server.url."""
+    server = FakeUpstream(("127.0.0.1", port), _TavilyHandler, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_all(latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+              gemini_latency: float = None, ports=(0, 0, 0)) -> dict:
+    """
+    Starts the Gemini, OpenWeatherMap and Tavily stubs and returns
+    {"servers": {...}, "env": {...}} where env points main.py at them.
+    """
+    from fake_gemini import start_fake_gemini
+
+    gemini = start_fake_gemini(ports[0], latency=latency if gemini_latency is None else gemini_latency,
+                               jitter=jitter, error_rate=error_rate)
+    weather = start_fake_openweather(ports[1], latency=latency, jitter=jitter, error_rate=error_rate)
+    tavily = start_fake_tavily(ports[2], latency=latency, jitter=jitter, error_rate=error_rate)
+    env = {
+        "GEMINI_API_ENDPOINT": gemini.base_url.rsplit("/", 1)[0],
+        "GEMINI_TRANSPORT": "rest",
+        "GEMINI_API_BASE_URL": gemini.base_url,
+        "OPENWEATHER_BASE_URL": f"{weather.url}/data/2.5",
+        "TAVILY_BASE_URL": tavily.url,
+        "GEMINI_API_KEY": "stub-gemini-key",
+        "OPENWEATHER_API_KEY": "stub-openweather-key",
+        "TAVILY_API_KEY": "stub-tavily-key",
+    }
+    return {"servers": {"gemini": gemini, "openweather": weather, "tavily": tavily}, "env": env}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--ports", default="8766,8767,8768", help="gemini,openweather,tavily")
+    args = parser.parse_args()
+    stubs = start_all(args.latency, args.jitter, args.error_rate, ports=[int(p) for p in args.ports.split(",")])
+    for name, value in stubs["env"].items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
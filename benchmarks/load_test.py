@@ -0,0 +1,305 @@
+"""
+End-to-end load test: starts main:app under uvicorn next to local stubs for
+Gemini, OpenWeatherMap and Tavily (fake_gemini.py, fake_upstreams.py), then
+runs N concurrent conversations, each GET /session followed by a websocket
+on /ws/{session_id} that replays utterances from a transcript corpus as
+user_transcript messages.
+
+A turn is timed from sending the transcript to audio_end (or error), and
+the first response (first llm_chunk, or llm_response for skills) is timed
+separately. Reports turns/s and p50/p95/p99 per intent for every
+concurrency level given. Turns the app answered with a fallback (an error
+reply from the model, or browser speech after server TTS failed) complete
+but are also counted as degraded. With --partials, each utterance is first
+sent word by word as partial_transcript messages, as the browser recognizer
+would while the user speaks, and the final transcript follows after
+--endpoint-delay (the silence the recognizer waits for); the app's
+speculative prefetch hit rate and latency saved are reported.
+
+Sessions and turns the app refuses (GET /session 429/503, an "overloaded"
+message) are retried after the delay it asks for and counted as refused.
+All conversations come from one address back to back, so the app is
+started with per-IP and per-session bursts large enough not to throttle
+the test itself; set ADMISSION_* in the environment to test its limits.
+
+    python benchmarks/load_test.py --sessions 1,8,32 --turns 10
+    python benchmarks/load_test.py --latency 0.3 --jitter 0.6 --error-rate 0.02 --server-tts
+    python benchmarks/load_test.py --partials 0.2   # one interim result per word every 0.2 s
+    python benchmarks/load_test.py --url http://127.0.0.1:8000   # an app already running
+
+The bundled corpus (benchmarks/corpus.jsonl) has one {"intent", "text"}
+object per line. Any JSON-lines file with "text" (or "title", as in a
+backlog export) works; lines without "intent" are reported as "unlabeled".
+Repeated weather and search queries hit the app's caches after the first
+turn, as they would in production. The stub is reached over
+google-generativeai's REST transport, which reads a streamed answer in full
+before yielding it, so for chat the first response arrives with the last
+chunk; the default gRPC transport streams.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+import httpx
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import start_all
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.jsonl")
+
+
+def load_corpus(path: str) -> list:
+    """(intent, text) pairs from a JSON-lines file."""
+    utterances = []
+    with open(path, encoding="utf-8") as corpus:
+        for line in corpus:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            text = (entry.get("text") or entry.get("title") or "").strip()
+            if text:
+                utterances.append((entry.get("intent", "unlabeled"), text[:500]))
+    return utterances
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(env: dict, workers: int, verbose: bool):
+    """Launches uvicorn main:app on a free port; returns (process, base URL)."""
+    port = free_port()
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=output, stderr=output
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_healthy(base_url: str, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"App exited with code {process.returncode}; rerun with --verbose")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"App at {base_url} did not become healthy within {timeout:.0f} s")
+
+
+class Results:
+    def __init__(self):
+        self.turns = defaultdict(list)   # intent -> seconds to audio_end
+        self.first = defaultdict(list)   # intent -> seconds to first response
+        self.errors = defaultdict(int)   # intent -> error / timeout count
+        self.degraded = defaultdict(int) # intent -> turns completed with a fallback
+        self.refused = defaultdict(int)  # intent (or "session") -> refusals by admission control
+        self.audio_bytes = 0
+        self.failed_sessions = 0
+
+
+def _events(message):
+    """Event dicts in a text frame (protocol 1: one object, protocol 2: an array)."""
+    data = json.loads(message)
+    return data if isinstance(data, list) else [data]
+
+
+def _is_fallback(event: dict, server_tts: bool) -> bool:
+    if event.get("type") in ("llm_response", "llm_done"):
+        return bool(event.get("error"))
+    return server_tts and event.get("type") == "audio_end" and event.get("source") == "browser_tts_fallback"
+
+
+async def conversation(client, base_url, ws_url, utterances, turns, args, results):
+    response = await client.get(f"{base_url}/session")
+    for _ in range(5):
+        if response.status_code not in (429, 503):
+            break
+        results.refused["session"] += 1
+        await asyncio.sleep(float(response.headers.get("Retry-After") or 1))
+        response = await client.get(f"{base_url}/session")
+    if response.status_code != 200:
+        results.failed_sessions += 1
+        return
+    session_id = response.json()["session_id"]
+    url = f"{ws_url}/ws/{session_id}?protocol={args.protocol}"
+    async with websockets.connect(url, max_size=None, open_timeout=30) as websocket:
+        for intent, text in utterances[:turns]:
+            if args.partials:
+                words = text.split()
+                for count in range(1, len(words) + 1):
+                    await websocket.send(json.dumps({"type": "partial_transcript", "text": " ".join(words[:count])}))
+                    await asyncio.sleep(args.partials if count < len(words) else args.endpoint_delay)
+            final = json.dumps({
+                "type": "user_transcript", "text": text, "stream": True,
+                "tts": "server" if args.server_tts else "browser"
+            })
+            await websocket.send(final)
+            start = time.perf_counter()
+            first = None
+            degraded = False
+            try:
+                async with asyncio.timeout(args.turn_timeout):
+                    while True:
+                        message = await websocket.recv()
+                        if isinstance(message, bytes):
+                            results.audio_bytes += len(message)
+                            continue
+                        events = _events(message)
+                        kinds = [event.get("type") for event in events]
+                        degraded = degraded or any(_is_fallback(event, args.server_tts) for event in events)
+                        if "overloaded" in kinds:
+                            # Refused, not queued: wait as asked and send it again
+                            results.refused[intent] += 1
+                            await asyncio.sleep(events[kinds.index("overloaded")].get("retry_after") or 1)
+                            await websocket.send(final)
+                            continue
+                        if first is None and ("llm_chunk" in kinds or "llm_response" in kinds):
+                            first = time.perf_counter() - start
+                        if "error" in kinds:
+                            results.errors[intent] += 1
+                            break
+                        if "audio_end" in kinds:
+                            results.turns[intent].append(time.perf_counter() - start)
+                            if first is not None:
+                                results.first[intent].append(first)
+                            results.degraded[intent] += degraded
+                            break
+            except TimeoutError:
+                results.errors[intent] += 1
+                return  # The answer may still arrive; don't mistake it for the next turn's
+            if args.think_time:
+                await asyncio.sleep(random.uniform(0, 2 * args.think_time))
+
+
+async def run_level(base_url, corpus, sessions, args) -> tuple:
+    ws_url = "ws" + base_url[len("http"):]
+    results = Results()
+    limits = httpx.Limits(max_connections=sessions, max_keepalive_connections=sessions)
+
+    async def one(index):
+        # Each session walks the corpus from its own offset, so intents interleave
+        offset = (index * 7) % len(corpus)
+        utterances = [corpus[(offset + i) % len(corpus)] for i in range(args.turns)]
+        try:
+            await conversation(client, base_url, ws_url, utterances, args.turns, args, results)
+        except (OSError, websockets.WebSocketException, httpx.HTTPError):
+            results.failed_sessions += 1
+
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(sessions)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+def report(sessions, results, wall):
+    completed = sum(len(latencies) for latencies in results.turns.values())
+    errors = sum(results.errors.values())
+    print(f"\n{sessions} concurrent session(s): {completed} turns in {wall:.1f} s = {completed / wall:.1f} turns/s, "
+          f"{errors} errors, {sum(results.degraded.values())} degraded, {sum(results.refused.values())} refused, "
+          f"{results.failed_sessions} failed sessions")
+    print(f"  {'intent':<10} {'turns':>5} {'err':>4} {'degr':>4}   {'p50':>6} {'p95':>6} {'p99':>6}   "
+          f"{'first p50':>9} {'first p95':>9}")
+    for intent in sorted(set(results.turns) | set(results.errors)):
+        latencies, first = results.turns[intent], results.first[intent]
+        if latencies:
+            timing = " ".join(f"{percentile(latencies, pct):6.3f}" for pct in (50, 95, 99))
+        else:
+            timing = f"{'-':>6} {'-':>6} {'-':>6}"
+        if first:
+            first_timing = f"{percentile(first, 50):9.3f} {percentile(first, 95):9.3f}"
+        else:
+            first_timing = f"{'-':>9} {'-':>9}"
+        print(f"  {intent:<10} {len(latencies):>5} {results.errors[intent]:>4} {results.degraded[intent]:>4}   {timing}   {first_timing}")
+    if results.audio_bytes:
+        print(f"  server TTS audio: {results.audio_bytes / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=12, help="turns per conversation")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--protocol", type=int, default=2, choices=(1, 2))
+    parser.add_argument("--server-tts", action="store_true", help="ask for server-side speech (fake Gemini TTS)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns, seconds")
+    parser.add_argument("--partials", type=float, default=0.0,
+                        help="send interim transcripts word by word, this many seconds apart, before each final one")
+    parser.add_argument("--endpoint-delay", type=float, default=0.8, help="with --partials, seconds from the last word to the final")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="median stub latency, seconds")
+    parser.add_argument("--gemini-latency", type=float, default=None, help="median Gemini stub latency (default --latency)")
+    parser.add_argument("--jitter", type=float, default=0.3, help="log-normal sigma of stub latency (0 = fixed)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub requests that fail")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--url", default=None, help="benchmark an app that is already running instead")
+    parser.add_argument("--verbose", action="store_true", help="show the app's output")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No utterances in {args.corpus}")
+
+    process = None
+    stubs = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        stubs = start_all(args.latency, args.jitter, args.error_rate, gemini_latency=args.gemini_latency)
+        scratch = tempfile.mkdtemp(prefix="voice-load-")
+        env = dict(os.environ, **stubs["env"], TTS_CACHE_DIR=os.path.join(scratch, "tts_cache"),
+                   UPLOAD_DIR=os.path.join(scratch, "uploads"))
+        env.setdefault("ADMISSION_IP_BURST", str(2 * max(int(n) for n in args.sessions.split(","))))
+        env.setdefault("ADMISSION_TURN_BURST", str(args.turns + 1))
+        process, base_url = start_app(env, args.workers, args.verbose)
+
+    try:
+        wait_healthy(base_url, process)
+        print(f"{len(corpus)} utterances from {args.corpus}; app at {base_url}, protocol {args.protocol}, "
+              f"{'server' if args.server_tts else 'browser'} TTS")
+        if stubs:
+            print(f"stubs: latency {args.latency}s (gemini {args.gemini_latency or args.latency}s), "
+                  f"jitter {args.jitter}, error rate {args.error_rate:.1%}")
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            results, wall = asyncio.run(run_level(base_url, corpus, sessions, args))
+            report(sessions, results, wall)
+        if args.partials:
+            print(f"\nspeculation: {httpx.get(f'{base_url}/health', timeout=10).json().get('speculation')}")
+        if stubs:
+            counts = {name: dict(server.requests) for name, server in stubs["servers"].items()}
+            print(f"\nstub requests: {counts}")
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,34 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-import os, logging, json, base64, uuid, asyncio
-import requests
+import os, sys, logging, json, base64, uuid, asyncio, itertools, time, contextlib, re, math, functools, platform
 from datetime import datetime, timedelta
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.http_pool import run_blocking, iterate_blocking, get_pool_stats, close_http_pool
+from services.resilience import Upstream, UpstreamUnavailable, get_upstream_stats
+from services.admission import AdmissionController, Decision, client_address
+from services.telemetry import TelemetrySampler
+from services.sentences import SentenceChunker
+from services.cache import TTLCache
+from services.intents import IntentRouter
+from services.gazetteer import Gazetteer
+from services.speculation import SpeculativeExecutor, get_speculation_stats
+from services.sessions import SessionStore, SessionStoreFull
+from services.session_backend import create_session_backend
+from services.context import ContextWindow, turn_text
+from services.llm_pool import GeminiClientPool
+from services.audio import AudioRingBuffer, StreamingVAD, pcm_to_wav, record_ingest, get_ingest_stats
+from services.stt import TranscriptionManager, TranscriptionError
+from services.spool import UploadSpool, SpoolQuotaExceeded
+from services.transcode import AudioTranscoder
+from services.protocol import MessageChannel, negotiate, get_protocol_stats
+from services.tts import (
+    SentenceTTSPipeline, TTS_SAMPLE_RATE, GEMINI_TTS_MODEL, GEMINI_TTS_VOICE,
+    synthesize_stream, speech_sentences, record_tts, get_tts_stats
+)
+from services.tts_cache import TTSAudioCache
+from services.metrics import Counter, Gauge, Histogram, StatsCollector, SIZE_BUCKETS, render_metrics
 
 logging.basicConfig(level=logging.INFO)
 app = FastAPI(title="Enhanced Voice AI Assistant", version="2.0.0")
@@ -24,30 +47,200 @@ STATIC_DIR = os.path.join(BASE_DIR, "static")
 os.makedirs(STATIC_DIR, exist_ok=True)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
-# Global storage with API key management
-chat_histories = {}
-session_personas = {}
-session_metadata = {}
-session_api_keys = {}  # NEW: Store API keys per session
+# Global session storage: one record per session (history, persona,
+# metadata and API keys), bounded and swept for idle sessions.
+# SESSION_BACKEND=sqlite shares sessions between uvicorn workers on one host.
+session_store = SessionStore(
+    create_session_backend(
+        os.getenv("SESSION_BACKEND", "memory"),
+        path=os.getenv("SESSION_DB_PATH", os.path.join(BASE_DIR, "sessions.db"))
+    ),
+    max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")),
+    idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "1800")),
+    sweep_interval=float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+)
+
+# API keys a session can configure, in the order greetings list them
+API_KEY_NAMES = ["gemini", "openweather", "tavily", "assemblyai"]
 
 # Default API keys (fallback)
 DEFAULT_API_KEYS = {
     "gemini": os.getenv("GEMINI_API_KEY", ""),
     "openweather": os.getenv("OPENWEATHER_API_KEY", ""),
-    "tavily": os.getenv("TAVILY_API_KEY", "")
+    "tavily": os.getenv("TAVILY_API_KEY", ""),
+    "assemblyai": os.getenv("ASSEMBLYAI_API_KEY", "")
+}
+
+# Gemini generation settings shared by the blocking and streaming paths
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.8,
+    "max_output_tokens": 2048,
+}
+
+# History sent to Gemini: persona prompt + greeting, a rolling summary of
+# older turns and a recent window kept verbatim.
+context_window = ContextWindow(
+    recent_turns=int(os.getenv("CONTEXT_RECENT_TURNS", "12")),
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "4000")),
+    fold_threshold=int(os.getenv("CONTEXT_FOLD_THRESHOLD", "8")),
+    summary_max_chars=int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+)
+
+# One isolated Gemini client per distinct API key, shared across sessions.
+# GEMINI_API_ENDPOINT / GEMINI_TRANSPORT point it elsewhere, e.g. at the
+# local stub in benchmarks/ (which needs transport "rest").
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
+gemini_pool = GeminiClientPool(
+    max_clients=int(os.getenv("GEMINI_POOL_MAX_CLIENTS", "256")),
+    max_idle=float(os.getenv("GEMINI_POOL_MAX_IDLE", "1800")),
+    client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None,
+    transport=os.getenv("GEMINI_TRANSPORT") or None
+)
+
+# Admission control (ADMISSION_* env vars): new sessions per client IP,
+# turns per session and turns in flight across the whole worker
+admission = AdmissionController()
+OVERLOADED_MESSAGES = {
+    "rate_limited": "You're going a little fast for me. Give me a moment before the next request.",
+    "overloaded": "I'm handling a lot of conversations right now. Please try again in a few seconds.",
+}
+
+# Binary audio over the websocket (16-bit mono PCM): per-session ring buffer
+# size and the voice-activity settings used to cut utterances out of it
+AUDIO_BUFFER_SECONDS = float(os.getenv("AUDIO_BUFFER_SECONDS", "30"))
+AUDIO_MAX_UTTERANCE_SECONDS = float(os.getenv("AUDIO_MAX_UTTERANCE_SECONDS", "15"))
+AUDIO_END_SILENCE_MS = int(os.getenv("AUDIO_END_SILENCE_MS", "700"))
+# Utterances waiting for STT per websocket; each holds an admitted turn
+AUDIO_MAX_QUEUED_UTTERANCES = int(os.getenv("AUDIO_MAX_QUEUED_UTTERANCES", "2"))
+
+# AssemblyAI jobs for websocket audio; limits and polling come from STT_* env vars
+stt_manager = TranscriptionManager()
+
+# Turn instrumentation, exported at /metrics. Stages: intent, llm,
+# llm_first_chunk, tts (waiting for server speech to finish), transcode,
+# stt and the whole turn; skills get their own histogram.
+STAGE_SECONDS = Histogram("voice_stage_seconds", "Time spent in each stage of a turn", ["stage"])
+SKILL_SECONDS = Histogram("voice_skill_seconds", "Skill handler time, upstream calls included", ["skill"])
+SKILL_FALLBACKS = Counter("voice_skill_fallbacks_total", "Skill replies replaced by the fallback", ["skill", "reason"])
+TURNS = Counter("voice_turns_total", "Turns by intent and outcome (ok, error, cancelled)", ["intent", "outcome"])
+GEMINI_CALLS = Counter("voice_gemini_calls_total", "Gemini SDK calls by kind and status", ["call", "status"])
+HISTORY_MESSAGES = Histogram(
+    "voice_history_messages", "Messages in a session's history and in the request sent to Gemini", ["kind"],
+    buckets=SIZE_BUCKETS
+)
+ACTIVE_WEBSOCKETS = Gauge("voice_active_websockets", "Open websocket connections in this worker")
+
+# Gemini calls run behind a breaker per API key and give up after a timeout
+# taken from their latency (streams: the wait for the first chunk). The SDK
+# call itself cannot be interrupted; it finishes on its worker thread.
+gemini_upstream = Upstream("gemini", default_timeout=30, min_timeout=5)
+gemini_stream_upstream = Upstream("gemini_stream", default_timeout=30, min_timeout=5)
+
+@contextlib.contextmanager
+def gemini_call(kind: str, api_key: str):
+    """
+    Counts one Gemini SDK call by outcome: ok, the HTTP status of the error
+    or its exception name. Yields the breaker attempt for api_key.
+    """
+    upstream = gemini_stream_upstream if kind == "stream" else gemini_upstream
+    try:
+        with upstream.attempt(api_key) as attempt:
+            yield attempt
+    except Exception as e:
+        code = getattr(e, "code", None)
+        GEMINI_CALLS.inc(kind, str(code) if isinstance(code, int) else type(e).__name__)
+        raise
+    GEMINI_CALLS.inc(kind, "ok")
+
+# Audio is normalized to 16 kHz mono before upload (FFMPEG_PATH, TRANSCODE_* env vars)
+transcoder = AudioTranscoder()
+
+# Uploaded recordings, streamed to disk and deleted after transcription or
+# once UPLOAD_RETENTION_SECONDS pass
+upload_spool = UploadSpool(
+    os.getenv("UPLOAD_DIR", os.path.join(BASE_DIR, "uploads")),
+    max_bytes=int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(1024 ** 3))),
+    session_max_bytes=int(os.getenv("UPLOAD_SESSION_MAX_BYTES", str(50 * 1024 ** 2))),
+    retention=float(os.getenv("UPLOAD_RETENTION_SECONDS", "3600")),
+    gc_interval=float(os.getenv("UPLOAD_GC_INTERVAL", "60"))
+)
+UPLOAD_SUFFIXES = {
+    "audio/webm": ".webm",
+    "audio/ogg": ".ogg",
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+}
+
+# Synthesized sentences on disk, shared by sessions, workers and restarts
+tts_cache = TTSAudioCache(
+    os.getenv("TTS_CACHE_DIR", os.path.join(BASE_DIR, "tts_cache")),
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    sample_rate=TTS_SAMPLE_RATE
+)
+
+# Enhanced persona prompts
+PERSONA_PROMPTS = {
+    "friendly_teacher": """You are Sarah, a warm and patient teacher with access to real-time information including weather, news, web search, time/date, and system data. Use these tools to provide accurate, educational responses.""",
+    "tech_support": """You are Alex, a professional tech support specialist with access to system information, web search, weather data, and news to provide comprehensive technical assistance.""",
+    "storyteller": """You are Morgan, an imaginative storyteller who can incorporate real-world data from weather, news, and search to create engaging, contextual narratives.""",
+    "default": """You are Jamie, a helpful AI assistant with access to comprehensive real-time information including weather forecasts, news updates, web search, system monitoring, and time/date services."""
 }
 
+# Fixed replies, pre-rendered into the TTS cache by warm-tts-cache
+CHAT_FALLBACK_REPLY = "I'm here to help! You can ask me about weather, news, web search, time, or system info."
+NO_GEMINI_KEY_REPLY = "I'm here to help! Configure your Gemini API key in settings for enhanced conversational abilities, or ask me about time, system info, weather, news, or search."
+LLM_ERROR_REPLY = "I'm experiencing some technical difficulties. Please check your API key configuration in settings."
+
+
+def build_greeting(persona: str, configured_keys) -> str:
+    """Opening line for a new conversation, listing the configured API keys"""
+    configured_keys = [key for key in API_KEY_NAMES if key in configured_keys]
+    if configured_keys:
+        features_text = ", ".join(configured_keys).replace("_", " ").title()
+        return f"Hello! I'm your {persona.replace('_', ' ')} assistant with {features_text} capabilities configured. What can I help you with?"
+    return f"Hello! I'm your {persona.replace('_', ' ')} assistant. I can help with time/date and system info. Configure API keys in settings for weather, news, and web search!"
+
 # ---- ENHANCED SKILL FUNCTIONS WITH DYNAMIC API KEYS ----
 
 def get_session_api_keys(session_id: str) -> dict:
     """Get API keys for a session, with fallback to defaults"""
-    session_keys = session_api_keys.get(session_id, {})
+    session = session_store.peek(session_id, history=False)
+    session_keys = session.api_keys if session else {}
     return {
         "gemini": session_keys.get("gemini") or DEFAULT_API_KEYS["gemini"],
         "openweather": session_keys.get("openweather") or DEFAULT_API_KEYS["openweather"],
-        "tavily": session_keys.get("tavily") or DEFAULT_API_KEYS["tavily"]
+        "tavily": session_keys.get("tavily") or DEFAULT_API_KEYS["tavily"],
+        "assemblyai": session_keys.get("assemblyai") or DEFAULT_API_KEYS["assemblyai"]
     }
 
+async def get_session_api_keys_async(session_id: str) -> dict:
+    return await session_store.run(get_session_api_keys, session_id)
+
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org/data/2.5").rstrip("/")
+
+# Breaker per API key and an adaptive timeout; a lookup slower than usual
+# is hedged with a second GET. While the breaker is open, weather answers
+# from the demo data without waiting on the network.
+weather_upstream = Upstream("openweather", default_timeout=10, min_timeout=2)
+
+# Weather lookups are shared across sessions: the key is the normalized
+# location plus units, so "tokyo" and "Tokyo,JP" land on the same entry.
+weather_cache = TTLCache(
+    "weather",
+    maxsize=int(os.getenv("WEATHER_CACHE_MAXSIZE", "512")),
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL", "1800"))
+)
+
+# Offline city index (GAZETTEER_PATH: the bundled list, or a GeoNames
+# cities*.txt export), loaded on first use. Known places are queried by
+# coordinates, so "NYC" and "New York, US" share one cache entry and an
+# ambiguous name never round-trips to a 404.
+gazetteer = Gazetteer(os.getenv("GAZETTEER_PATH", os.path.join(BASE_DIR, "data", "cities.tsv")))
+
 def get_current_weather_enhanced(location: str, session_id: str, units: str = "metric") -> dict:
     """Enhanced weather function with session-specific API keys"""
     try:
@@ -55,67 +248,82 @@ def get_current_weather_enhanced(location: str, session_id: str, units: str = "m
         openweather_key = api_keys["openweather"]
         
         if openweather_key and openweather_key != "your openweather api key here":
-            # Add country codes for better accuracy
-            location_mapping = {
-                "tokyo": "Tokyo,JP", "london": "London,GB", "paris": "Paris,FR",
-                "new york": "New York,US", "mumbai": "Mumbai,IN", "delhi": "Delhi,IN"
-            }
-            
-            if "," not in location:
-                location = location_mapping.get(location.lower(), location)
-            
-            # Current weather API call
-            current_url = "http://api.openweathermap.org/data/2.5/weather"
-            current_params = {
-                'q': location,
-                'appid': openweather_key,
-                'units': units
-            }
-            
-            logging.info(f"Weather API call for {location} with session key")
-            response = requests.get(current_url, params=current_params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Generate weather alerts and recommendations
-                alerts = generate_weather_alerts(data)
-                recommendations = generate_weather_recommendations(data)
-                
-                return {
-                    "status": "success",
-                    "source": "OpenWeatherMap API (User Key)",
-                    "current": {
-                        "location": f"{data['name']}, {data['sys']['country']}",
-                        "temperature": f"{data['main']['temp']:.1f}°{'C' if units == 'metric' else 'F'}",
-                        "feels_like": f"{data['main']['feels_like']:.1f}°{'C' if units == 'metric' else 'F'}",
-                        "condition": data['weather'][0]['description'].title(),
-                        "humidity": f"{data['main']['humidity']}%",
-                        "pressure": f"{data['main']['pressure']} hPa",
-                        "wind_speed": f"{data['wind']['speed']} {'m/s' if units == 'metric' else 'mph'}",
-                        "wind_direction": get_wind_direction(data['wind'].get('deg', 0)),
-                        "visibility": f"{data.get('visibility', 10000)/1000:.1f} km",
-                        "sunrise": datetime.fromtimestamp(data['sys']['sunrise']).strftime("%H:%M"),
-                        "sunset": datetime.fromtimestamp(data['sys']['sunset']).strftime("%H:%M")
-                    },
-                    "alerts": alerts,
-                    "recommendations": recommendations,
-                    "retrieved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                }
-            elif response.status_code == 401:
-                return {"error": "Invalid OpenWeather API key. Please check your API key in settings."}
-            elif response.status_code == 404:
-                return {"error": f"City '{location}' not found. Try including country code (e.g., 'Tokyo,JP')"}
+            place = gazetteer.lookup(location)
+            if place is not None:
+                cache_key = (round(place.lat, 2), round(place.lon, 2), units)
+                location = place.label
             else:
-                return {"error": f"Weather service error: {response.status_code}"}
+                location = location.strip()
+                cache_key = (location.lower().replace(" ", ""), units)
+            # Unknown cities are remembered too, so a misheard name costs one request
+            return weather_cache.get_or_load(
+                cache_key,
+                lambda: fetch_current_weather(location, openweather_key, units, place),
+                cacheable=lambda result: result.get("status") == "success" or result.get("not_found", False)
+            )
         
         # Fallback to enhanced mock data
         return create_enhanced_mock_weather(location)
         
+    except UpstreamUnavailable as e:
+        logging.info(f"Weather: {e}, using demo data")
+        weather = create_enhanced_mock_weather(location)
+        weather["source"] = "Mock Data (OpenWeather unavailable)"
+        return weather
     except Exception as e:
         logging.error(f"Weather API error: {e}")
         return create_enhanced_mock_weather(location, error=True)
 
+def fetch_current_weather(location: str, openweather_key: str, units: str = "metric", place=None) -> dict:
+    """Call OpenWeatherMap for a gazetteer place (by coordinates) or a location name"""
+    # Current weather API call
+    current_url = f"{OPENWEATHER_BASE_URL}/weather"
+    if place is not None:
+        current_params = {'lat': place.lat, 'lon': place.lon}
+    else:
+        current_params = {'q': location}
+    current_params.update({
+        'appid': openweather_key,
+        'units': units
+    })
+    
+    logging.info(f"Weather API call for {location} with session key")
+    response = weather_upstream.request("GET", current_url, openweather_key, hedge=True, params=current_params)
+    
+    if response.status_code == 200:
+        data = response.json()
+        
+        # Generate weather alerts and recommendations
+        alerts = generate_weather_alerts(data)
+        recommendations = generate_weather_recommendations(data)
+        
+        return {
+            "status": "success",
+            "source": "OpenWeatherMap API (User Key)",
+            "current": {
+                "location": place.label if place is not None else f"{data['name']}, {data['sys']['country']}",
+                "temperature": f"{data['main']['temp']:.1f}°{'C' if units == 'metric' else 'F'}",
+                "feels_like": f"{data['main']['feels_like']:.1f}°{'C' if units == 'metric' else 'F'}",
+                "condition": data['weather'][0]['description'].title(),
+                "humidity": f"{data['main']['humidity']}%",
+                "pressure": f"{data['main']['pressure']} hPa",
+                "wind_speed": f"{data['wind']['speed']} {'m/s' if units == 'metric' else 'mph'}",
+                "wind_direction": get_wind_direction(data['wind'].get('deg', 0)),
+                "visibility": f"{data.get('visibility', 10000)/1000:.1f} km",
+                "sunrise": datetime.fromtimestamp(data['sys']['sunrise']).strftime("%H:%M"),
+                "sunset": datetime.fromtimestamp(data['sys']['sunset']).strftime("%H:%M")
+            },
+            "alerts": alerts,
+            "recommendations": recommendations,
+            "retrieved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    elif response.status_code == 401:
+        return {"error": "Invalid OpenWeather API key. Please check your API key in settings."}
+    elif response.status_code == 404:
+        return {"error": f"City '{location}' not found. Try including country code (e.g., 'Tokyo,JP')", "not_found": True}
+    else:
+        return {"error": f"Weather service error: {response.status_code}"}
+
 def get_wind_direction(degrees):
     """Convert wind degrees to compass direction"""
     directions = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
@@ -207,7 +415,7 @@ def create_enhanced_mock_weather(location: str, error: bool = False) -> dict:
         "status": "demo",
         "source": "Mock Data (Demo Mode - Configure API Key)",
         "current": {
-            "location": f"{location.title()}",
+            "location": location if "," in location else location.title(),
             "temperature": f"{current_temp}°C",
             "feels_like": f"{current_temp + random.randint(-2, 3)}°C",
             "condition": condition,
@@ -224,6 +432,47 @@ def create_enhanced_mock_weather(location: str, error: bool = False) -> dict:
         "retrieved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
 
+# Tavily results are shared across sessions and keyed by the normalized
+# query, search depth and result count. News goes stale faster than search.
+TAVILY_SEARCH_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com").rstrip("/") + "/search"
+# Search and news share one breaker per Tavily key
+tavily_upstream = Upstream("tavily", default_timeout=15, min_timeout=3)
+
+search_cache = TTLCache(
+    "search",
+    maxsize=int(os.getenv("SEARCH_CACHE_MAXSIZE", "1024")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "1800")),
+    stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_TTL", "0"))
+)
+news_cache = TTLCache(
+    "news",
+    maxsize=int(os.getenv("NEWS_CACHE_MAXSIZE", "256")),
+    ttl=float(os.getenv("NEWS_CACHE_TTL", "300")),
+    stale_ttl=float(os.getenv("NEWS_CACHE_STALE_TTL", "0"))
+)
+
+def normalize_query(query: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    return " ".join(query.lower().split()).strip(" ?!.,")
+
+def fetch_tavily_results(query: str, tavily_key: str, max_results: int = 3, search_depth: str = "basic"):
+    """POST a query to Tavily; returns the parsed JSON or None on a non-200 reply"""
+    headers = {"Content-Type": "application/json"}
+    data = {
+        "api_key": tavily_key,
+        "query": query,
+        "search_depth": search_depth,
+        "include_answer": True,
+        "max_results": max_results
+    }
+    
+    response = tavily_upstream.request("POST", TAVILY_SEARCH_URL, tavily_key, headers=headers, json=data)
+    
+    if response.status_code == 200:
+        return response.json()
+    logging.warning(f"Tavily returned {response.status_code} for '{query}'")
+    return None
+
 def search_web_with_fallback(query: str, session_id: str, max_results: int = 3) -> dict:
     """Search web with session-specific Tavily API key"""
     try:
@@ -231,20 +480,14 @@ def search_web_with_fallback(query: str, session_id: str, max_results: int = 3)
         tavily_key = api_keys["tavily"]
         
         if tavily_key and tavily_key != "your tavily api key here":
-            url = "https://api.tavily.com/search"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "api_key": tavily_key,
-                "query": query,
-                "search_depth": "basic",
-                "include_answer": True,
-                "max_results": max_results
-            }
-            
-            response = requests.post(url, headers=headers, json=data, timeout=15)
+            search_depth = "basic"
+            result = search_cache.get_or_load(
+                (normalize_query(query), search_depth, max_results),
+                lambda: fetch_tavily_results(query, tavily_key, max_results, search_depth),
+                cacheable=lambda result: result is not None
+            )
             
-            if response.status_code == 200:
-                result = response.json()
+            if result is not None:
                 search_results = []
                 
                 for item in result.get('results', []):
@@ -264,6 +507,11 @@ def search_web_with_fallback(query: str, session_id: str, max_results: int = 3)
         
         return create_mock_search_results(query)
         
+    except UpstreamUnavailable as e:
+        logging.info(f"Search: {e}, using mock results")
+        results = create_mock_search_results(query)
+        results["source"] = "Mock Data (Tavily unavailable)"
+        return results
     except Exception as e:
         logging.warning(f"Search failed: {e}, using mock results")
         return create_mock_search_results(query)
@@ -298,21 +546,14 @@ def get_news_with_fallback(topic: str, session_id: str, max_results: int = 3) ->
         
         if tavily_key and tavily_key != "your tavily api key here":
             query = f"latest news {topic} today" if topic != "general" else "latest news today"
+            search_depth = "basic"
+            result = news_cache.get_or_load(
+                (normalize_query(query), search_depth, max_results),
+                lambda: fetch_tavily_results(query, tavily_key, max_results, search_depth),
+                cacheable=lambda result: result is not None
+            )
             
-            url = "https://api.tavily.com/search"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "api_key": tavily_key,
-                "query": query,
-                "search_depth": "basic",
-                "include_answer": True,
-                "max_results": max_results
-            }
-            
-            response = requests.post(url, headers=headers, json=data, timeout=15)
-            
-            if response.status_code == 200:
-                result = response.json()
+            if result is not None:
                 news_articles = []
                 
                 for item in result.get('results', []):
@@ -332,6 +573,11 @@ def get_news_with_fallback(topic: str, session_id: str, max_results: int = 3) ->
         
         return create_mock_news(topic)
         
+    except UpstreamUnavailable as e:
+        logging.info(f"News: {e}, using mock news")
+        news = create_mock_news(topic)
+        news["source"] = "Mock Data (Tavily unavailable)"
+        return news
     except Exception as e:
         logging.warning(f"News failed: {e}, using mock news")
         return create_mock_news(topic)
@@ -363,24 +609,351 @@ def get_current_time() -> dict:
         "timezone": "Local Time"
     }
 
+DISK_ROOT = "C:\\" if os.name == 'nt' else "/"
+
+# Host and process stats sampled in the background (TELEMETRY_* env vars);
+# the system skill answers from the latest sample and the recent history
+telemetry = TelemetrySampler(disk_root=DISK_ROOT)
+# Trend questions without a window ("how has memory changed?") cover this many seconds
+TELEMETRY_TREND_DEFAULT = float(os.getenv("TELEMETRY_TREND_DEFAULT", "600"))
+
+def format_metric(field: str, value: float) -> str:
+    if field.endswith("_percent"):
+        return f"{value:.1f}%"
+    if field.endswith("_bps"):
+        return f"{value / 1024:.1f} KB/s"
+    if field.endswith("_bytes"):
+        return f"{value / (1024 * 1024):.0f} MB"
+    return f"{value:g}"
+
 def get_system_info() -> dict:
-    """Get basic system information - No API required"""
-    import platform
-    try:
-        import psutil
-        return {
-            "system": platform.system(),
-            "platform": platform.platform(),
-            "processor": platform.processor(),
-            "memory_usage": f"{psutil.virtual_memory().percent}%",
-            "disk_usage": f"{psutil.disk_usage('/').percent}%" if os.name != 'nt' else f"{psutil.disk_usage('C:\\').percent}%"
-        }
-    except ImportError:
-        return {
-            "system": platform.system(),
-            "platform": platform.platform(),
-            "message": "Basic system info available"
-        }
+    """Get basic system information from the latest telemetry sample - No API required"""
+    if not telemetry.available:
+        return basic_system_info()
+    sample = telemetry.latest()
+    if sample is None:
+        info = basic_system_info()
+        info["message"] = "System telemetry is warming up"
+        return info
+    info = {
+        "system": sample["system"],
+        "platform": sample["platform"],
+        "processor": sample["processor"],
+        "sampled_seconds_ago": sample["age_s"],
+    }
+    for key, field in (("cpu_usage", "cpu_percent"), ("memory_usage", "memory_percent"),
+                       ("disk_usage", "disk_percent"), ("network_sent", "net_sent_bps"),
+                       ("network_received", "net_recv_bps"), ("process_memory", "process_rss_bytes")):
+        if not math.isnan(sample[field]):
+            info[key] = format_metric(field, sample[field])
+    return info
+
+# Read once at import; platform.platform() runs uname and is not free
+BASIC_SYSTEM_INFO = {
+    "system": platform.system(),
+    "platform": platform.platform(),
+    "message": "Basic system info available"
+}
+
+def basic_system_info() -> dict:
+    """Platform details only, when psutil is missing or too slow"""
+    return dict(BASIC_SYSTEM_INFO)
+
+# ---- ASYNC SKILL LAYER ----
+# The skill functions above are blocking (requests / psutil). These wrappers run
+# them on the shared skill thread pool so one slow upstream call never stalls
+# the event loop for the other websockets in this worker.
+
+async def get_current_weather_async(location: str, session_id: str, units: str = "metric") -> dict:
+    return await run_blocking(get_current_weather_enhanced, location, session_id, units)
+
+async def search_web_async(query: str, session_id: str, max_results: int = 3) -> dict:
+    return await run_blocking(search_web_with_fallback, query, session_id, max_results)
+
+async def get_news_async(topic: str, session_id: str, max_results: int = 3) -> dict:
+    return await run_blocking(get_news_with_fallback, topic, session_id, max_results)
+
+async def get_system_info_async() -> dict:
+    if telemetry.available and telemetry.latest() is None:
+        # Sampler not started yet: take the first sample (psutil syscalls) off the event loop
+        await run_blocking(telemetry.sample)
+    return get_system_info()
+
+async def generate_content_async(model, api_key: str, history: list, generation_config: dict):
+    with gemini_call("generate", api_key), STAGE_SECONDS.time("llm"):
+        return await gemini_upstream.wait_for(
+            run_blocking(model.generate_content, history, generation_config=generation_config)
+        )
+
+async def summarize_turns_async(model, api_key: str, previous_summary: str, turns: list) -> str:
+    """Fold older conversation turns into a short summary with Gemini"""
+    if model is None:
+        return ""
+    transcript = "\n".join(
+        f"{'User' if turn.get('role') == 'user' else 'Assistant'}: {turn_text(turn)}" for turn in turns
+    )
+    prompt = (
+        "Update the running summary of this conversation. Keep facts, names, preferences and open questions; "
+        "drop greetings and filler. Reply with the summary only, at most 150 words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"
+    )
+    with gemini_call("summary", api_key):
+        response = await gemini_upstream.wait_for(run_blocking(
+            model.generate_content, prompt, generation_config={"temperature": 0.2, "max_output_tokens": 300}
+        ))
+    return (response.text or "").strip()
+
+async def stream_content_async(model, api_key: str, history: list, generation_config: dict):
+    """Yields text deltas from a streamed Gemini response as they arrive"""
+    def open_stream():
+        return model.generate_content(history, generation_config=generation_config, stream=True)
+
+    with gemini_call("stream", api_key) as attempt:
+        chunks = iterate_blocking(open_stream)
+        try:
+            # Only the first chunk has a deadline; a long answer may take its time
+            chunk = await gemini_stream_upstream.wait_for(anext(chunks))
+            attempt.responded()
+            while True:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. safety metadata only)
+                    text = ""
+                if text:
+                    yield text
+                chunk = await anext(chunks)
+        except StopAsyncIteration:
+            pass
+        finally:
+            await chunks.aclose()
+
+# ---- SKILL ROUTING ----
+# Each skill registers its trigger phrases with the intent router and returns
+# (response_text, function_result). Lower priority numbers win when an
+# utterance matches several skills. Compound utterances run one skill per
+# clause concurrently; a skill that misses its deadline (SKILL_DEADLINE_SECONDS
+# unless it sets its own) or fails answers with its fallback instead. Skills
+# with a prefetch_key may start on interim transcripts (partial_transcript).
+
+intent_router = IntentRouter(default_deadline=float(os.getenv("SKILL_DEADLINE_SECONDS", "5")))
+
+LOCATION_AFTER = re.compile(r"\b(?:in|for|at)\s+([\w'-]+)", re.IGNORECASE)
+
+def extract_location_from_text(text: str) -> str:
+    """Extract location from user input, defaulting to a common location"""
+    place = gazetteer.find(text)
+    if place is not None:
+        return place.label
+
+    # Not a known city: the word after "in"/"for"/"at" is sent by name
+    match = LOCATION_AFTER.search(text)
+    if match:
+        return match.group(1).title()
+    
+    return "London"
+
+def weather_reply(function_result: dict) -> str:
+    if function_result.get("status") in ["success", "demo"]:
+        current = function_result['current']
+        llm_response_text = f"Current weather in {current['location']}:\n\n"
+        llm_response_text += f"🌡️ **Temperature:** {current['temperature']} (feels like {current['feels_like']})\n"
+        llm_response_text += f"☀️ **Condition:** {current['condition']}\n"
+        llm_response_text += f"💧 **Humidity:** {current['humidity']}\n"
+        llm_response_text += f"🌪️ **Wind:** {current['wind_speed']} {current.get('wind_direction', '')}\n"
+        llm_response_text += f"👁️ **Visibility:** {current.get('visibility', 'N/A')}\n"
+        llm_response_text += f"🌅 **Sunrise:** {current.get('sunrise', 'N/A')} | 🌅 **Sunset:** {current.get('sunset', 'N/A')}\n\n"
+        
+        if function_result.get('alerts'):
+            llm_response_text += "**⚠️ Weather Alerts:**\n"
+            for alert in function_result['alerts']:
+                llm_response_text += f"• {alert}\n"
+            llm_response_text += "\n"
+        
+        if function_result.get('recommendations'):
+            llm_response_text += "**💡 Recommendations:**\n"
+            for rec in function_result['recommendations']:
+                llm_response_text += f"• {rec}\n"
+            llm_response_text += "\n"
+        
+        llm_response_text += f"*Source: {function_result['source']} | Updated: {function_result['retrieved_at']}*"
+    else:
+        llm_response_text = f"I'm sorry, I couldn't retrieve weather data. {function_result.get('error', 'Please check your API key configuration.')}"
+    return llm_response_text
+
+@intent_router.skill("weather", ["weather", "temperature", "rain", "raining", "snow", "snowing", "sunny", "cloudy", "forecast", "humidity"], priority=1,
+                     prefetch_key=extract_location_from_text)
+async def handle_weather(user_transcript: str, session_id: str):
+    location = extract_location_from_text(user_transcript)
+    function_result = await get_current_weather_async(location, session_id)
+    return weather_reply(function_result), function_result
+
+@intent_router.fallback("weather")
+def weather_fallback(user_transcript: str, session_id: str):
+    function_result = create_enhanced_mock_weather(extract_location_from_text(user_transcript))
+    return weather_reply(function_result), function_result
+
+def extract_news_topic(text: str) -> str:
+    user_lower = text.lower()
+    topic = "general"
+    if "technology" in user_lower or "tech" in user_lower:
+        topic = "technology"
+    elif "sports" in user_lower:
+        topic = "sports"
+    return topic
+
+def news_reply(function_result: dict) -> str:
+    llm_response_text = f"Here are the latest {function_result['topic']} news headlines:\n\n"
+    
+    for i, article in enumerate(function_result['articles'][:3], 1):
+        llm_response_text += f"{i}. **{article['headline']}**\n   {article['summary']}\n   Published: {article['published']}\n\n"
+    
+    llm_response_text += f"Source: {function_result['source']} | Retrieved: {function_result['retrieved_at']}"
+    return llm_response_text
+
+@intent_router.skill("news", ["news", "headlines", "headline", "current events", "breaking"], priority=2,
+                     prefetch_key=extract_news_topic)
+async def handle_news(user_transcript: str, session_id: str):
+    function_result = await get_news_async(extract_news_topic(user_transcript), session_id)
+    return news_reply(function_result), function_result
+
+@intent_router.fallback("news")
+def news_fallback(user_transcript: str, session_id: str):
+    function_result = create_mock_news(extract_news_topic(user_transcript))
+    return news_reply(function_result), function_result
+
+def extract_search_query(text: str) -> str:
+    user_lower = text.lower()
+    search_query = text
+    if "search for" in user_lower:
+        search_query = text.split("search for", 1)[1].strip()
+    elif "find" in user_lower and "about" in user_lower:
+        search_query = text.split("about", 1)[1].strip()
+    return search_query
+
+def search_reply(function_result: dict) -> str:
+    llm_response_text = f"I searched for '{function_result['query']}' and found:\n\n{function_result['answer']}\n\nRelevant results:\n"
+    
+    for i, result in enumerate(function_result['results'][:3], 1):
+        llm_response_text += f"{i}. **{result['title']}**\n   {result['snippet']}\n\n"
+    
+    llm_response_text += f"Source: {function_result['source']}"
+    return llm_response_text
+
+@intent_router.skill("search", ["search", "search for", "look up", "information about", "find information", "find out about", "find me", "google"], priority=3,
+                     prefetch_key=lambda text: normalize_query(extract_search_query(text)))
+async def handle_search(user_transcript: str, session_id: str):
+    function_result = await search_web_async(extract_search_query(user_transcript), session_id)
+    return search_reply(function_result), function_result
+
+@intent_router.fallback("search")
+def search_fallback(user_transcript: str, session_id: str):
+    function_result = create_mock_search_results(extract_search_query(user_transcript))
+    return search_reply(function_result), function_result
+
+# (utterance words, sampled fields, label) for trend questions; memory and CPU when none match
+TREND_METRICS = [
+    (("memory", "ram"), ("memory_percent",), "🧠 Memory"),
+    (("cpu", "processor", "load"), ("cpu_percent",), "⚙️ CPU"),
+    (("disk", "storage"), ("disk_percent",), "💽 Disk"),
+    (("network", "bandwidth", "upload", "download"), ("net_sent_bps", "net_recv_bps"), "🌐 Network"),
+]
+TREND_WORDS = ("changed", "trend", "average", "peak", "history", "over time")
+TREND_WINDOW = re.compile(r"\b(?:last|past)\s+(?:(\d+(?:\.\d+)?|a|an|one|two|few|couple of)\s+)?(second|sec|minute|min|hour|hr)s?\b")
+TREND_AMOUNTS = {"a": 1, "an": 1, "one": 1, "two": 2, "couple of": 2, "few": 3}
+TREND_UNITS = {"second": 1, "sec": 1, "minute": 60, "min": 60, "hour": 3600, "hr": 3600}
+
+def extract_trend_window(text: str):
+    """Seconds of history a trend question asks about, or None for a plain status question"""
+    user_lower = text.lower()
+    match = TREND_WINDOW.search(user_lower)
+    if match:
+        amount = match.group(1) or "one"
+        amount = TREND_AMOUNTS.get(amount) or float(amount)
+        return amount * TREND_UNITS[match.group(2)]
+    if any(word in user_lower for word in TREND_WORDS):
+        return TELEMETRY_TREND_DEFAULT
+    return None
+
+def get_system_trend(text: str, seconds: float) -> dict:
+    """min/max/avg of the asked-about metrics over the last seconds of telemetry"""
+    user_lower = text.lower()
+    wanted = [metric for metric in TREND_METRICS if any(word in user_lower for word in metric[0])] or TREND_METRICS[:2]
+    window = telemetry.window(seconds)
+    trends = {field: window[field] for _, fields, _ in wanted for field in fields if field in window}
+    return {
+        "window_seconds": seconds,
+        "samples": window["samples"],
+        "span_seconds": window["span_s"],
+        "trends": trends,
+        "labels": {field: label for _, fields, label in wanted for field in fields},
+    }
+
+def describe_duration(seconds: float) -> str:
+    for unit, size in (("hour", 3600), ("minute", 60)):
+        if seconds >= size:
+            amount = round(seconds / size, 1)
+            amount = int(amount) if amount == int(amount) else amount
+            return f"{amount} {unit}{'' if amount == 1 else 's'}"
+    return f"{int(seconds)} seconds"
+
+def system_trend_reply(function_result: dict) -> str:
+    trends = function_result["trends"]
+    if not trends:
+        return "I don't have any system history yet. Ask me again in a little while."
+    llm_response_text = f"Here's how your system has looked over the last {describe_duration(function_result['window_seconds'])}:\n\n"
+    for field, trend in trends.items():
+        label = function_result["labels"][field]
+        if field == "net_sent_bps":
+            label += " (sent)"
+        elif field == "net_recv_bps":
+            label += " (received)"
+        llm_response_text += (
+            f"{label}: now **{format_metric(field, trend['last'])}** (was {format_metric(field, trend['first'])}), "
+            f"min {format_metric(field, trend['min'])}, avg {format_metric(field, trend['avg'])}, "
+            f"max {format_metric(field, trend['max'])}\n"
+        )
+    if function_result["span_seconds"] < function_result["window_seconds"] * 0.9:
+        llm_response_text += f"\nI only have {describe_duration(function_result['span_seconds'])} of history so far."
+    return llm_response_text.rstrip()
+
+def system_reply(function_result: dict) -> str:
+    if "trends" in function_result:
+        return system_trend_reply(function_result)
+    llm_response_text = f"Here's your system information:\n\n"
+    llm_response_text += f"🖥️ **System:** {function_result.get('system', 'Unknown')}\n"
+    llm_response_text += f"💾 **Platform:** {function_result.get('platform', 'Unknown')}\n"
+    if "cpu_usage" in function_result:
+        llm_response_text += f"⚙️ **CPU Usage:** {function_result['cpu_usage']}\n"
+    llm_response_text += f"🧠 **Memory Usage:** {function_result.get('memory_usage', 'N/A')}\n"
+    llm_response_text += f"💽 **Disk Usage:** {function_result.get('disk_usage', 'N/A')}\n"
+    if "network_received" in function_result:
+        llm_response_text += f"🌐 **Network:** {function_result['network_received']} in, {function_result.get('network_sent', 'N/A')} out\n"
+    llm_response_text += "\nAsk me how memory or CPU has changed over the last few minutes for a trend."
+    return llm_response_text
+
+# Local calls: a slow answer here means the host is struggling, so give up sooner
+@intent_router.skill("system", ["system", "system info", "computer", "memory", "disk", "performance", "cpu", "network usage", "network traffic", "bandwidth"], priority=4, deadline=2.0)
+async def handle_system(user_transcript: str, session_id: str):
+    window = extract_trend_window(user_transcript)
+    if window is not None and telemetry.available:
+        function_result = get_system_trend(user_transcript, min(window, telemetry.history_seconds))
+    else:
+        function_result = await get_system_info_async()
+    return system_reply(function_result), function_result
+
+@intent_router.fallback("system")
+def system_fallback(user_transcript: str, session_id: str):
+    function_result = basic_system_info()
+    return system_reply(function_result), function_result
+
+@intent_router.skill("time", ["time", "what time", "clock", "date", "what date", "today's date", "what day", "day is it", "day of the week"], priority=5)
+async def handle_time(user_transcript: str, session_id: str):
+    function_result = get_current_time()
+    llm_response_text = f"🕐 Current time: **{function_result['current_time']}**\n"
+    llm_response_text += f"📅 Date: **{function_result['current_date']}** ({function_result['day_of_week']})\n"
+    llm_response_text += f"🌍 Timezone: {function_result['timezone']}"
+    return llm_response_text, function_result
 
 # ---- API ENDPOINTS ----
 
@@ -388,36 +961,46 @@ def get_system_info() -> dict:
 async def read_index():
     return FileResponse(os.path.join(BASE_DIR, "index.html"))
 
+def refused_response(decision) -> JSONResponse:
+    """429 for a client over its rate, 503 for a saturated server; both say when to retry"""
+    return JSONResponse(
+        {"status": "error", "reason": decision.reason, "message": OVERLOADED_MESSAGES[decision.reason],
+         "retry_after": round(decision.retry_after, 1)},
+        status_code=429 if decision.reason == "rate_limited" else 503,
+        headers={"Retry-After": decision.retry_after_header}
+    )
+
 @app.get("/session")
-async def create_session():
+async def create_session(request: Request):
+    decision = admission.admit_session(client_address(request.headers, request.client))
+    if not decision.admitted:
+        return refused_response(decision)
     session_id = str(uuid.uuid4())
-    chat_histories[session_id] = []
-    session_personas[session_id] = "default"
-    session_api_keys[session_id] = {}  # Empty API keys initially
-    session_metadata[session_id] = {
-        "created_at": datetime.now().isoformat(),
-        "total_messages": 0,
-        "personas_used": ["default"],
-        "api_keys_configured": []
-    }
+    try:
+        await session_store.run(session_store.create, session_id)
+    except SessionStoreFull as e:
+        logging.warning(f"Refusing new session: {e}")
+        return JSONResponse({"status": "error", "message": "Server is at its session limit. Please try again shortly."}, status_code=503)
     logging.info(f"Created session {session_id}")
     return JSONResponse({"session_id": session_id})
 
 @app.post("/session/{session_id}/api-keys")
 async def update_api_keys(session_id: str, api_keys: dict):
     """Update API keys for a session"""
-    if session_id in session_api_keys:
+    session = await session_store.run(session_store.get, session_id)
+    if session is not None:
         # Validate and store API keys
         valid_keys = {}
         for key, value in api_keys.items():
-            if key in ['gemini', 'openweather', 'tavily'] and value and value.strip():
+            if key in ['gemini', 'openweather', 'tavily', 'assemblyai'] and value and value.strip():
                 valid_keys[key] = value.strip()
         
-        session_api_keys[session_id] = valid_keys
+        # A replaced Gemini key no longer needs its pooled client
+        old_gemini_key = session.api_keys.get("gemini")
+        if old_gemini_key and old_gemini_key != valid_keys.get("gemini"):
+            gemini_pool.discard(old_gemini_key)
         
-        # Update metadata
-        if session_id in session_metadata:
-            session_metadata[session_id]["api_keys_configured"] = list(valid_keys.keys())
+        await session_store.run(session_store.set_api_keys, session_id, valid_keys)
         
         logging.info(f"Updated API keys for session {session_id}: {list(valid_keys.keys())}")
         return JSONResponse({
@@ -431,19 +1014,21 @@ async def update_api_keys(session_id: str, api_keys: dict):
 @app.get("/session/{session_id}/status")
 async def get_session_status(session_id: str):
     """Get session status including configured API keys"""
-    if session_id in session_metadata:
-        api_keys = get_session_api_keys(session_id)
-        configured_keys = session_api_keys.get(session_id, {})
+    session = await session_store.run(session_store.get, session_id)
+    if session is not None:
+        api_keys = await get_session_api_keys_async(session_id)
+        configured_keys = session.api_keys
         
         return JSONResponse({
             "session_id": session_id,
-            "metadata": session_metadata[session_id],
+            "metadata": session.metadata,
             "configured_api_keys": list(configured_keys.keys()),
             "available_features": {
                 "weather": bool(api_keys["openweather"]),
                 "web_search": bool(api_keys["tavily"]),
                 "news": bool(api_keys["tavily"]),
                 "ai_chat": bool(api_keys["gemini"]),
+                "server_transcription": bool(api_keys["assemblyai"]),
                 "time_date": True,
                 "system_info": True
             }
@@ -451,183 +1036,301 @@ async def get_session_status(session_id: str):
     
     return JSONResponse({"status": "error", "message": "Session not found"}, status_code=404)
 
+@app.post("/session/{session_id}/audio")
+async def upload_audio(session_id: str, request: Request):
+    """Transcribe a recorded clip; the request body is the raw audio file"""
+    if await session_store.run(session_store.peek, session_id, False) is None:
+        return JSONResponse({"status": "error", "message": "Invalid session"}, status_code=400)
+    api_key = (await get_session_api_keys_async(session_id))["assemblyai"]
+    if not api_key:
+        return JSONResponse({"status": "error", "message": "AssemblyAI API key not configured"}, status_code=503)
+    decision = admission.admit_turn(session_id)
+    if not decision.admitted:
+        return refused_response(decision)
+    started = time.perf_counter()
+    try:
+        return await transcribe_upload(session_id, request, api_key)
+    finally:
+        admission.finish_turn(time.perf_counter() - started)
+
+async def transcribe_upload(session_id: str, request: Request, api_key: str) -> JSONResponse:
+    """Spool, normalize and transcribe an upload; runs in an admitted turn slot"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        entry = await upload_spool.receive(
+            session_id, request.stream(),
+            suffix=UPLOAD_SUFFIXES.get(content_type, ".webm"),
+            expected_bytes=int(request.headers.get("content-length") or 0)
+        )
+    except SpoolQuotaExceeded as e:
+        logging.warning(f"Rejected upload for {session_id}: {e}")
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=413)
+
+    try:
+        with open(entry.path, "rb") as audio_file:
+            audio = await transcoder.transcode(audio_file)
+            text = await stt_manager.transcribe(audio, api_key)
+    except TranscriptionError as e:
+        logging.error(f"Upload transcription failed for {session_id}: {e}")
+        return JSONResponse({"status": "error", "message": "Transcription failed"}, status_code=502)
+    finally:
+        upload_spool.release(entry.upload_id)
+
+    return JSONResponse({"upload_id": entry.upload_id, "bytes": entry.bytes, "text": text})
+
+@app.get("/tts")
+async def synthesize_speech(text: str, session_id: str = None):
+    """
+    Speech for a short text as a WAV file, served from the TTS cache.
+    Cached speech is served to anyone; synthesizing new speech needs a
+    known session and counts as one of its turns for admission control.
+    """
+    text = " ".join(text.split())
+    if not text or len(text) > 1000:
+        return JSONResponse({"status": "error", "message": "Text must be 1-1000 characters"}, status_code=400)
+
+    key = tts_cache.key_for(text, GEMINI_TTS_VOICE, GEMINI_TTS_MODEL)
+    path = await run_blocking(tts_cache.lookup_key, key)
+    if path is None:
+        if not session_id or await session_store.run(session_store.peek, session_id, False) is None:
+            return JSONResponse({"status": "error", "message": "Session not found"}, status_code=404)
+        gemini_key = (await get_session_api_keys_async(session_id))["gemini"]
+        if not gemini_key:
+            return JSONResponse({"status": "error", "message": "Gemini API key not configured"}, status_code=503)
+        decision = admission.admit_turn(session_id)
+        if not decision.admitted:
+            return refused_response(decision)
+        started = time.perf_counter()
+        try:
+            path = await run_blocking(
+                tts_cache.store, text, GEMINI_TTS_VOICE, GEMINI_TTS_MODEL, synthesize_stream(text, gemini_key)
+            )
+        except Exception as e:
+            logging.error(f"TTS synthesis failed: {e}")
+            return JSONResponse({"status": "error", "message": "Speech synthesis failed"}, status_code=502)
+        finally:
+            admission.finish_turn(time.perf_counter() - started)
+
+    # Cached files never change for a key, so clients and proxies may keep them
+    return FileResponse(path, media_type="audio/wav", headers={
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{key}"'
+    })
+
 @app.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str):
+async def websocket_endpoint(websocket: WebSocket, session_id: str, protocol: int = 1, encoding: str = "json"):
     await websocket.accept()
-    logging.info(f"WebSocket connected: {session_id}")
+    # Message framing is negotiated with ?protocol=2&encoding=json|msgpack
+    channel = MessageChannel(websocket, *negotiate(protocol, encoding))
+    if channel.version >= 2:
+        await channel.send(channel.hello())
+    try:
+        await session_store.run(session_store.connect, session_id)
+    except SessionStoreFull:
+        await channel.send({"type": "error", "message": "Server is at its session limit. Please try again shortly."})
+        await channel.flush()
+        await websocket.close(code=1013)
+        return
+    logging.info(f"WebSocket connected: {session_id} (protocol {channel.version}, {channel.encoding})")
+    ACTIVE_WEBSOCKETS.inc()
 
     # Define available functions
     available_functions = {
         "get_current_time": get_current_time,
-        "get_system_info": get_system_info,
-        "get_current_weather_enhanced": lambda location: get_current_weather_enhanced(location, session_id),
-        "search_web_with_fallback": lambda query, max_results=3: search_web_with_fallback(query, session_id, max_results),
-        "get_news_with_fallback": lambda topic="general", max_results=3: get_news_with_fallback(topic, session_id, max_results)
+        "get_system_info": get_system_info_async,
+        "get_current_weather_enhanced": lambda location: get_current_weather_async(location, session_id),
+        "search_web_with_fallback": lambda query, max_results=3: search_web_async(query, session_id, max_results),
+        "get_news_with_fallback": lambda topic="general", max_results=3: get_news_async(topic, session_id, max_results)
     }
 
-    async def run_complete_pipeline(user_transcript: str):
+    async def stream_llm_response(model, api_key: str, history: list, persona: str, tts_pipeline=None) -> str:
+        """Send the Gemini answer as sentence-grouped llm_chunk messages and return the full text"""
+        chunker = SentenceChunker()
+        parts = []
+        index = 0
+
+        async def send_chunks(chunks):
+            nonlocal index
+            for chunk in chunks:
+                await channel.send({
+                    "type": "llm_chunk",
+                    "text": chunk,
+                    "index": index,
+                    "persona": persona
+                })
+                index += 1
+                if tts_pipeline is not None:
+                    tts_pipeline.add(chunk)
+
+        started = time.perf_counter()
+        async for delta in stream_content_async(model, api_key, history, GENERATION_CONFIG):
+            if not parts:
+                STAGE_SECONDS.observe(time.perf_counter() - started, "llm_first_chunk")
+            parts.append(delta)
+            await send_chunks(chunker.feed(delta))
+        await send_chunks(chunker.flush())
+        STAGE_SECONDS.observe(time.perf_counter() - started, "llm")
+
+        return "".join(parts)
+
+    # Weather, news and search fetches start while the user is still talking
+    # when interim transcripts already name them; the final transcript claims
+    # or cancels them
+    speculation = SpeculativeExecutor(
+        intent_router, session_id, admit=lambda: admission.admit_speculation(session_id).admitted
+    )
+
+    async def run_skills(requests: list, prefetched: dict, persona: str, stream: bool, tts_pipeline=None):
+        """
+        Run the requested skills concurrently and merge their replies in the
+        order they complete. With several skills and a streaming client, each
+        reply goes out as an llm_chunk (and into the speech queue) as soon as
+        it is ready. Returns (text, function_result, streamed).
+        """
+        compound = len(requests) > 1
+        replies = []
+        results = []
+        async for outcome in intent_router.run_all(requests, session_id, prefetched=prefetched):
+            SKILL_SECONDS.observe(outcome.seconds, outcome.name)
+            if outcome.status != "ok":
+                SKILL_FALLBACKS.inc(outcome.name, outcome.status)
+            if compound and stream:
+                await channel.send({
+                    "type": "llm_chunk",
+                    "text": outcome.text,
+                    "index": len(replies),
+                    "persona": persona
+                })
+                if tts_pipeline is not None:
+                    tts_pipeline.add(outcome.text)
+            replies.append(outcome.text)
+            results.append({"skill": outcome.name, "status": outcome.status, "result": outcome.result})
+        if not compound:
+            return replies[0], results[0]["result"], False
+        return "\n\n".join(replies), results, stream
+
+    async def send_tts_audio(tts_pipeline: SentenceTTSPipeline):
+        """Forward synthesized sentences to the client as binary PCM frames, in order"""
+        started = asyncio.get_running_loop().time()
+        audio_bytes = 0
+        async for index, sentence, frame in tts_pipeline.frames():
+            if frame is None:
+                if index == 0:
+                    await channel.send({
+                        "type": "tts_start", "format": "pcm_s16le", "sample_rate": TTS_SAMPLE_RATE
+                    })
+                await channel.send({"type": "tts_sentence", "index": index, "text": sentence})
+                continue
+            if not audio_bytes:
+                record_tts(responses=1, first_audio_ms_total=int((asyncio.get_running_loop().time() - started) * 1000))
+            audio_bytes += len(frame)
+            await channel.send_bytes(frame)
+        record_tts(sentences=tts_pipeline.sent, audio_bytes=audio_bytes)
+
+    async def run_complete_pipeline(user_transcript: str, stream: bool = False, server_tts: bool = False):
         """Complete pipeline with session-specific API keys"""
+        tts_pipeline = None
+        tts_sender = None
+        turn_started = time.perf_counter()
+        intent = "chat"
+        outcome = "cancelled"
         try:
-            history = chat_histories.get(session_id, [])
-            persona = session_personas.get(session_id, "default")
-            metadata = session_metadata.get(session_id, {})
-            api_keys = get_session_api_keys(session_id)
-
-            # Enhanced persona prompts
-            persona_prompts = {
-                "friendly_teacher": """You are Sarah, a warm and patient teacher with access to real-time information including weather, news, web search, time/date, and system data. Use these tools to provide accurate, educational responses.""",
-                "tech_support": """You are Alex, a professional tech support specialist with access to system information, web search, weather data, and news to provide comprehensive technical assistance.""",
-                "storyteller": """You are Morgan, an imaginative storyteller who can incorporate real-world data from weather, news, and search to create engaging, contextual narratives.""",
-                "default": """You are Jamie, a helpful AI assistant with access to comprehensive real-time information including weather forecasts, news updates, web search, system monitoring, and time/date services."""
-            }
+            session = await session_store.run(session_store.get_or_create, session_id)
+            # Work on a copy; the new entries are persisted once the turn completes
+            history = list(session.history)
+            new_turns_start = len(history)
+            persona = session.persona
+            api_keys = await get_session_api_keys_async(session_id)
 
             # Initialize conversation
             if not history:
-                system_prompt = persona_prompts.get(persona, persona_prompts["default"])
+                system_prompt = PERSONA_PROMPTS.get(persona, PERSONA_PROMPTS["default"])
                 history.append({"role": "user", "parts": [{"text": system_prompt}]})
                 
                 # Check configured API keys for personalized greeting
-                configured_keys = list(session_api_keys.get(session_id, {}).keys())
-                if configured_keys:
-                    features_text = ", ".join(configured_keys).replace("_", " ").title()
-                    greeting = f"Hello! I'm your {persona.replace('_', ' ')} assistant with {features_text} capabilities configured. What can I help you with?"
-                else:
-                    greeting = f"Hello! I'm your {persona.replace('_', ' ')} assistant. I can help with time/date and system info. Configure API keys in settings for weather, news, and web search!"
-                
+                greeting = build_greeting(persona, session.api_keys)
                 history.append({"role": "model", "parts": [{"text": greeting}]})
 
             # Add user message
             history.append({"role": "user", "parts": [{"text": user_transcript}]})
+            HISTORY_MESSAGES.observe(len(history), "session")
 
             # Enhanced function calling logic
             try:
-                # Configure Gemini with session API key
+                # Pooled Gemini model for the session's API key
                 gemini_key = api_keys["gemini"]
-                if gemini_key:
-                    genai.configure(api_key=gemini_key)
-                    model = genai.GenerativeModel("gemini-1.5-flash-latest")
-                else:
-                    model = None
-                
-                user_lower = user_transcript.lower()
-                function_result = None
-                
-                logging.info(f"Processing user input: '{user_transcript}' with keys: {list(session_api_keys.get(session_id, {}).keys())}")
-                
-                # WEATHER CHECK - PRIORITY 1
-                if any(word in user_lower for word in ["weather", "temperature", "rain", "snow", "sunny", "cloudy", "forecast"]):
-                    logging.info("Detected WEATHER request")
-                    location = extract_location_from_text(user_transcript)
-                    function_result = get_current_weather_enhanced(location, session_id)
-                    
-                    if function_result.get("status") in ["success", "demo"]:
-                        current = function_result['current']
-                        llm_response_text = f"Current weather in {current['location']}:\n\n"
-                        llm_response_text += f"🌡️ **Temperature:** {current['temperature']} (feels like {current['feels_like']})\n"
-                        llm_response_text += f"☀️ **Condition:** {current['condition']}\n"
-                        llm_response_text += f"💧 **Humidity:** {current['humidity']}\n"
-                        llm_response_text += f"🌪️ **Wind:** {current['wind_speed']} {current.get('wind_direction', '')}\n"
-                        llm_response_text += f"👁️ **Visibility:** {current.get('visibility', 'N/A')}\n"
-                        llm_response_text += f"🌅 **Sunrise:** {current.get('sunrise', 'N/A')} | 🌅 **Sunset:** {current.get('sunset', 'N/A')}\n\n"
-                        
-                        if function_result.get('alerts'):
-                            llm_response_text += "**⚠️ Weather Alerts:**\n"
-                            for alert in function_result['alerts']:
-                                llm_response_text += f"• {alert}\n"
-                            llm_response_text += "\n"
-                        
-                        if function_result.get('recommendations'):
-                            llm_response_text += "**💡 Recommendations:**\n"
-                            for rec in function_result['recommendations']:
-                                llm_response_text += f"• {rec}\n"
-                            llm_response_text += "\n"
-                        
-                        llm_response_text += f"*Source: {function_result['source']} | Updated: {function_result['retrieved_at']}*"
-                    else:
-                        llm_response_text = f"I'm sorry, I couldn't retrieve weather data. {function_result.get('error', 'Please check your API key configuration.')}"
+                model = await run_blocking(gemini_pool.get, gemini_key) if gemini_key else None
                 
-                # NEWS CHECK - PRIORITY 2
-                elif any(word in user_lower for word in ["news", "headlines", "current events"]):
-                    logging.info("Detected NEWS request")
-                    topic = "general"
-                    if "technology" in user_lower or "tech" in user_lower:
-                        topic = "technology"
-                    elif "sports" in user_lower:
-                        topic = "sports"
-                    
-                    function_result = get_news_with_fallback(topic, session_id)
-                    llm_response_text = f"Here are the latest {function_result['topic']} news headlines:\n\n"
-                    
-                    for i, article in enumerate(function_result['articles'][:3], 1):
-                        llm_response_text += f"{i}. **{article['headline']}**\n   {article['summary']}\n   Published: {article['published']}\n\n"
-                    
-                    llm_response_text += f"Source: {function_result['source']} | Retrieved: {function_result['retrieved_at']}"
+                # Server-side speech starts with the first sentence, while the
+                # rest of the answer is still being generated and synthesized
+                if server_tts and gemini_key:
+                    tts_pipeline = SentenceTTSPipeline(gemini_key, cache=tts_cache)
+                    tts_sender = asyncio.create_task(send_tts_audio(tts_pipeline))
                 
-                # SEARCH CHECK - PRIORITY 3
-                elif any(word in user_lower for word in ["search", "find", "look up", "information about"]):
-                    logging.info("Detected SEARCH request")
-                    search_query = user_transcript
-                    if "search for" in user_lower:
-                        search_query = user_transcript.split("search for", 1)[1].strip()
-                    elif "find" in user_lower and "about" in user_lower:
-                        search_query = user_transcript.split("about", 1)[1].strip()
-                    
-                    function_result = search_web_with_fallback(search_query, session_id)
-                    llm_response_text = f"I searched for '{function_result['query']}' and found:\n\n{function_result['answer']}\n\nRelevant results:\n"
-                    
-                    for i, result in enumerate(function_result['results'][:3], 1):
-                        llm_response_text += f"{i}. **{result['title']}**\n   {result['snippet']}\n\n"
-                    
-                    llm_response_text += f"Source: {function_result['source']}"
-                
-                # SYSTEM CHECK - PRIORITY 4
-                elif any(word in user_lower for word in ["system", "computer", "memory", "disk", "performance"]):
-                    logging.info("Detected SYSTEM request")
-                    function_result = get_system_info()
-                    llm_response_text = f"Here's your system information:\n\n"
-                    llm_response_text += f"🖥️ **System:** {function_result.get('system', 'Unknown')}\n"
-                    llm_response_text += f"💾 **Platform:** {function_result.get('platform', 'Unknown')}\n"
-                    llm_response_text += f"🧠 **Memory Usage:** {function_result.get('memory_usage', 'N/A')}\n"
-                    llm_response_text += f"💽 **Disk Usage:** {function_result.get('disk_usage', 'N/A')}\n\n"
-                    llm_response_text += "Need more detailed system monitoring?"
+                function_result = None
+                streamed = False
                 
-                # TIME CHECK - PRIORITY 5
-                elif any(word in user_lower for word in ["time", "clock", "date", "today", "day"]):
-                    logging.info("Detected TIME request")
-                    function_result = get_current_time()
-                    llm_response_text = f"🕐 Current time: **{function_result['current_time']}**\n"
-                    llm_response_text += f"📅 Date: **{function_result['current_date']}** ({function_result['day_of_week']})\n"
-                    llm_response_text += f"🌍 Timezone: {function_result['timezone']}"
+                logging.info(f"Processing user input: '{user_transcript}' with keys: {list(session.api_keys.keys())}")
                 
+                with STAGE_SECONDS.time("intent"):
+                    skill_requests = intent_router.split(user_transcript)
+                    prefetched = speculation.take(skill_requests)
+                if skill_requests:
+                    intent = skill_requests[0][0].name if len(skill_requests) == 1 else "multi"
+                    logging.info(
+                        f"Detected {' + '.join(match.name.upper() for match, _ in skill_requests)} request "
+                        f"(matched {', '.join(repr(match.phrase) for match, _ in skill_requests)})"
+                    )
+                    llm_response_text, function_result, streamed = await run_skills(
+                        skill_requests, prefetched, persona, stream, tts_pipeline
+                    )
                 else:
                     logging.info("Detected GENERAL CHAT request")
-                    if model and gemini_key:
-                        response = model.generate_content(
-                            history,
-                            generation_config={
-                                "temperature": 0.7,
-                                "top_p": 0.8,
-                                "max_output_tokens": 2048,
-                            }
-                        )
-                        llm_response_text = response.text or "I'm here to help! You can ask me about weather, news, web search, time, or system info."
-                    else:
-                        llm_response_text = "I'm here to help! Configure your Gemini API key in settings for enhanced conversational abilities, or ask me about time, system info, weather, news, or search."
+                    request_history = context_window.build(history, session.summary)
+                    HISTORY_MESSAGES.observe(len(request_history), "request")
+                    try:
+                        if model and gemini_key and stream:
+                            llm_response_text = await stream_llm_response(
+                                model, gemini_key, request_history, persona, tts_pipeline
+                            )
+                            streamed = True
+                            if not llm_response_text:
+                                llm_response_text = CHAT_FALLBACK_REPLY
+                        elif model and gemini_key:
+                            response = await generate_content_async(
+                                model, gemini_key, request_history, GENERATION_CONFIG
+                            )
+                            llm_response_text = response.text or CHAT_FALLBACK_REPLY
+                        else:
+                            llm_response_text = NO_GEMINI_KEY_REPLY
+                    except UpstreamUnavailable as e:
+                        # Raised before anything was streamed
+                        logging.warning(f"{e}; answering without Gemini")
+                        llm_response_text = CHAT_FALLBACK_REPLY
+
+                if tts_pipeline is not None and not streamed:
+                    tts_pipeline.add(llm_response_text)
 
                 # Add final response to history
                 history.append({"role": "model", "parts": [{"text": llm_response_text}]})
                 
-                # Update session data
-                chat_histories[session_id] = history
-                metadata["total_messages"] += 1
-                session_metadata[session_id] = metadata
+                # Update session data; older turns are summarized off the hot path
+                await session_store.run(session_store.append_turns, session_id, history[new_turns_start:])
+                message_count = session.total_messages + 1
+                context_window.maybe_fold(
+                    session_id, history, session.summary,
+                    lambda previous, turns: summarize_turns_async(model, gemini_key, previous, turns),
+                    functools.partial(session_store.run, session_store.fold_history, session_id)
+                )
 
                 # Send response to client
-                await websocket.send_text(json.dumps({
-                    "type": "llm_response",
+                # Streamed answers were already delivered as llm_chunk messages;
+                # llm_done carries the assembled text for history and display.
+                await channel.send({
+                    "type": "llm_done" if streamed else "llm_response",
                     "text": llm_response_text,
                     "persona": persona,
-                    "message_count": metadata["total_messages"],
+                    "message_count": message_count,
                     "has_functions": function_result is not None,
                     "function_used": function_result is not None,
                     "api_keys_status": {
@@ -635,83 +1338,272 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                         "openweather": bool(api_keys["openweather"]),
                         "tavily": bool(api_keys["tavily"])
                     }
-                }))
+                })
                 
                 logging.info(f"Enhanced response sent for {session_id} - Function used: {function_result is not None}")
+                outcome = "ok"
 
             except Exception as llm_error:
                 logging.error(f"LLM generation error: {llm_error}")
-                error_response = "I'm experiencing some technical difficulties. Please check your API key configuration in settings."
-                await websocket.send_text(json.dumps({
+                outcome = "error"
+                error_response = LLM_ERROR_REPLY
+                await channel.send({
                     "type": "llm_response",
                     "text": error_response,
                     "persona": persona,
                     "error": True
-                }))
+                })
 
-            # TTS handling with browser fallback
+            # TTS handling: server-side audio when requested, browser fallback otherwise
             try:
-                await websocket.send_text(json.dumps({
-                    "type": "audio_end",
-                    "source": "browser_tts_fallback",
-                    "message": "Using browser voice"
-                }))
+                if tts_sender is not None:
+                    tts_pipeline.close()
+                    try:
+                        with STAGE_SECONDS.time("tts"):
+                            await tts_sender
+                        await channel.send({
+                            "type": "audio_end",
+                            "source": "server_tts",
+                            "sentences": tts_pipeline.sent
+                        })
+                    except Exception as tts_error:
+                        record_tts(errors=1)
+                        logging.warning(f"Server TTS failed for {session_id}: {tts_error}")
+                        # The browser speaks whatever the server did not
+                        await channel.send({
+                            "type": "audio_end",
+                            "source": "browser_tts_fallback",
+                            "message": "Using browser voice",
+                            "sentences_played": tts_pipeline.sent
+                        })
+                else:
+                    await channel.send({
+                        "type": "audio_end",
+                        "source": "browser_tts_fallback",
+                        "message": "Using browser voice"
+                    })
             except Exception as tts_error:
                 logging.warning(f"TTS indication failed: {tts_error}")
 
         except Exception as pipeline_error:
             logging.error(f"Pipeline error: {pipeline_error}")
-            await websocket.send_text(json.dumps({
+            outcome = "error"
+            await channel.send({
                 "type": "error",
                 "message": "System error occurred. Please try again.",
                 "error_details": str(pipeline_error)
-            }))
+            })
+        finally:
+            if tts_sender is not None and not tts_sender.done():
+                tts_sender.cancel()
+            TURNS.inc(intent, outcome)
+            if outcome != "cancelled":
+                STAGE_SECONDS.observe(time.perf_counter() - turn_started, "turn")
+
+    # Turns run on a per-session worker task so the receive loop keeps reading
+    # the socket; a new utterance or an "interrupt" message cancels the turn
+    # in flight (barge-in) instead of waiting for a slow upstream call. Each
+    # new turn replaces the pending one, so at most one ever waits.
+    turn_queue = asyncio.Queue(maxsize=1)
+    current_turn = None
 
-    def extract_location_from_text(text: str) -> str:
-        """Extract location from user input, defaulting to a common location"""
-        text_lower = text.lower()
+    async def process_turns():
+        nonlocal current_turn
+        while True:
+            transcript, stream, server_tts = await turn_queue.get()
+            started = time.perf_counter()
+            try:
+                current_turn = asyncio.create_task(
+                    run_complete_pipeline(transcript, stream=stream, server_tts=server_tts)
+                )
+                await asyncio.wait({current_turn})
+            finally:
+                # Cancelled turns say nothing about how long a turn takes
+                admission.finish_turn(None if current_turn.cancelled() else time.perf_counter() - started)
+            if current_turn.cancelled():
+                logging.info(f"[{session_id}] Turn cancelled: '{transcript}'")
+            current_turn = None
+
+    def drop_queued_turns():
+        while not turn_queue.empty():
+            turn_queue.get_nowait()
+            admission.finish_turn()
+
+    async def cancel_turn(reason: str):
+        """Cancel the in-flight turn and drop any queued ones"""
+        drop_queued_turns()
+        if current_turn is not None and not current_turn.done():
+            current_turn.cancel()
+            await channel.send({"type": "turn_cancelled", "reason": reason})
+
+    turn_worker = asyncio.create_task(process_turns())
+
+    async def refuse_turn(decision):
+        logging.info(f"[{session_id}] Turn refused ({decision.reason}), retry in {decision.retry_after:.1f}s")
+        await channel.send({
+            "type": "overloaded",
+            "reason": decision.reason,
+            "retry_after": round(decision.retry_after, 1),
+            "message": OVERLOADED_MESSAGES[decision.reason]
+        })
+
+    async def accept_transcript(transcript: str, stream: bool, server_tts: bool = False, admitted: bool = False) -> bool:
+        """
+        Queue a final transcript as the next turn, cancelling the one in
+        flight. admitted=True means the caller already holds the turn's
+        admission slot (spoken utterances); returns whether it was queued.
+        """
+        logging.info(f"[{session_id}] Enhanced transcript: '{transcript}'")
         
-        city_indicators = ["in ", "for ", "at ", "weather in ", "weather for ", "temperature in "]
+        if not transcript or len(transcript) < 2:
+            await channel.send({
+                "type": "error",
+                "message": "I didn't catch that. Please speak more clearly."
+            })
+            return False
         
-        for indicator in city_indicators:
-            if indicator in text_lower:
-                location_part = text.split(indicator, 1)[1].strip()
-                location = location_part.split()[0] if location_part.split() else "London"
-                return location.title()
+        if not admitted:
+            decision = admission.admit_turn(session_id)
+            if not decision.admitted:
+                # A refused barge-in leaves the answer in flight alone
+                await refuse_turn(decision)
+                return False
+        await cancel_turn("barge_in")
         
-        return "London"
+        await channel.send({"type": "ack_transcript"})
+        await channel.send({"type": "final", "text": transcript})
+        turn_queue.put_nowait((transcript, stream, server_tts))
+        return True
+
+    # Audio ingestion: binary frames land in a ring buffer allocated once per
+    # socket; the VAD cuts finished utterances out of it, trimmed of silence,
+    # and a transcription worker sends them to STT in order. Each utterance
+    # is admitted as a turn before it is queued, so STT is never spent on
+    # speech that would be refused afterwards.
+    audio_ring = None
+    audio_vad = None
+    audio_stream = False
+    audio_tts = False
+    utterance_queue = asyncio.Queue(maxsize=AUDIO_MAX_QUEUED_UTTERANCES)
+    stt_worker = None
+
+    async def send_stt_progress(status: str, details: dict):
+        await channel.send({"type": "stt_progress", "status": status, **details})
+
+    async def transcribe_utterances():
+        while True:
+            samples, sample_rate, api_key = await utterance_queue.get()
+            queued = False
+            try:
+                with STAGE_SECONDS.time("transcode"):
+                    audio = await transcoder.transcode(pcm_to_wav(samples, sample_rate))
+                record_ingest(bytes_sent_to_stt=len(audio), utterances=1, speech_seconds=len(samples) / sample_rate)
+                try:
+                    with STAGE_SECONDS.time("stt"):
+                        transcript = await stt_manager.transcribe(audio, api_key=api_key, on_progress=send_stt_progress)
+                except Exception as stt_error:
+                    logging.error(f"[{session_id}] Transcription failed: {stt_error}")
+                    await channel.send({
+                        "type": "error",
+                        "message": "Sorry, I couldn't transcribe that. Please try again."
+                    })
+                    continue
+                queued = await accept_transcript((transcript or "").strip(), audio_stream, audio_tts, admitted=True)
+            finally:
+                # A queued turn releases its slot when it finishes; anything else releases it here
+                if not queued:
+                    admission.finish_turn()
+
+    async def queue_utterance(samples):
+        """Admit a finished utterance as a turn and queue it for STT"""
+        api_key = (await get_session_api_keys_async(session_id))["assemblyai"]
+        if not api_key:
+            # Without a key STT would fall back to the placeholder and fail upstream
+            await channel.send({"type": "error", "message": "AssemblyAI API key not configured"})
+            return
+        if utterance_queue.full():
+            await refuse_turn(Decision(False, "rate_limited", admission.turn_seconds))
+            return
+        decision = admission.admit_turn(session_id)
+        if not decision.admitted:
+            await refuse_turn(decision)
+            return
+        utterance_queue.put_nowait((samples, audio_vad.sample_rate, api_key))
+
+    async def start_audio(sample_rate: int = 16000, stream: bool = False, server_tts: bool = False):
+        nonlocal audio_ring, audio_vad, audio_stream, audio_tts, stt_worker
+        capacity = int(AUDIO_BUFFER_SECONDS * sample_rate)
+        if audio_ring is None or audio_ring.capacity != capacity:
+            audio_ring = AudioRingBuffer(capacity)
+        else:
+            audio_ring.written = 0
+        audio_vad = StreamingVAD(
+            sample_rate=sample_rate,
+            end_silence_ms=AUDIO_END_SILENCE_MS,
+            max_utterance_ms=int(min(AUDIO_MAX_UTTERANCE_SECONDS, AUDIO_BUFFER_SECONDS / 2) * 1000)
+        )
+        audio_stream = stream
+        audio_tts = server_tts
+        if stt_worker is None:
+            stt_worker = asyncio.create_task(transcribe_utterances())
+        await channel.send({"type": "audio_ready", "sample_rate": sample_rate, "format": "pcm_s16le"})
+
+    async def ingest_audio(data: bytes):
+        if audio_ring is None:
+            await start_audio()
+        was_speaking = audio_vad.in_speech
+        samples = audio_ring.write(data)
+        record_ingest(bytes_received=len(data), seconds_received=samples / audio_vad.sample_rate)
+        for start, end in audio_vad.process(audio_ring):
+            await channel.send({"type": "speech_end"})
+            await queue_utterance(audio_ring.read(start, end))
+        if audio_vad.in_speech and not was_speaking:
+            await channel.send({"type": "speech_start"})
 
     # WebSocket message handling
     try:
         while True:
-            raw_message = await websocket.receive_text()
-            data = json.loads(raw_message)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                await ingest_audio(message["bytes"])
+                continue
+            data = json.loads(message["text"])
 
             if data.get("type") == "persona":
                 new_persona = data.get("persona", "default")
-                session_personas[session_id] = new_persona
+                await session_store.run(session_store.get_or_create, session_id)
+                await session_store.run(session_store.set_persona, session_id, new_persona)
                 logging.info(f"Persona updated: {new_persona}")
                 
-                await websocket.send_text(json.dumps({
+                await channel.send({
                     "type": "persona_updated",
                     "new_persona": new_persona
-                }))
+                })
 
             elif data.get("type") == "user_transcript":
-                transcript = (data.get("text") or "").strip()
-                logging.info(f"[{session_id}] Enhanced transcript: '{transcript}'")
-                
-                if not transcript or len(transcript) < 2:
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "I didn't catch that. Please speak more clearly."
-                    }))
-                    continue
-                
-                await websocket.send_text(json.dumps({"type": "ack_transcript"}))
-                await websocket.send_text(json.dumps({"type": "final", "text": transcript}))
-                
-                await run_complete_pipeline(transcript)
+                await accept_transcript(
+                    (data.get("text") or "").strip(), bool(data.get("stream")), data.get("tts") == "server"
+                )
+
+            elif data.get("type") == "partial_transcript":
+                speculation.observe((data.get("text") or "").strip())
+
+            elif data.get("type") == "audio_start":
+                await start_audio(
+                    int(data.get("sample_rate") or 16000), bool(data.get("stream")), data.get("tts") == "server"
+                )
+
+            elif data.get("type") == "audio_stop":
+                if audio_vad is not None:
+                    utterance = audio_vad.flush(audio_ring)
+                    if utterance:
+                        await channel.send({"type": "speech_end"})
+                        await queue_utterance(audio_ring.read(*utterance))
+
+            elif data.get("type") == "interrupt":
+                await cancel_turn("interrupt")
 
     except WebSocketDisconnect:
         logging.info(f"WebSocket disconnected: {session_id}")
@@ -719,14 +1611,20 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         logging.error(f"WebSocket error: {ws_error}")
     finally:
         # Cleanup
-        if session_id in chat_histories:
-            del chat_histories[session_id]
-        if session_id in session_personas:
-            del session_personas[session_id]
-        if session_id in session_metadata:
-            del session_metadata[session_id]
-        if session_id in session_api_keys:
-            del session_api_keys[session_id]
+        turn_worker.cancel()
+        if stt_worker is not None:
+            stt_worker.cancel()
+        if current_turn is not None:
+            current_turn.cancel()
+        drop_queued_turns()
+        while not utterance_queue.empty():
+            utterance_queue.get_nowait()
+            admission.finish_turn()
+        admission.forget_session(session_id)
+        speculation.cancel()
+        await session_store.run(session_store.disconnect, session_id)
+        await session_store.run(session_store.remove, session_id)
+        ACTIVE_WEBSOCKETS.dec()
 
 @app.get("/health")
 async def health_check():
@@ -735,9 +1633,112 @@ async def health_check():
         "status": "healthy",
         "version": "2.0.0",
         "features": ["weather", "news", "search", "time", "system", "chat"],
+        "sessions": await session_store.run(session_store.stats),
+        "context": context_window.stats(),
+        "gemini_pool": gemini_pool.stats(),
+        "http_pool": get_pool_stats(),
+        "audio": get_ingest_stats(),
+        "stt": stt_manager.stats(),
+        "transcode": transcoder.stats(),
+        "protocol": get_protocol_stats(),
+        "tts": get_tts_stats(),
+        "tts_cache": await run_blocking(tts_cache.stats),
+        "uploads": upload_spool.stats(),
+        "gazetteer": gazetteer.stats(),
+        "speculation": get_speculation_stats(),
+        "upstreams": get_upstream_stats(),
+        "admission": admission.stats(),
+        "telemetry": telemetry.stats(),
+        "caches": {
+            "weather": weather_cache.stats(),
+            "search": search_cache.stats(),
+            "news": news_cache.stats()
+        },
         "timestamp": datetime.now().isoformat()
     })
 
+# Everything /health reports is also exported as gauges, read at scrape time
+for _section, _stats in {
+    "sessions": session_store.stats,
+    "context": context_window.stats,
+    "gemini_pool": gemini_pool.stats,
+    "audio": get_ingest_stats,
+    "stt": stt_manager.stats,
+    "transcode": transcoder.stats,
+    "protocol": get_protocol_stats,
+    "tts": get_tts_stats,
+    "tts_cache": tts_cache.stats,
+    "uploads": upload_spool.stats,
+    "gazetteer": gazetteer.stats,
+    "speculation": get_speculation_stats,
+    "upstreams": get_upstream_stats,
+    "admission": admission.stats,
+    "telemetry": telemetry.stats,
+    "weather_cache": weather_cache.stats,
+    "search_cache": search_cache.stats,
+    "news_cache": news_cache.stats,
+}.items():
+    StatsCollector(f"voice_{_section}", _stats)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of the counters, gauges and histograms above"""
+    body = await run_blocking(render_metrics)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    session_store.start_sweeper()
+    upload_spool.start_gc()
+    telemetry.start_sampler()
+
+@app.on_event("shutdown")
+async def shutdown_http_pool():
+    await session_store.stop_sweeper()
+    await upload_spool.stop_gc()
+    await telemetry.stop_sampler()
+    transcoder.close()
+    close_http_pool()
+
+def warm_tts_cache(api_key: str, parallel: int = 3) -> int:
+    """
+    Pre-renders every persona greeting (for each combination of configured
+    API keys) and the fixed replies into the TTS cache. Text is split the
+    way SentenceTTSPipeline splits it, so the cache keys match. Returns the
+    number of sentences synthesized.
+    """
+    texts = [CHAT_FALLBACK_REPLY, NO_GEMINI_KEY_REPLY, LLM_ERROR_REPLY]
+    for persona in PERSONA_PROMPTS:
+        for count in range(len(API_KEY_NAMES) + 1):
+            for configured_keys in itertools.combinations(API_KEY_NAMES, count):
+                texts.append(build_greeting(persona, configured_keys))
+    sentences = list(dict.fromkeys(sentence for text in texts for sentence in speech_sentences(text)))
+    missing = [s for s in sentences if tts_cache.lookup(s, GEMINI_TTS_VOICE, GEMINI_TTS_MODEL) is None]
+    logging.info(f"TTS cache warm-up: {len(sentences)} sentences, {len(missing)} to synthesize")
+
+    rendered = 0
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = {
+            pool.submit(tts_cache.store, s, GEMINI_TTS_VOICE, GEMINI_TTS_MODEL, synthesize_stream(s, api_key)): s
+            for s in missing
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+                rendered += 1
+            except Exception as e:
+                logging.warning(f"TTS cache warm-up failed for {futures[future]!r}: {e}")
+    return rendered
+
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["warm-tts-cache"]:
+        # python main.py warm-tts-cache  (uses GEMINI_API_KEY)
+        logging.basicConfig(level=logging.INFO)
+        if not DEFAULT_API_KEYS["gemini"]:
+            sys.exit("GEMINI_API_KEY is required to warm the TTS cache")
+        rendered = warm_tts_cache(DEFAULT_API_KEYS["gemini"])
+        print(f"Rendered {rendered} sentences; cache: {tts_cache.stats()}")
+        sys.exit(0)
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
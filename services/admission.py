@@ -0,0 +1,196 @@
+import os
+import math
+import time
+import random
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from services.metrics import Counter
+
+# --- Configuration ---
+# Session creation is rate limited per client IP and turns per session,
+# each with a token bucket (RATE tokens a second, bursts of up to BURST).
+# Turns admitted but not yet finished, queued ones included, are capped
+# process-wide at ADMISSION_MAX_INFLIGHT; past that, new sessions get a
+# 503 and new turns an "overloaded" message, both with a retry delay.
+# Speculative skill starts (from interim transcripts) have a bucket of
+# their own per session, with the turn rate and burst, and stop once the
+# turns in flight reach ADMISSION_SPECULATION_SHARE of the cap.
+ADMISSION_IP_RATE = float(os.getenv("ADMISSION_IP_RATE", "0.5"))
+ADMISSION_IP_BURST = float(os.getenv("ADMISSION_IP_BURST", "10"))
+ADMISSION_TURN_RATE = float(os.getenv("ADMISSION_TURN_RATE", "1"))
+ADMISSION_TURN_BURST = float(os.getenv("ADMISSION_TURN_BURST", "5"))
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+ADMISSION_SPECULATION_SHARE = float(os.getenv("ADMISSION_SPECULATION_SHARE", "0.75"))
+# X-Forwarded-For names the client only behind a proxy that sets it
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+MAX_BUCKETS = 10000  # Per scope; the least recently used are dropped beyond this
+
+ADMISSION_REJECTED = Counter(
+    "voice_admission_rejected_total", "Sessions and turns turned away by admission control", ["scope", "reason"]
+)
+
+
+class Decision(NamedTuple):
+    admitted: bool
+    reason: str = ""  # "rate_limited" or "overloaded" when refused
+    retry_after: float = 0.0  # Seconds
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+ADMITTED = Decision(True)
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Takes a token; returns 0, or the seconds until one is available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else math.inf
+
+
+class _Buckets:
+    """Token buckets by key (client IP, session id), least recently used first."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(self.rate, self.burst, now)
+
+    def discard(self, key: str):
+        self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """
+    Decides whether a new session, turn or speculative skill call may
+    start. admit_session(), admit_turn() and admit_speculation() return a
+    Decision; an admitted turn holds one of the max_inflight slots until
+    finish_turn(). The retry delay for a full process is one to two times
+    the recent average turn time.
+    """
+
+    def __init__(self, ip_rate: float = ADMISSION_IP_RATE, ip_burst: float = ADMISSION_IP_BURST,
+                 turn_rate: float = ADMISSION_TURN_RATE, turn_burst: float = ADMISSION_TURN_BURST,
+                 max_inflight: int = ADMISSION_MAX_INFLIGHT, speculation_share: float = ADMISSION_SPECULATION_SHARE):
+        self.max_inflight = max_inflight
+        self.speculation_share = speculation_share
+        self._ips = _Buckets(ip_rate, ip_burst)
+        self._sessions = _Buckets(turn_rate, turn_burst)
+        self._speculations = _Buckets(turn_rate, turn_burst)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.turn_seconds = 1.0  # Moving average, seeds the retry delay
+        self.admitted = {"session": 0, "turn": 0, "speculation": 0}
+        self.rejected = {"session_rate_limited": 0, "session_overloaded": 0,
+                         "turn_rate_limited": 0, "turn_overloaded": 0,
+                         "speculation_rate_limited": 0, "speculation_overloaded": 0}
+
+    def _retry_after_overload(self) -> float:
+        # About one turn's time, spread so refused clients do not all come back at once
+        return max(0.1, self.turn_seconds) * random.uniform(1.0, 2.0)
+
+    def _refuse(self, scope: str, reason: str, retry_after: float) -> Decision:
+        self.rejected[f"{scope}_{reason}"] += 1
+        ADMISSION_REJECTED.inc(scope, reason)
+        return Decision(False, reason, retry_after)
+
+    def admit_session(self, client: str) -> Decision:
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                return self._refuse("session", "overloaded", self._retry_after_overload())
+            wait = self._ips.take(client, time.monotonic())
+            if wait:
+                return self._refuse("session", "rate_limited", wait)
+            self.admitted["session"] += 1
+            return ADMITTED
+
+    def admit_turn(self, session_id: str) -> Decision:
+        with self._lock:
+            wait = self._sessions.take(session_id, time.monotonic())
+            if wait:
+                return self._refuse("turn", "rate_limited", wait)
+            if self.inflight >= self.max_inflight:
+                return self._refuse("turn", "overloaded", self._retry_after_overload())
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            self.admitted["turn"] += 1
+            return ADMITTED
+
+    def admit_speculation(self, session_id: str) -> Decision:
+        """A speculative start holds no slot; it is only refused early, before real turns are."""
+        with self._lock:
+            if self.inflight >= self.max_inflight * self.speculation_share:
+                return self._refuse("speculation", "overloaded", self._retry_after_overload())
+            wait = self._speculations.take(session_id, time.monotonic())
+            if wait:
+                return self._refuse("speculation", "rate_limited", wait)
+            self.admitted["speculation"] += 1
+            return ADMITTED
+
+    def finish_turn(self, seconds: float = None):
+        """Frees an admitted turn's slot; seconds (when it ran) feeds the retry delay."""
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            if seconds is not None:
+                self.turn_seconds += 0.1 * (seconds - self.turn_seconds)
+
+    def forget_session(self, session_id: str):
+        with self._lock:
+            self._sessions.discard(session_id)
+            self._speculations.discard(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "inflight": self.inflight,
+                "max_inflight": self.max_inflight,
+                "speculation_share": self.speculation_share,
+                "peak_inflight": self.peak_inflight,
+                "avg_turn_s": round(self.turn_seconds, 3),
+                "ip_rate": self._ips.rate,
+                "ip_burst": self._ips.burst,
+                "turn_rate": self._sessions.rate,
+                "turn_burst": self._sessions.burst,
+                "tracked_ips": len(self._ips),
+                "tracked_sessions": len(self._sessions),
+                "admitted": dict(self.admitted),
+                "rejected": dict(self.rejected),
+            }
+
+
+def client_address(headers, client) -> str:
+    """The caller's IP: the connection's peer, or X-Forwarded-For's first hop if trusted."""
+    if ADMISSION_TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return client.host if client is not None else "unknown"
@@ -0,0 +1,242 @@
+import io
+import wave
+import threading
+from typing import List, Tuple
+
+import numpy as np
+
+# --- Configuration ---
+# Binary websocket audio is 16-bit little-endian mono PCM.
+DEFAULT_SAMPLE_RATE = 16000
+
+_stats_lock = threading.Lock()
+INGEST_STATS = {
+    "bytes_received": 0,
+    "bytes_sent_to_stt": 0,
+    "utterances": 0,
+    "seconds_received": 0.0,
+    "speech_seconds": 0.0,
+}
+
+
+def record_ingest(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            INGEST_STATS[key] += value
+
+
+def get_ingest_stats() -> dict:
+    with _stats_lock:
+        stats = dict(INGEST_STATS)
+    received = stats["bytes_received"]
+    stats["seconds_received"] = round(stats["seconds_received"], 2)
+    stats["speech_seconds"] = round(stats["speech_seconds"], 2)
+    stats["upload_reduction"] = round(1 - stats["bytes_sent_to_stt"] / received, 3) if received else 0.0
+    return stats
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size int16 ring buffer, allocated once per audio session. Positions
+    are absolute sample counts since the start of the stream, so readers can
+    keep offsets across wrap-arounds; only the last `capacity` samples are
+    retained.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=np.int16)
+        self._odd_byte = b""
+        self.written = 0
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.written - self.capacity)
+
+    def write(self, data: bytes) -> int:
+        """Appends little-endian PCM bytes; returns the number of samples written."""
+        if self._odd_byte:
+            data = self._odd_byte + data
+            self._odd_byte = b""
+        if len(data) % 2:
+            self._odd_byte = data[-1:]
+            data = data[:-1]
+        samples = np.frombuffer(data, dtype="<i2")
+        count = len(samples)
+        if count > self.capacity:
+            self.written += count - self.capacity
+            samples = samples[-self.capacity:]
+        n = len(samples)
+        pos = self.written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._buffer[pos:pos + first] = samples[:first]
+        self._buffer[:n - first] = samples[first:]
+        self.written += n
+        return count
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Returns a copy of samples [start, end) (clamped to what is still buffered)."""
+        start = max(start, self.oldest)
+        end = min(end, self.written)
+        if end <= start:
+            return np.zeros(0, dtype=np.int16)
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            return self._buffer[a:b].copy()
+        return np.concatenate((self._buffer[a:], self._buffer[:b - self.capacity]))
+
+
+def frame_dbfs(samples: np.ndarray, frame_len: int) -> np.ndarray:
+    """Per-frame RMS level in dBFS for all whole frames in samples (vectorized)."""
+    frames = len(samples) // frame_len
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    x = samples[:frames * frame_len].astype(np.float32).reshape(frames, frame_len)
+    rms = np.sqrt(np.mean(x * x, axis=1))
+    return 20.0 * np.log10(rms / 32768.0 + 1e-10)
+
+
+def find_utterances(samples: np.ndarray, sample_rate: int = DEFAULT_SAMPLE_RATE, frame_ms: int = 30,
+                    margin_db: float = 12.0, min_db: float = -50.0, min_silence_ms: int = 500,
+                    min_speech_ms: int = 150, padding_ms: int = 150) -> List[Tuple[int, int]]:
+    """
+    Offline energy VAD: returns (start, end) sample ranges of speech, with
+    gaps shorter than min_silence_ms merged and padding_ms kept on each side.
+    The threshold adapts to the recording's own noise floor.
+    """
+    frame_len = sample_rate * frame_ms // 1000
+    db = frame_dbfs(samples, frame_len)
+    if len(db) == 0:
+        return []
+    threshold = max(min_db, float(np.percentile(db, 10)) + margin_db)
+    speech = db > threshold
+    if not speech.any():
+        return []
+
+    # Run boundaries: +1 where speech starts, -1 where it ends
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Merge runs separated by short silences
+    gap_frames = max(1, min_silence_ms // frame_ms)
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= gap_frames))
+    starts = starts[keep]
+    ends = np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+
+    long_enough = (ends - starts) * frame_ms >= min_speech_ms
+    pad = padding_ms * sample_rate // 1000
+    total = len(samples)
+    return [
+        (max(0, int(s) * frame_len - pad), min(total, int(e) * frame_len + pad))
+        for s, e in zip(starts[long_enough], ends[long_enough])
+    ]
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int = DEFAULT_SAMPLE_RATE, **vad_options) -> np.ndarray:
+    """Drops leading and trailing silence; returns an empty array if there is no speech."""
+    segments = find_utterances(samples, sample_rate, **vad_options)
+    if not segments:
+        return samples[:0]
+    return samples[segments[0][0]:segments[-1][1]]
+
+
+class StreamingVAD:
+    """
+    Incremental energy VAD over an AudioRingBuffer. Each process() call scores
+    the whole frames that arrived since the last call in one vectorized pass,
+    tracks the background noise floor, and returns the (start, end) absolute
+    sample ranges of utterances that have ended (speech followed by
+    end_silence_ms of silence), already trimmed to padding_ms of silence.
+    """
+
+    def __init__(self, sample_rate: int = DEFAULT_SAMPLE_RATE, frame_ms: int = 30, margin_db: float = 12.0,
+                 min_db: float = -50.0, end_silence_ms: int = 700, min_speech_ms: int = 200,
+                 padding_ms: int = 150, max_utterance_ms: int = 15000):
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.end_silence_frames = max(1, end_silence_ms // frame_ms)
+        self.min_speech_samples = min_speech_ms * sample_rate // 1000
+        self.padding = padding_ms * sample_rate // 1000
+        self.max_utterance = max_utterance_ms * sample_rate // 1000
+        self.position = 0
+        self.noise_db = None
+        self.speech_start = None
+        self.speech_end = None
+        self.silent_frames = 0
+
+    @property
+    def in_speech(self) -> bool:
+        return self.speech_start is not None
+
+    def process(self, ring: AudioRingBuffer) -> List[Tuple[int, int]]:
+        self.position = max(self.position, ring.oldest)
+        frames = (ring.written - self.position) // self.frame_len
+        if frames <= 0:
+            return []
+        base = self.position
+        db = frame_dbfs(ring.read(base, base + frames * self.frame_len), self.frame_len)
+        self.position += frames * self.frame_len
+
+        if self.noise_db is None:
+            self.noise_db = float(db.min())
+        speech = db > max(self.min_db, self.noise_db + self.margin_db)
+
+        # Noise floor follows the non-speech frames: drops at once, rises slowly
+        quiet = db[~speech]
+        if len(quiet):
+            floor = float(quiet.min())
+            if floor < self.noise_db:
+                self.noise_db = floor
+            else:
+                self.noise_db += 0.05 * (floor - self.noise_db)
+
+        utterances = []
+        if self.speech_start is None and not speech.any():
+            return utterances  # Nothing but background noise in this chunk
+        for i, is_speech in enumerate(speech):
+            frame_start = base + i * self.frame_len
+            if is_speech:
+                if self.speech_start is None:
+                    self.speech_start = frame_start
+                self.speech_end = frame_start + self.frame_len
+                self.silent_frames = 0
+            elif self.speech_start is not None:
+                self.silent_frames += 1
+
+            if self.speech_start is not None and (
+                self.silent_frames >= self.end_silence_frames
+                or frame_start + self.frame_len - self.speech_start >= self.max_utterance
+            ):
+                utterance = self._close(ring)
+                if utterance:
+                    utterances.append(utterance)
+        return utterances
+
+    def flush(self, ring: AudioRingBuffer):
+        """Closes any utterance still in progress (e.g. when the client stops streaming)."""
+        if self.speech_start is None:
+            return None
+        return self._close(ring)
+
+    def _close(self, ring: AudioRingBuffer):
+        start, end = self.speech_start, self.speech_end
+        self.speech_start = self.speech_end = None
+        self.silent_frames = 0
+        if end - start < self.min_speech_samples:
+            return None
+        return max(ring.oldest, start - self.padding), min(ring.written, end + self.padding)
+
+
+def pcm_to_wav(samples: np.ndarray, sample_rate: int = DEFAULT_SAMPLE_RATE) -> bytes:
+    """Wraps int16 mono samples in a WAV container for upload to STT."""
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return out.getvalue()
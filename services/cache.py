@@ -0,0 +1,164 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from services.http_pool import get_executor
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    function, everyone who arrives while it is in flight waits for and
+    shares its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = Future()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with a time-to-live, bounded size (LRU
+    eviction) and stale-while-revalidate: an entry past its TTL but still
+    within stale_ttl is returned at once while a background refresh runs.
+    Concurrent misses for the same key share a single loader call.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 300.0, stale_ttl: float = 0.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._refreshing = set()
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def get(self, key):
+        """Returns (value, is_fresh) or (None, False) when nothing usable is cached."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None, False
+            value, stored_at = entry
+            age = now - stored_at
+            if age <= self.ttl:
+                self._data.move_to_end(key)
+                return value, True
+            if age <= self.ttl + self.stale_ttl:
+                self._data.move_to_end(key)
+                return value, False
+            del self._data[key]
+            return None, False
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, cacheable=lambda value: True):
+        """
+        Returns the cached value for key, calling loader() on a miss.
+        Stale entries are served immediately and refreshed in the background.
+        Only values for which cacheable(value) is true are stored.
+        """
+        value, fresh = self.get(key)
+        if value is not None:
+            with self._lock:
+                if fresh:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+            if not fresh:
+                self._refresh_in_background(key, loader, cacheable)
+            return value
+
+        def load():
+            with self._lock:
+                self.misses += 1
+            value = loader()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+
+        return self._flights.do(key, load)
+
+    def _refresh_in_background(self, key, loader, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+
+        def refresh():
+            try:
+                value = loader()
+                if cacheable(value):
+                    self.set(key, value)
+            except Exception as e:
+                logging.warning(f"Background refresh failed for {self.name} cache: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        get_executor().submit(refresh)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self.hits + self.stale_hits + self._flights.coalesced
+            lookups = served + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "background_refreshes": self.refreshes,
+                "coalesced": self._flights.coalesced,
+                "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+            }
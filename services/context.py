@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+# Summarizer signature: (previous_summary, turns_to_fold) -> new summary text
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+# Persists a fold: (start, count, new_summary) -> None
+FoldWriter = Callable[[int, int, str], Awaitable[None]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def turn_text(turn: dict) -> str:
+    return " ".join(part.get("text", "") for part in turn.get("parts", ()))
+
+
+def extractive_summary(previous_summary: str, turns: List[dict], max_chars: int = 1500) -> str:
+    """
+    Fallback summary used when no LLM is available: keeps the first sentence
+    of every folded turn, newest last, trimmed to max_chars.
+    """
+    lines = [previous_summary] if previous_summary else []
+    for turn in turns:
+        text = " ".join(turn_text(turn).split())
+        first = text.split(". ")[0][:200]
+        if first:
+            speaker = "User" if turn.get("role") == "user" else "Assistant"
+            lines.append(f"{speaker}: {first}")
+    summary = "\n".join(lines)
+    return summary[-max_chars:]
+
+
+class ContextWindow:
+    """
+    Decides what part of a session's history is sent to the LLM.
+
+    The first pinned_turns entries (persona system prompt and greeting) are
+    always sent, followed by a compact summary of older turns and then the
+    most recent turns verbatim, capped at max_tokens. Once more than
+    fold_threshold entries sit beyond the recent window, they are folded into
+    the summary by a background task and dropped from the stored history,
+    so the per-turn request size stays flat however long the conversation
+    runs.
+    """
+
+    def __init__(self, recent_turns: int = 12, max_tokens: int = 4000, fold_threshold: int = 8,
+                 summary_max_chars: int = 1500, pinned_turns: int = 2):
+        self.recent_turns = recent_turns
+        self.max_tokens = max_tokens
+        self.fold_threshold = fold_threshold
+        self.summary_max_chars = summary_max_chars
+        self.pinned_turns = pinned_turns
+        self._folding = {}  # session_id -> asyncio.Task
+        self.folds = 0
+        self.turns_folded = 0
+
+    def build(self, history: List[dict], summary: str) -> List[dict]:
+        """Returns the history list to send to the model for this turn."""
+        pinned = history[:self.pinned_turns]
+        rest = history[self.pinned_turns:]
+
+        budget = self.max_tokens - sum(estimate_tokens(turn_text(turn)) for turn in pinned)
+        summary_turns = []
+        if summary:
+            summary_turns = [
+                {"role": "user", "parts": [{"text": f"Summary of our earlier conversation:\n{summary}"}]},
+                {"role": "model", "parts": [{"text": "Thanks, I'll keep that context in mind."}]},
+            ]
+            budget -= estimate_tokens(summary)
+
+        # Newest turns first until the window or token budget runs out,
+        # always keeping at least the latest turn.
+        recent = []
+        for turn in reversed(rest[-self.recent_turns:]):
+            cost = estimate_tokens(turn_text(turn))
+            if recent and cost > budget:
+                break
+            recent.append(turn)
+            budget -= cost
+        recent.reverse()
+
+        # Gemini expects the conversation to resume on a user turn
+        while len(recent) > 1 and recent[0].get("role") != "user":
+            recent.pop(0)
+
+        return pinned + summary_turns + recent
+
+    def overflow(self, history: List[dict]) -> int:
+        """Number of history entries older than the recent window."""
+        return max(0, len(history) - self.pinned_turns - self.recent_turns)
+
+    def maybe_fold(self, session_id: str, history: List[dict], summary: str,
+                   summarize: Summarizer, write: FoldWriter):
+        """
+        Schedules a background fold if enough old turns have piled up.
+        history/summary are the session's state after the current turn;
+        write() persists the result once the summary is ready.
+        """
+        if self.overflow(history) < self.fold_threshold:
+            return
+        task = self._folding.get(session_id)
+        if task is not None and not task.done():
+            return
+        self._folding[session_id] = asyncio.get_running_loop().create_task(
+            self._fold(session_id, list(history), summary, summarize, write)
+        )
+
+    async def _fold(self, session_id: str, history: List[dict], summary: str,
+                    summarize: Summarizer, write: FoldWriter):
+        try:
+            count = self.overflow(history)
+            # Fold whole user/model exchanges only
+            count -= count % 2
+            if count <= 0:
+                return
+            start = self.pinned_turns
+            turns = history[start:start + count]
+            try:
+                new_summary = await summarize(summary, turns)
+            except Exception as e:
+                logging.warning(f"Summarization failed for {session_id}, using extractive summary: {e}")
+                new_summary = ""
+            if not new_summary:
+                new_summary = extractive_summary(summary, turns, self.summary_max_chars)
+
+            # History only grows at the end, so the folded turns are still in place
+            await write(start, count, new_summary[:self.summary_max_chars])
+            self.folds += 1
+            self.turns_folded += count
+            logging.info(f"Folded {count} turns into summary for {session_id}")
+        except Exception as e:
+            logging.error(f"History fold failed for {session_id}: {e}")
+        finally:
+            self._folding.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "recent_turns": self.recent_turns,
+            "max_tokens": self.max_tokens,
+            "folds": self.folds,
+            "turns_folded": self.turns_folded,
+            "folds_in_progress": len(self._folding),
+        }
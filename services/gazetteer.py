@@ -0,0 +1,246 @@
+import re
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import NamedTuple, Optional
+
+# --- Configuration ---
+# A place named right after one of these words ("weather in New York") wins
+# over any other place in the utterance. Elsewhere a one-word name counts
+# only if it is not an everyday word ("is it nice out" is not about Nice)
+# and the place has at least MIN_BARE_POPULATION people, which keeps the
+# villages of a full GeoNames export from matching ordinary words.
+LOCATION_PREPOSITIONS = frozenset({"in", "for", "at", "near", "around", "from"})
+COMMON_WORD_PLACES = frozenset({
+    "nice", "bath", "york", "reading", "mobile", "split", "buffalo", "phoenix", "columbus", "kingston",
+    "salvador", "medina", "cali", "rio", "goa", "la", "dc", "sf", "kl"
+})
+MIN_BARE_POPULATION = 100000
+# GeoNames exports list dozens of alternate names per city (every language,
+# airport codes); only the name and its ASCII form are indexed from those.
+GEONAMES_COLUMNS = 19
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ALPHABET = b"0123456789abcdefghijklmnopqrstuvwxyz"  # Byte order, as the names sort
+_RANK = {c: i for i, c in enumerate(_ALPHABET)}
+
+
+def _bucket(key: bytes) -> int:
+    """Slot of a name's first two characters in the bucket table (names sort by it)."""
+    second = _RANK[key[1]] + 1 if len(key) > 1 and key[1] in _RANK else 0
+    return _RANK[key[0]] * (len(_ALPHABET) + 1) + second
+
+
+def normalize_place(text: str) -> str:
+    """Lower-case ASCII words: "São Paulo" and "sao paulo" index the same."""
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(_WORD.findall(folded))
+
+
+class Place(NamedTuple):
+    name: str
+    country: str
+    lat: float
+    lon: float
+    population: int
+
+    @property
+    def label(self) -> str:
+        """"Name, CC", which lookup() resolves back to this place."""
+        return f"{self.name}, {self.country}"
+
+
+class _PackedStrings:
+    """Sequence of byte strings stored back to back in one blob, append-only."""
+
+    __slots__ = ("blob", "offsets")
+
+    def __init__(self, items=()):
+        self.blob = bytearray()
+        self.offsets = array("I", [0])
+        for item in items:
+            self.append(item)
+
+    def append(self, item: bytes):
+        self.blob += item
+        self.offsets.append(len(self.blob))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blob) + self.offsets.itemsize * len(self.offsets)
+
+
+class Gazetteer:
+    """
+    Offline city index loaded on first use from a tab-separated file (the
+    bundled data/cities.tsv, or a GeoNames cities*.txt export). Places are
+    kept as parallel arrays (coordinates, population, country codes, packed
+    names) and every normalized name and alternate name in one sorted packed
+    table with a parallel array of place ids, so a lookup is a binary search
+    (within the names sharing its first two characters) and the index costs
+    a few dozen bytes per name instead of a dict of objects. Equal names sort most populous first, which settles ambiguous
+    ones ("Paris" is Paris, FR unless asked for "Paris Texas").
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.load_seconds = 0.0
+        self.lookups = 0
+        self.hits = 0
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            names, countries = _PackedStrings(), bytearray()
+            lat, lon, population = array("f"), array("f"), array("I")
+            # Sort records: name, NUL, population (inverted, so larger first), place id
+            records = []
+            try:
+                with open(self.path, encoding="utf-8") as source:
+                    for line in source:
+                        if line.startswith("#") or not line.strip():
+                            continue
+                        cols = line.rstrip("\n").split("\t")
+                        if len(cols) >= GEONAMES_COLUMNS:
+                            name, aliases = cols[1], [cols[2]]
+                            country, latitude, longitude, people = cols[8], cols[4], cols[5], cols[14]
+                        else:
+                            name, country, latitude, longitude, people = cols[:5]
+                            aliases = cols[5].split(",") if len(cols) > 5 else []
+                        place_id = len(names)
+                        names.append(name.encode("utf-8"))
+                        countries += country.upper()[:2].ljust(2).encode("ascii")
+                        lat.append(float(latitude))
+                        lon.append(float(longitude))
+                        population.append(min(int(people or 0), 0xFFFFFFFF))
+                        suffix = b"\0" + (0xFFFFFFFF - population[-1]).to_bytes(4, "big") + place_id.to_bytes(4, "big")
+                        for key in {normalize_place(alias) for alias in [name, *aliases]}:
+                            if key:
+                                records.append(key.encode("ascii") + suffix)
+            except OSError as e:
+                logging.warning(f"Gazetteer unavailable ({e}); locations will be sent to OpenWeather by name")
+            records.sort()
+            self._names, self._countries = names, bytes(countries)
+            self._lat, self._lon, self._population = lat, lon, population
+            self._keys, self._ids = _PackedStrings(), array("I")
+            # _starts[b] is the first name in bucket b or later, so bucket b is _starts[b]:_starts[b + 1]
+            self._starts = array("I", [0]) * (len(_ALPHABET) * (len(_ALPHABET) + 1) + 1)
+            self._max_words = bucket = 0
+            for index, record in enumerate(records):
+                key = record[:-9]
+                self._keys.append(key)
+                self._ids.append(int.from_bytes(record[-4:], "big"))
+                self._max_words = max(self._max_words, key.count(b" ") + 1)
+                for later in range(bucket + 1, _bucket(key) + 1):
+                    self._starts[later] = index
+                bucket = max(bucket, _bucket(key))
+            for later in range(bucket + 1, len(self._starts)):
+                self._starts[later] = len(records)
+            records.clear()
+            self.load_seconds = time.perf_counter() - started
+            self._loaded = True
+            logging.info(f"Gazetteer: {len(names)} places, {len(self._keys)} names loaded in {self.load_seconds * 1000:.0f} ms")
+
+    def _place(self, place_id: int) -> Place:
+        return Place(
+            self._names[place_id].decode("utf-8"),
+            self._countries[place_id * 2:place_id * 2 + 2].decode("ascii"),
+            round(self._lat[place_id], 4),
+            round(self._lon[place_id], 4),
+            self._population[place_id],
+        )
+
+    def _first(self, key: bytes) -> int:
+        """Index of the first name >= key in the sorted table."""
+        if not key:
+            return 0
+        bucket = _bucket(key)
+        return bisect.bisect_left(self._keys, key, self._starts[bucket], self._starts[bucket + 1])
+
+    def lookup(self, name: str) -> Optional[Place]:
+        """The place called name (optionally "name, CC" to pick a country), or None."""
+        if not self._loaded:
+            self._load()
+        self.lookups += 1
+        head, _, country = name.rpartition(",")
+        country = country.strip().upper()
+        if head and len(country) == 2 and country.isalpha():
+            name, country = head, country.encode("ascii")
+        else:
+            country = b""
+        key = normalize_place(name).encode("ascii")
+        index = self._first(key)
+        while index < len(self._keys) and self._keys[index] == key:
+            place_id = self._ids[index]
+            if not country or self._countries[place_id * 2:place_id * 2 + 2] == country:
+                self.hits += 1
+                return self._place(place_id)
+            index += 1
+        return None
+
+    def find(self, text: str) -> Optional[Place]:
+        """
+        The place an utterance is about: the longest place name starting at
+        each word, preferring one right after a preposition, then the most
+        populous. None if the utterance names no known place.
+        """
+        if not self._loaded:
+            self._load()
+        self.lookups += 1
+        words = normalize_place(text).split()
+        keys, ids = self._keys, self._ids
+        best = None  # ((after a preposition, population), place id)
+        i = 0
+        while i < len(words):
+            found = None
+            key = b""
+            for n in range(1, min(self._max_words, len(words) - i) + 1):
+                key = (key + b" " if key else b"") + words[i + n - 1].encode("ascii")
+                index = self._first(key)
+                if index == len(keys) or not keys[index].startswith(key):
+                    break  # No name starts with these words
+                if keys[index] == key:
+                    found = (ids[index], n)
+            if found is None:
+                i += 1
+                continue
+            place_id, n = found
+            after_preposition = i > 0 and words[i - 1] in LOCATION_PREPOSITIONS
+            if n > 1 or after_preposition or (
+                words[i] not in COMMON_WORD_PLACES and self._population[place_id] >= MIN_BARE_POPULATION
+            ):
+                rank = (after_preposition, self._population[place_id])
+                if best is None or rank > best[0]:
+                    best = (rank, place_id)
+            i += n
+        if best is None:
+            return None
+        self.hits += 1
+        return self._place(best[1])
+
+    def stats(self) -> dict:
+        if not self._loaded:
+            return {"loaded": False, "lookups": self.lookups, "hits": self.hits}
+        return {
+            "loaded": True,
+            "places": len(self._names),
+            "names": len(self._keys),
+            "index_bytes": (self._keys.nbytes + self._names.nbytes + len(self._countries)
+                            + sum(a.itemsize * len(a) for a in (self._ids, self._starts, self._lat, self._lon, self._population))),
+            "load_ms": round(self.load_seconds * 1000, 1),
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
@@ -0,0 +1,143 @@
+import os
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import Counter, Histogram
+
+# --- Configuration ---
+# One keep-alive pool is kept per upstream host (OpenWeather, Tavily, ...).
+# HTTP_POOL_MAXSIZE caps the idle connections kept per host and
+# SKILL_WORKER_THREADS caps how many blocking calls run off the event loop at once.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() in ("1", "true", "yes")
+SKILL_WORKER_THREADS = int(os.getenv("SKILL_WORKER_THREADS", "64"))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+UPSTREAM_RESPONSES = Counter(
+    "voice_upstream_responses_total", "Upstream HTTP responses by host and status code", ["upstream", "status"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "voice_upstream_seconds", "Time from sending an upstream request to its response headers", ["upstream"]
+)
+
+
+def _record_response(response, *args, **kwargs):
+    host = urlsplit(response.url).netloc
+    UPSTREAM_RESPONSES.inc(host, str(response.status_code))
+    UPSTREAM_SECONDS.observe(response.elapsed.total_seconds(), host)
+
+
+def get_http_session(url: str) -> requests.Session:
+    """
+    Returns the shared keep-alive session for the host of the given URL,
+    creating it (and its connection pool) on first use.
+    """
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.hooks["response"].append(_record_response)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=HTTP_POOL_BLOCK)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+            logging.info(f"Created HTTP pool for {host} (maxsize={HTTP_POOL_MAXSIZE})")
+    return session
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the shared thread pool used for blocking upstream calls."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=SKILL_WORKER_THREADS, thread_name_prefix="skill")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a synchronous function on the skill thread pool so the event loop
+    stays free to serve other websockets while it waits on the network.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def iterate_blocking(make_iterator, *args, **kwargs):
+    """
+    Drives a blocking iterator (e.g. a streamed SDK response) on the skill
+    thread pool and yields its items on the event loop as they arrive.
+    Stopping the async iteration early also stops the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
+
+    def deliver(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            stop.set()  # Event loop already closed
+
+    def pump():
+        try:
+            for item in make_iterator(*args, **kwargs):
+                if stop.is_set():
+                    return
+                deliver(item)
+        except Exception as e:
+            deliver(finished, e)
+        else:
+            deliver(finished)
+
+    loop.run_in_executor(get_executor(), pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is finished:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def get_pool_stats() -> dict:
+    """Returns a small snapshot of the HTTP pools and worker threads."""
+    return {
+        "hosts": sorted(_sessions.keys()),
+        "pool_maxsize": HTTP_POOL_MAXSIZE,
+        "worker_threads": SKILL_WORKER_THREADS,
+    }
+
+
+def close_http_pool():
+    """Closes all pooled sessions and stops the worker threads."""
+    global _executor
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
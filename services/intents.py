@@ -0,0 +1,256 @@
+import re
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class Intent(NamedTuple):
+    name: str
+    phrases: tuple
+    priority: int
+    handler: Optional[Callable]
+    fallback: Optional[Callable] = None
+    deadline: Optional[float] = None
+    prefetch_key: Optional[Callable] = None
+
+
+class IntentMatch(NamedTuple):
+    intent: Intent
+    phrase: str
+    start: int
+    end: int
+
+    @property
+    def name(self) -> str:
+        return self.intent.name
+
+    @property
+    def handler(self) -> Optional[Callable]:
+        return self.intent.handler
+
+
+class SkillOutcome(NamedTuple):
+    """One skill invocation: its reply, the raw result, and how it ended (ok, deadline or error)."""
+    match: IntentMatch
+    text: str
+    result: Any
+    status: str
+    seconds: float
+
+    @property
+    def name(self) -> str:
+        return self.match.name
+
+
+class IntentRouter:
+    """
+    Routes an utterance to a registered skill. All trigger phrases are
+    compiled once into a single word-level phrase table, and the utterance is
+    tokenized once and scanned for the longest phrase starting at each word.
+    Matching therefore respects word boundaries ("today" no longer hits
+    "day") and costs O(words x longest phrase) however many skills and
+    phrases are registered. When several intents match, the lowest priority
+    number wins (ties go to the earliest match in the utterance).
+
+    Compound utterances ("weather in Tokyo and the latest tech news") are
+    split into one clause per skill request by split(), and run_all() runs
+    those concurrently, each bounded by its skill's deadline.
+    """
+
+    def __init__(self, default_deadline: float = 5.0):
+        self.default_deadline = default_deadline
+        self._intents: Dict[str, Intent] = {}
+        self._phrase_index: Optional[Dict[str, Intent]] = None
+        self._max_words = 0
+        self._lock = threading.Lock()
+
+    def register(self, name: str, phrases: List[str], priority: int = 100, handler: Optional[Callable] = None,
+                 deadline: Optional[float] = None, prefetch_key: Optional[Callable] = None) -> Intent:
+        """
+        Registers (or replaces) a skill and its trigger phrases. prefetch_key,
+        if given, maps a clause to what the handler's answer depends on (a
+        location, a topic): clauses with equal keys get the same answer, so
+        the skill may be started speculatively on an interim transcript.
+        """
+        normalized = tuple(dict.fromkeys(_normalize(p) for p in phrases if p and p.strip()))
+        if not normalized:
+            raise ValueError(f"Intent '{name}' needs at least one trigger phrase")
+
+        previous = self._intents.get(name)
+        intent = Intent(name, normalized, priority, handler, previous.fallback if previous else None, deadline, prefetch_key)
+        with self._lock:
+            self._intents[name] = intent
+            self._phrase_index = None  # Recompiled on next route()
+        logging.info(f"Registered intent '{name}' with {len(normalized)} phrase(s), priority {priority}")
+        return intent
+
+    def unregister(self, name: str):
+        with self._lock:
+            if self._intents.pop(name, None) is not None:
+                self._phrase_index = None
+
+    def skill(self, name: str, phrases: List[str], priority: int = 100, deadline: Optional[float] = None,
+              prefetch_key: Optional[Callable] = None):
+        """Decorator form of register() for skill handler functions."""
+        def decorator(handler):
+            self.register(name, phrases, priority, handler, deadline, prefetch_key)
+            return handler
+        return decorator
+
+    def fallback(self, name: str):
+        """
+        Decorator registering a skill's fallback: a plain function with the
+        handler's arguments that returns a (text, result) reply at once, used
+        when the handler misses its deadline or fails.
+        """
+        def decorator(fallback):
+            with self._lock:
+                self._intents[name] = self._intents[name]._replace(fallback=fallback)
+                self._phrase_index = None
+            return fallback
+        return decorator
+
+    @property
+    def intents(self) -> List[Intent]:
+        return sorted(self._intents.values(), key=lambda intent: intent.priority)
+
+    def _compile(self) -> Dict[str, Intent]:
+        with self._lock:
+            if self._phrase_index is not None:
+                return self._phrase_index
+            index = {}
+            for intent in sorted(self._intents.values(), key=lambda i: i.priority, reverse=True):
+                for phrase in intent.phrases:
+                    index[phrase] = intent  # Higher-priority intents overwrite shared phrases
+            self._max_words = max((phrase.count(" ") + 1 for phrase in index), default=0)
+            self._phrase_index = index
+            return index
+
+    def _scan(self, text: str) -> List[IntentMatch]:
+        """Every phrase match in text, in utterance order."""
+        index = self._phrase_index
+        if index is None:
+            index = self._compile()
+        if not index:
+            return []
+
+        tokens = [(m.group(0), m.start(), m.end()) for m in _WORD.finditer(text.lower())]
+        words = [token[0] for token in tokens]
+        matches = []
+        i = 0
+        while i < len(words):
+            # Longest phrase starting at this word wins ("look up" over "look")
+            for n in range(min(self._max_words, len(words) - i), 0, -1):
+                phrase = words[i] if n == 1 else " ".join(words[i:i + n])
+                intent = index.get(phrase)
+                if intent is not None:
+                    matches.append(IntentMatch(intent, text[tokens[i][1]:tokens[i + n - 1][2]], tokens[i][1], tokens[i + n - 1][2]))
+                    i += n
+                    break
+            else:
+                i += 1
+        return matches
+
+    def match_all(self, text: str) -> List[IntentMatch]:
+        """Returns the first match of every intent found in text, in utterance order."""
+        seen = {}
+        for match in self._scan(text):
+            seen.setdefault(match.name, match)
+        return list(seen.values())
+
+    def route(self, text: str) -> Optional[IntentMatch]:
+        """Returns the winning intent match for text, or None for general chat."""
+        matches = self.match_all(text)
+        if not matches:
+            return None
+        return min(matches, key=lambda match: (match.intent.priority, match.start))
+
+    def split(self, text: str) -> List[Tuple[IntentMatch, str]]:
+        """
+        Splits text into (match, clause) pairs, one per skill request. Clauses
+        are cut at commas, semicolons and joining words ("and", "also",
+        "then", "plus"); a clause that triggers no skill stays with the one
+        before it, so "search for salt and pepper" is one request. Within a
+        clause the usual priority rule picks the skill. A single request gets
+        the whole text as its clause, exactly as route() would.
+        """
+        matches = self._scan(text)
+        if not matches:
+            return []
+        groups = []  # [start, end, match]
+        for start, end in _clauses(text):
+            in_clause = [m for m in matches if start <= m.start < end]
+            best = min(in_clause, key=lambda match: (match.intent.priority, match.start)) if in_clause else None
+            if groups and (best is None or groups[-1][2] is None):
+                groups[-1][1] = end
+                groups[-1][2] = groups[-1][2] or best
+            else:
+                groups.append([start, end, best])
+        if len(groups) == 1:
+            return [(groups[0][2], text)]
+        return [(match, text[start:end].strip()) for start, end, match in groups]
+
+    async def run_all(self, requests: List[Tuple[IntentMatch, str]], *args, prefetched: Optional[dict] = None):
+        """
+        Runs the handler of every (match, clause) request concurrently as
+        handler(clause, *args) and yields a SkillOutcome for each as soon as
+        it is ready. prefetched maps request indexes to handler tasks already
+        started for an equivalent clause, which are awaited instead. A
+        handler that misses its deadline (the skill's own, or
+        default_deadline) is cancelled and, like one that raises, replaced
+        by the skill's fallback reply.
+        """
+        started = time.perf_counter()
+        prefetched = prefetched or {}
+
+        async def invoke(index: int, match: IntentMatch, clause: str) -> SkillOutcome:
+            intent = match.intent
+            deadline = intent.deadline if intent.deadline is not None else self.default_deadline
+            running = prefetched.get(index)
+            try:
+                text, result = await asyncio.wait_for(running or intent.handler(clause, *args), deadline)
+                status = "ok"
+            except asyncio.TimeoutError:
+                logging.warning(f"Skill '{intent.name}' missed its {deadline:.1f}s deadline; using its fallback")
+                text, result, status = *_fallback(intent, clause, *args), "deadline"
+            except Exception as e:
+                logging.warning(f"Skill '{intent.name}' failed ({e}); using its fallback")
+                text, result, status = *_fallback(intent, clause, *args), "error"
+            return SkillOutcome(match, text, result, status, time.perf_counter() - started)
+
+        tasks = [asyncio.ensure_future(invoke(i, match, clause)) for i, (match, clause) in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _fallback(intent: Intent, clause: str, *args) -> tuple:
+    if intent.fallback is None:
+        return f"Sorry, I couldn't get the {intent.name} right now.", None
+    return intent.fallback(clause, *args)
+
+
+_CLAUSE_BREAK = re.compile(r"(?:\s*(?:[,;]|\b(?:and|also|then|plus)\b)\s*)+", re.IGNORECASE)
+
+
+def _clauses(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the clauses of text, separators excluded."""
+    spans = []
+    position = 0
+    for separator in _CLAUSE_BREAK.finditer(text):
+        spans.append((position, separator.start()))
+        position = separator.end()
+    spans.append((position, len(text)))
+    return spans
+
+
+_WORD = re.compile(r"\w+(?:'\w+)*")
+
+
+def _normalize(phrase: str) -> str:
+    return " ".join(_WORD.findall(phrase.lower()))
@@ -0,0 +1,151 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import google.generativeai as genai
+
+try:
+    # Private in google-generativeai (0.3.x); see GeminiClientPool._build
+    from google.generativeai import client as genai_client
+except ImportError:
+    genai_client = None
+
+# --- Configuration ---
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+
+
+class GeminiKeyBindingError(RuntimeError):
+    """Raised when the installed SDK offers no way to give a model its own API key."""
+
+
+# genai.configure() is process-global; serialize the fallback path's use of it
+_CONFIGURE_LOCK = threading.Lock()
+
+
+def _key_id(api_key: str) -> str:
+    """Short fingerprint used in logs so raw keys never get printed."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+class GeminiClientPool:
+    """
+    One long-lived GenerativeModel per distinct API key.
+
+    genai.configure() is process-global, so configuring it per message is
+    both repeated work and a race between sessions with different keys.
+    Each pooled model instead gets its own client built from a private
+    client manager configured with that key. Handles are created lazily,
+    reused across turns and sessions, and dropped after max_idle seconds
+    without use, when the pool exceeds max_clients (least recently used
+    first) or when a session replaces its key.
+
+    The per-key client relies on the SDK's private _ClientManager and
+    GenerativeModel._client (requirements.txt pins the versions that have
+    them). If the client manager is gone or has changed, the key is set
+    with genai.configure() instead, and the default client it builds is
+    bound to the model while the configure lock is still held. This is
+    logged and counted as a "fallback". A model that cannot be bound to its
+    own key raises GeminiKeyBindingError rather than sharing another
+    session's key.
+    """
+
+    def __init__(self, model_name: str = GEMINI_MODEL_NAME, max_clients: int = 256,
+                 max_idle: float = 1800.0, client_options: dict = None, transport: str = None):
+        self.model_name = model_name
+        self.max_clients = max_clients
+        self.max_idle = max_idle
+        self.client_options = client_options or {}
+        self.transport = transport
+        self._models = OrderedDict()  # api_key -> (model, last_used)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fallbacks = 0
+
+    def _build(self, api_key: str):
+        options = dict(self.client_options, api_key=api_key)
+        manager_class = getattr(genai_client, "_ClientManager", None)
+        model = genai.GenerativeModel(self.model_name)
+        if manager_class is not None and hasattr(model, "_client"):
+            try:
+                manager = manager_class()
+                manager.configure(client_options=options, transport=self.transport)
+                model._client = manager.make_client("generative")
+                logging.info(f"Created Gemini client for key {_key_id(api_key)}")
+                return model
+            except (AttributeError, TypeError) as e:
+                logging.warning(f"Private Gemini client API changed ({e}); using genai.configure")
+        else:
+            logging.warning("Private Gemini client API not found; using genai.configure")
+        default_client = getattr(genai_client, "get_default_generative_client", None)
+        if default_client is None or not hasattr(model, "_client"):
+            raise GeminiKeyBindingError("This google-generativeai version cannot bind an API key to a model")
+        with _CONFIGURE_LOCK:
+            genai.configure(client_options=options, transport=self.transport)
+            # Bound now: the default client is rebuilt for whichever key is configured next
+            model._client = default_client()
+        with self._lock:
+            self.fallbacks += 1
+        logging.info(f"Created Gemini model for key {_key_id(api_key)} via genai.configure")
+        return model
+
+    def get(self, api_key: str):
+        """Returns the pooled model for api_key, building it on first use."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep > min(self.max_idle, 60.0):
+                self._evict_idle(now)
+            entry = self._models.get(api_key)
+            if entry is not None:
+                self.hits += 1
+                self._models[api_key] = (entry[0], now)
+                self._models.move_to_end(api_key)
+                return entry[0]
+            self.misses += 1
+
+        model = self._build(api_key)
+        with self._lock:
+            # Another thread may have built one meanwhile; keep the first
+            entry = self._models.get(api_key)
+            if entry is not None:
+                return entry[0]
+            self._models[api_key] = (model, now)
+            while len(self._models) > self.max_clients:
+                self._models.popitem(last=False)
+                self.evictions += 1
+        return model
+
+    def discard(self, api_key: str):
+        """Drops the handle for a key that was replaced or revoked."""
+        with self._lock:
+            if self._models.pop(api_key, None) is not None:
+                self.evictions += 1
+                logging.info(f"Discarded Gemini client for key {_key_id(api_key)}")
+
+    def _evict_idle(self, now: float):
+        # Caller holds the lock; entries are in least-recently-used order
+        self._last_sweep = now
+        while self._models:
+            api_key, (_, last_used) = next(iter(self._models.items()))
+            if now - last_used <= self.max_idle:
+                break
+            del self._models[api_key]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "clients": len(self._models),
+                "max_clients": self.max_clients,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "fallbacks": self.fallbacks,
+                "reuse_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
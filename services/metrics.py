@@ -0,0 +1,273 @@
+import math
+import time
+import bisect
+import threading
+
+# --- Configuration ---
+# Bucket upper bounds. Latencies run from sub-millisecond stages (intent
+# matching, websocket writes) to slow upstream calls; sizes are message
+# counts such as conversation history length.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), register: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label tuple -> mutable state shared with bound children
+        self._lock = threading.Lock()
+        if register:
+            with _registry_lock:
+                _registry.append(self)
+
+    def _new_state(self):
+        return [0]
+
+    def _state(self, labels: tuple):
+        state = self._values.get(labels)
+        if state is None:
+            with self._lock:
+                state = self._values.setdefault(labels, self._new_state())
+        return state
+
+    def labels(self, *labels):
+        """A handle bound to one label combination, skipping the lookup on every update."""
+        return self._child(self._state(labels), self._lock)
+
+    def samples(self):
+        """(suffix, label string, value) triples for the text exposition."""
+        with self._lock:
+            items = [(labels, state[0]) for labels, state in self._values.items()]
+        for labels, value in sorted(items):
+            yield "", _labels(self.labelnames, labels), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{suffix}{labels} {_number(value)}" for suffix, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    __slots__ = ("_state", "_lock")
+
+    def __init__(self, state, lock):
+        self._state = state
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._state[0] += amount
+
+
+class Counter(_Metric):
+    """Monotonic count per label combination: COUNTER.inc("gemini", "200")."""
+
+    kind = "counter"
+    _child = _CounterChild
+
+    def inc(self, *labels, amount=1):
+        state = self._state(labels)
+        with self._lock:
+            state[0] += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self._state[0] = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    """
+    Current value per label combination, either set from the code that owns
+    it (set/inc/dec) or read at scrape time from fn, a callable returning a
+    number (no labels) or a {label tuple: number} dict.
+    """
+
+    kind = "gauge"
+    _child = _GaugeChild
+
+    def __init__(self, name: str, documentation: str, labelnames=(), fn=None, register: bool = True):
+        super().__init__(name, documentation, labelnames, register)
+        self.fn = fn
+
+    def set(self, value, *labels):
+        self._state(labels)[0] = value
+
+    def inc(self, *labels, amount=1):
+        state = self._state(labels)
+        with self._lock:
+            state[0] += amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.fn is None:
+            yield from super().samples()
+            return
+        value = self.fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in sorted(items):
+            yield "", _labels(self.labelnames, labels), number
+
+
+class _Timer:
+    __slots__ = ("target", "start")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class _HistogramChild:
+    __slots__ = ("_state", "_lock", "_buckets")
+
+    def __init__(self, state, lock, buckets):
+        self._state = state
+        self._lock = lock
+        self._buckets = buckets
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        state = self._state
+        with self._lock:
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram per label combination. observe() is one bisect
+    and two additions under a lock; buckets are made cumulative only when
+    rendered. Hot paths can hold a labels(...) child to skip the label
+    lookup.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS, register: bool = True):
+        super().__init__(name, documentation, labelnames, register)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_state(self):
+        return [[0] * (len(self.buckets) + 1), 0.0]
+
+    def _child(self, state, lock):
+        return _HistogramChild(state, lock, self.buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        state = self._state(labels)
+        with self._lock:
+            state[0][index] += 1
+            state[1] += value
+
+    def time(self, *labels) -> _Timer:
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self.labels(*labels))
+
+    def snapshot(self, *labels) -> dict:
+        """Count, sum and per-bucket counts (not cumulative) for one label combination."""
+        with self._lock:
+            state = self._values.get(labels)
+            counts, total = (list(state[0]), state[1]) if state else ([0] * (len(self.buckets) + 1), 0.0)
+        return {"count": sum(counts), "sum": total, "buckets": dict(zip(self.buckets + (math.inf,), counts))}
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(state[0]), state[1]) for labels, state in self._values.items()]
+        for labels, counts, total in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", _labels(self.labelnames, labels, f'le="{_number(bound)}"'), cumulative
+            yield "_sum", _labels(self.labelnames, labels), total
+            yield "_count", _labels(self.labelnames, labels), cumulative
+
+
+class StatsCollector:
+    """
+    Exposes the numeric values of an existing stats() dict as gauges named
+    <prefix>_<key>, read at scrape time. Nested dicts are flattened with
+    underscores; strings and lists are skipped.
+    """
+
+    def __init__(self, prefix: str, fn, register: bool = True):
+        self.prefix = prefix
+        self.fn = fn
+        if register:
+            with _registry_lock:
+                _registry.append(self)
+
+    def render(self) -> str:
+        lines = []
+        for key, value in sorted(_flatten(self.fn())):
+            name = f"{self.prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines)
+
+
+def _flatten(stats: dict, prefix: str = ""):
+    for key, value in stats.items():
+        key = "".join(c if c.isalnum() else "_" for c in f"{prefix}{key}")
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{key}_")
+        elif isinstance(value, bool):
+            yield key, int(value)
+        elif isinstance(value, (int, float)):
+            yield key, value
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    blocks = []
+    for metric in metrics:
+        try:
+            block = metric.render()
+        except Exception as e:  # A failing collector must not break the scrape
+            name = getattr(metric, "name", None) or getattr(metric, "prefix", "")
+            block = f"# {name} failed: {' '.join(str(e).split())}"
+        if block:
+            blocks.append(block)
+    return "\n".join(blocks) + "\n"
@@ -0,0 +1,162 @@
+import json
+import asyncio
+import logging
+import threading
+import time
+
+from services.metrics import Histogram
+
+try:
+    import msgpack
+except ImportError:  # Optional: binary encoding is offered only when installed
+    msgpack = None
+
+# --- Configuration ---
+# Version 1: one JSON text frame per event, every field on every event.
+# Version 2: events produced in the same event-loop tick are coalesced into
+# one frame (a JSON array, or a MessagePack array with encoding=msgpack),
+# and sticky fields are sent only when their value changes. Binary frames
+# start with a two-byte header [kind, 0] so audio and MessagePack frames can
+# be told apart and PCM stays 2-byte aligned.
+PROTOCOL_VERSIONS = (1, 2)
+STICKY_FIELDS = ("persona", "api_keys_status")
+FRAME_EVENTS = 1
+FRAME_AUDIO = 2
+
+_stats_lock = threading.Lock()
+PROTOCOL_STATS = {
+    "frames": 0,
+    "events": 0,
+    "bytes": 0,
+    "audio_frames": 0,
+    "audio_bytes": 0,
+    "sticky_omitted": 0,
+}
+WS_SEND_SECONDS = Histogram(
+    "voice_ws_send_seconds", "Time to hand one frame to the websocket (events or audio)", ["kind"]
+)
+_send_events = WS_SEND_SECONDS.labels("events")
+_send_audio = WS_SEND_SECONDS.labels("audio")
+_MISSING = object()
+# One shared encoder: json.dumps with non-default arguments builds a new one per call
+_compact_json = json.JSONEncoder(separators=(",", ":"))
+
+
+def record_protocol(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            PROTOCOL_STATS[key] += value
+
+
+def get_protocol_stats() -> dict:
+    with _stats_lock:
+        stats = dict(PROTOCOL_STATS)
+    stats["events_per_frame"] = round(stats["events"] / stats["frames"], 2) if stats["frames"] else 0.0
+    stats["msgpack_available"] = msgpack is not None
+    return stats
+
+
+def negotiate(version, encoding) -> tuple:
+    """The (version, encoding) to use for what the client asked for."""
+    try:
+        version = int(version or 1)
+    except (TypeError, ValueError):
+        version = 1
+    version = min(max(version, PROTOCOL_VERSIONS[0]), PROTOCOL_VERSIONS[-1])
+    if version == 1 or encoding not in ("json", "msgpack"):
+        return version, "json"
+    if encoding == "msgpack" and msgpack is None:
+        logging.info("Client asked for msgpack but it is not installed; using JSON")
+        return version, "json"
+    return version, encoding
+
+
+class MessageChannel:
+    """
+    Outgoing side of one websocket. send() takes event dicts; with
+    version 1 each is written immediately as its own JSON text frame, as
+    before. With version 2, send() only queues the event and a flush
+    scheduled for the next loop iteration writes everything queued so far
+    as a single frame. send_bytes() flushes queued events first, so
+    ordering between events and audio is preserved.
+    """
+
+    def __init__(self, websocket, version: int = 1, encoding: str = "json"):
+        self.websocket = websocket
+        self.version = version
+        self.encoding = encoding
+        self._pending = []
+        self._sticky = {}
+        self._omitted = 0
+        self._flusher = None
+        self._lock = asyncio.Lock()
+
+    def hello(self) -> dict:
+        return {"type": "hello", "protocol": self.version, "encoding": self.encoding,
+                "sticky": list(STICKY_FIELDS) if self.version >= 2 else []}
+
+    async def send(self, event: dict):
+        if self.version == 1:
+            data = json.dumps(event)
+            start = time.perf_counter()
+            await self.websocket.send_text(data)
+            _send_events.observe(time.perf_counter() - start)
+            record_protocol(frames=1, events=1, bytes=len(data))
+            return
+        self._strip_sticky(event)
+        self._pending.append(event)
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    def _strip_sticky(self, event: dict):
+        for field in STICKY_FIELDS:
+            value = event.get(field, _MISSING)
+            if value is _MISSING:
+                continue
+            if self._sticky.get(field, _MISSING) == value:
+                del event[field]
+                self._omitted += 1
+            else:
+                self._sticky[field] = value
+
+    async def _flush_soon(self):
+        await asyncio.sleep(0)
+        self._flusher = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.debug(f"Websocket flush failed: {e}")
+
+    async def flush(self):
+        async with self._lock:
+            await self._write_pending()
+
+    async def _write_pending(self):
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        if self.encoding == "msgpack":
+            data = bytes((FRAME_EVENTS, 0)) + msgpack.packb(events)
+            start = time.perf_counter()
+            await self.websocket.send_bytes(data)
+        else:
+            data = _compact_json.encode(events)
+            start = time.perf_counter()
+            await self.websocket.send_text(data)
+        _send_events.observe(time.perf_counter() - start)
+        omitted, self._omitted = self._omitted, 0
+        record_protocol(frames=1, events=len(events), bytes=len(data), sticky_omitted=omitted)
+
+    async def send_bytes(self, audio: bytes):
+        """Sends a PCM audio frame."""
+        if self.version == 1:
+            start = time.perf_counter()
+            await self.websocket.send_bytes(audio)
+        else:
+            async with self._lock:
+                await self._write_pending()
+                audio = bytes((FRAME_AUDIO, 0)) + audio
+                start = time.perf_counter()
+                await self.websocket.send_bytes(audio)
+        _send_audio.observe(time.perf_counter() - start)
+        record_protocol(audio_frames=1, audio_bytes=len(audio))
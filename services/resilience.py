@@ -0,0 +1,428 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import contextlib
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from services.http_pool import SKILL_WORKER_THREADS, get_http_session
+from services.metrics import Counter, Gauge
+
+# --- Configuration ---
+# A breaker (one per upstream and API key) opens after BREAKER_FAILURES
+# consecutive failures (5xx, 429, timeouts, connection errors) and rejects
+# calls at once for BREAKER_RESET_SECONDS; then a single probe call decides
+# whether it closes again. 4xx replies are the caller's problem and count
+# as successes.
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# Once an upstream has LATENCY_MIN_SAMPLES of its last LATENCY_WINDOW
+# response times, its timeout is TIMEOUT_MULTIPLIER x their p99 (within the
+# upstream's own bounds) instead of the fixed default.
+LATENCY_WINDOW = int(os.getenv("UPSTREAM_LATENCY_WINDOW", "256"))
+LATENCY_MIN_SAMPLES = int(os.getenv("UPSTREAM_LATENCY_MIN_SAMPLES", "20"))
+TIMEOUT_MULTIPLIER = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+# Hedged GETs: a second copy goes out when the first has taken longer than
+# the p95, at most for HEDGE_BUDGET of requests so a slow upstream does not
+# get double the load. Both copies run on the hedge pool while the calling
+# skill thread waits for the first answer; with two threads per skill
+# thread, the pool never caps hedged calls below the skill pool's size.
+# GETs that cannot be hedged yet (too few latency samples, budget spent)
+# or while the pool is full are sent from the calling thread. A losing
+# copy cannot be interrupted and holds its thread until it answers or
+# times out, so each upstream has at most HEDGE_MAX_INFLIGHT second copies
+# out at once; past that, slow GETs just wait for their first copy.
+HEDGE_BUDGET = float(os.getenv("UPSTREAM_HEDGE_BUDGET", "0.1"))
+HEDGE_THREADS = int(os.getenv("UPSTREAM_HEDGE_THREADS", str(2 * SKILL_WORKER_THREADS)))
+HEDGE_MAX_INFLIGHT = int(os.getenv("UPSTREAM_HEDGE_MAX_INFLIGHT", "8"))
+MAX_BREAKERS = 1024  # Per upstream; breakers of healthy keys are dropped beyond this
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+_hedge_busy = 0  # Hedge pool threads taken, queued work included
+
+UPSTREAM_REJECTED = Counter(
+    "voice_upstream_rejected_total", "Upstream calls failed fast because the breaker was open", ["upstream"]
+)
+UPSTREAM_HEDGES = Counter("voice_upstream_hedges_total", "Hedged GETs sent and won", ["upstream", "outcome"])
+
+
+def _breaker_states() -> dict:
+    counts = {}
+    with _upstreams_lock:
+        upstreams = list(_upstreams.values())
+    for upstream in upstreams:
+        for breaker in upstream.breakers():
+            key = (upstream.name, breaker.state)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+UPSTREAM_BREAKERS = Gauge(
+    "voice_upstream_breakers", "Circuit breakers by upstream and state", ["upstream", "state"], fn=_breaker_states
+)
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+def _key_id(api_key: str) -> str:
+    """Short fingerprint, as in the Gemini pool logs, so raw keys never show up on /health."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8] if api_key else "none"
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+    return _hedge_executor
+
+
+def _take_hedge_thread() -> bool:
+    global _hedge_busy
+    with _hedge_lock:
+        if _hedge_busy >= HEDGE_THREADS:
+            return False
+        _hedge_busy += 1
+        return True
+
+
+def _return_hedge_thread(_future=None):
+    global _hedge_busy
+    with _hedge_lock:
+        _hedge_busy -= 1
+
+
+def is_failure(error: BaseException) -> bool:
+    """Whether an exception says the upstream is unhealthy rather than the request wrong."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code >= 500 or code == 429
+    # Timeouts (asyncio's too), refused connections, resets
+    return isinstance(error, (requests.RequestException, TimeoutError, OSError))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream and API key."""
+
+    __slots__ = ("failures", "state", "opened_at", "probing", "opens", "_lock")
+
+    def __init__(self):
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self, reset_seconds: float) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < reset_seconds:
+                    return False
+                self.state = HALF_OPEN
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            self.state = CLOSED
+
+    def failure(self, threshold: int) -> bool:
+        """Counts a failure; True if it opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.opens += 1
+                return True
+            return False
+
+    def release(self):
+        """Ends a call that said nothing about the upstream's health (cancelled, bad request)."""
+        with self._lock:
+            self.probing = False
+
+
+class LatencyWindow:
+    """The last size response times in a ring buffer, for percentiles."""
+
+    __slots__ = ("samples", "count", "_lock")
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples = array("d", [0.0]) * size
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.samples[self.count % len(self.samples)] = seconds
+            self.count += 1
+
+    def __len__(self):
+        return min(self.count, len(self.samples))
+
+    def percentile(self, fraction: float) -> float:
+        with self._lock:
+            ordered = sorted(self.samples[:len(self)])
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _Attempt:
+    __slots__ = ("started", "latency", "failed")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latency = None
+        self.failed = False
+
+    def responded(self):
+        """Marks the upstream's response (headers, first chunk) as arrived."""
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.started
+
+    def fail(self):
+        """Counts the call as a failure though it returned (a 5xx or 429 reply)."""
+        self.failed = True
+
+
+class Upstream:
+    """
+    Resilience policy for one upstream API: a circuit breaker per API key,
+    a timeout that follows the observed latency (timeout() seconds, between
+    min_timeout and max_timeout, default_timeout until there are enough
+    samples) and hedged GETs. request() wraps a pooled HTTP call; attempt()
+    wraps anything else, such as an SDK call.
+    """
+
+    def __init__(self, name: str, default_timeout: float, min_timeout: float = 1.0, max_timeout: float = None,
+                 failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout or default_timeout
+        self.failure_threshold = failures
+        self.reset_seconds = reset_seconds
+        self.latency = LatencyWindow()
+        self._breakers = {}  # key fingerprint -> CircuitBreaker
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_inflight = 0  # Second copies not finished yet, losers included
+        self.hedges_skipped = 0  # Slow GETs not hedged because of the in-flight cap or a full pool
+        with _upstreams_lock:
+            _upstreams[name] = self
+
+    def breaker(self, api_key: str) -> CircuitBreaker:
+        key_id = _key_id(api_key)
+        breaker = self._breakers.get(key_id)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key_id)
+                if breaker is None:
+                    if len(self._breakers) >= MAX_BREAKERS:
+                        for stale in [k for k, b in self._breakers.items() if b.state == CLOSED and not b.failures]:
+                            del self._breakers[stale]
+                    breaker = self._breakers[key_id] = CircuitBreaker()
+        return breaker
+
+    def breakers(self) -> list:
+        with self._lock:
+            return list(self._breakers.values())
+
+    def available(self, api_key: str) -> bool:
+        """False while this key's breaker is open (without taking the half-open probe)."""
+        breaker = self._breakers.get(_key_id(api_key))
+        return breaker is None or breaker.state == CLOSED or (
+            breaker.state == OPEN and time.monotonic() - breaker.opened_at >= self.reset_seconds
+        )
+
+    def timeout(self) -> float:
+        if len(self.latency) < LATENCY_MIN_SAMPLES:
+            return self.default_timeout
+        adaptive = self.latency.percentile(0.99) * TIMEOUT_MULTIPLIER
+        return round(min(self.max_timeout, max(self.min_timeout, adaptive)), 3)
+
+    async def wait_for(self, awaitable):
+        """Awaits a call for at most timeout() seconds; TimeoutError names the upstream."""
+        timeout = self.timeout()
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{self.name} did not answer within {timeout:.1f}s") from None
+
+    @contextlib.contextmanager
+    def attempt(self, api_key: str, sample: bool = True):
+        """
+        Guards one call: raises UpstreamUnavailable if the key's breaker is
+        open, otherwise yields an _Attempt and records the outcome. The
+        latency sample is taken at attempt.responded() (or the end of the
+        block); sample=False leaves it out, for calls whose duration depends
+        on their payload.
+        """
+        breaker = self.breaker(api_key)
+        if not breaker.allow(self.reset_seconds):
+            with self._lock:
+                self.rejected += 1
+            UPSTREAM_REJECTED.inc(self.name)
+            raise UpstreamUnavailable(f"{self.name} unavailable (circuit open for key {_key_id(api_key)})")
+        with self._lock:
+            self.calls += 1
+        attempt = _Attempt()
+        try:
+            yield attempt
+        except BaseException as e:
+            if isinstance(e, Exception) and is_failure(e):
+                self._failed(breaker, api_key, e)
+            else:
+                breaker.release()
+            raise
+        if attempt.failed:
+            self._failed(breaker, api_key, None)
+            return
+        breaker.success()
+        if sample:
+            attempt.responded()
+            self.latency.add(attempt.latency)
+
+    def _failed(self, breaker: CircuitBreaker, api_key: str, error):
+        with self._lock:
+            self.failures += 1
+        if breaker.failure(self.failure_threshold):
+            logging.warning(
+                f"Circuit for {self.name} (key {_key_id(api_key)}) opened after {breaker.failures} failures"
+                + (f"; last: {error}" if error is not None else "")
+                + f"; failing fast for {self.reset_seconds:.0f}s"
+            )
+
+    def request(self, method: str, url: str, api_key: str, hedge: bool = False, sample: bool = True, **kwargs):
+        """
+        session.request() on the host's pooled session with the adaptive
+        timeout (unless one is given), behind the key's breaker. hedge=True
+        allows a second copy of a slow GET. 5xx and 429 replies are returned
+        as usual but count as failures.
+        """
+        kwargs.setdefault("timeout", self.timeout())
+        with self.attempt(api_key, sample) as attempt:
+            if hedge and method.upper() == "GET" and not kwargs.get("stream"):
+                response = self._hedged(method, url, kwargs)
+            else:
+                response = get_http_session(url).request(method, url, **kwargs)
+            attempt.responded()
+            if response.status_code >= 500 or response.status_code == 429:
+                attempt.fail()
+        return response
+
+    def _hedged(self, method: str, url: str, kwargs: dict):
+        session = get_http_session(url)
+        with self._lock:
+            can_hedge = len(self.latency) >= LATENCY_MIN_SAMPLES and self.hedges < HEDGE_BUDGET * self.calls
+        if not can_hedge or not _take_hedge_thread():
+            return session.request(method, url, **kwargs)
+        executor = _get_hedge_executor()
+        first = executor.submit(session.request, method, url, **kwargs)
+        first.add_done_callback(_return_hedge_thread)
+        done, _ = wait([first], timeout=self.latency.percentile(0.95))
+        if done:
+            return first.result()
+        with self._lock:
+            send = self.hedges < HEDGE_BUDGET * self.calls
+            if send and self.hedges_inflight >= HEDGE_MAX_INFLIGHT:
+                send = False
+                self.hedges_skipped += 1
+            elif send:
+                self.hedges += 1
+                self.hedges_inflight += 1
+        if send and not _take_hedge_thread():
+            with self._lock:
+                self.hedges -= 1
+                self.hedges_inflight -= 1
+                self.hedges_skipped += 1
+            send = False
+        if not send:
+            return first.result()
+        UPSTREAM_HEDGES.inc(self.name, "sent")
+        second = executor.submit(session.request, method, url, **kwargs)
+        second.add_done_callback(self._hedge_done)
+        pending = {first, second}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = done.pop()
+            if winner.exception() is None or not pending:
+                break  # A failed copy only counts if the other failed too
+        for loser in pending:
+            loser.cancel()  # Only stops a copy still queued; a running one finishes within its timeout
+        if winner is second:
+            with self._lock:
+                self.hedge_wins += 1
+            UPSTREAM_HEDGES.inc(self.name, "won")
+        return winner.result()
+
+    def _hedge_done(self, _future):
+        _return_hedge_thread()
+        with self._lock:
+            self.hedges_inflight -= 1
+
+    def stats(self) -> dict:
+        # Keys that ever failed, as a list so /metrics does not grow a gauge per key
+        breakers = []
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._breakers.items())
+        for key_id, breaker in items:
+            if breaker.state == CLOSED and not breaker.failures and not breaker.opens:
+                continue
+            entry = {"key": key_id, "state": breaker.state, "failures": breaker.failures, "opens": breaker.opens}
+            if breaker.state != CLOSED:
+                entry["retry_in_s"] = round(max(0.0, self.reset_seconds - (now - breaker.opened_at)), 1)
+            breakers.append(entry)
+        return {
+            "timeout_s": self.timeout(),
+            "latency_ms": {
+                f"p{int(q * 100)}": round(self.latency.percentile(q) * 1000, 1) for q in (0.5, 0.95, 0.99)
+            },
+            "samples": len(self.latency),
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_inflight": self.hedges_inflight,
+            "hedges_skipped": self.hedges_skipped,
+            "keys": len(items),
+            "open": sum(breaker.state != CLOSED for _, breaker in items),
+            "breakers": breakers,
+        }
+
+
+def get_upstream_stats() -> dict:
+    """Breaker state, timeouts and latency of every upstream, for /health."""
+    with _upstreams_lock:
+        upstreams = list(_upstreams.values())
+    return {upstream.name: upstream.stats() for upstream in upstreams}
@@ -0,0 +1,42 @@
+import re
+from typing import List
+
+# A sentence ends at ., ! or ? (optionally followed by closing quotes/brackets)
+# and whitespace, or at a blank line. Markdown bullets also break on newlines.
+_SENTENCE_END = re.compile(r"""(?<=[.!?])["')\]*]*\s+|\n+""")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits text into sentences, dropping empty pieces."""
+    return [part.strip() for part in _SENTENCE_END.split(text) if part and part.strip()]
+
+
+class SentenceChunker:
+    """
+    Buffers streamed LLM text and releases it in whole sentences, so the
+    browser can start speaking the first sentence while the rest is still
+    being generated.
+    """
+
+    def __init__(self, min_chars: int = 1):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Adds streamed text and returns any complete sentence groups."""
+        self._buffer += text
+        last_end = None
+        for match in _SENTENCE_END.finditer(self._buffer):
+            last_end = match
+        if last_end is None or last_end.end() < self.min_chars:
+            return []
+
+        ready = self._buffer[:last_end.end()].strip()
+        self._buffer = self._buffer[last_end.end():]
+        return [ready] if ready else []
+
+    def flush(self) -> List[str]:
+        """Returns whatever text is left once the stream has finished."""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional
+
+from services.sessions import SessionRecord
+
+
+class SessionBackend(ABC):
+    """
+    Storage interface behind SessionStore. Covers everything a session owns:
+    history, rolling summary, persona, metadata and API keys. History is only
+    ever appended to (append_turns) or folded from the front (fold_history),
+    so backends can store it as an append-only log. Backends whose calls do
+    I/O set blocking, and SessionStore.run() keeps them off the event loop.
+    """
+
+    name = "base"
+    blocking = False
+
+    @abstractmethod
+    def create(self, session_id: str) -> SessionRecord:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, session_id: str, touch: bool = True, history: bool = True) -> Optional[SessionRecord]:
+        """
+        Returns the session (optionally refreshing its idle timer) or None.
+        With history=False the record's history may be left empty.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_persona(self, session_id: str, persona: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_api_keys(self, session_id: str, api_keys: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_turns(self, session_id: str, turns: List[dict], messages: int = 1):
+        """Appends history entries and bumps the message counter."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fold_history(self, session_id: str, start: int, count: int, summary: str):
+        """Drops history[start:start + count] and stores the new summary."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_connection(self, session_id: str, delta: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def evict_oldest_idle(self) -> Optional[str]:
+        """Removes the least recently seen session without a websocket."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def expire_idle(self, cutoff: float) -> int:
+        """Removes unconnected sessions last seen before cutoff (epoch seconds)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Process-local backend: records live in an OrderedDict, least recently seen first."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str) -> SessionRecord:
+        record = SessionRecord(session_id)
+        with self._lock:
+            self._records[session_id] = record
+        return record
+
+    def load(self, session_id: str, touch: bool = True, history: bool = True) -> Optional[SessionRecord]:
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is not None and touch:
+                record.last_seen = time.time()
+                self._records.move_to_end(session_id)
+            return record
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._records.pop(session_id, None)
+
+    def set_persona(self, session_id: str, persona: str):
+        record = self.load(session_id)
+        if record is not None:
+            record.set_persona(persona)
+
+    def set_api_keys(self, session_id: str, api_keys: dict):
+        record = self.load(session_id)
+        if record is not None:
+            record.api_keys = dict(api_keys)
+
+    def append_turns(self, session_id: str, turns: List[dict], messages: int = 1):
+        record = self.load(session_id)
+        if record is not None:
+            record.history.extend(turns)
+            record.total_messages += messages
+
+    def fold_history(self, session_id: str, start: int, count: int, summary: str):
+        record = self.load(session_id, touch=False)
+        if record is not None:
+            del record.history[start:start + count]
+            record.summary = summary
+
+    def add_connection(self, session_id: str, delta: int):
+        record = self.load(session_id)
+        if record is not None:
+            record.connections = max(0, record.connections + delta)
+
+    def count(self) -> int:
+        return len(self._records)
+
+    def evict_oldest_idle(self) -> Optional[str]:
+        with self._lock:
+            for session_id, record in self._records.items():
+                if record.connections == 0:
+                    del self._records[session_id]
+                    return session_id
+        return None
+
+    def expire_idle(self, cutoff: float) -> int:
+        expired = []
+        with self._lock:
+            for session_id, record in self._records.items():
+                if record.last_seen > cutoff:
+                    break  # Everything after this was seen more recently
+                if record.connections == 0:
+                    expired.append(session_id)
+            for session_id in expired:
+                del self._records[session_id]
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            records = list(self._records.values())
+        return {
+            "backend": self.name,
+            "active_sessions": len(records),
+            "connected_sessions": sum(1 for record in records if record.connections),
+            "history_turns": sum(len(record.history) for record in records),
+            "approx_bytes": sum(record.approx_bytes() for record in records),
+        }
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Shared backend for several worker processes on one host. Sessions live in
+    a SQLite database in WAL mode (concurrent readers, one writer, no reader
+    blocking), with history kept as an append-only turns table so each turn
+    writes only its new entries. Each thread uses its own connection.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            persona TEXT NOT NULL,
+            personas_used TEXT NOT NULL,
+            api_keys TEXT NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            created_at TEXT NOT NULL,
+            total_messages INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL NOT NULL,
+            connections INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+        CREATE TABLE IF NOT EXISTS turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # The database and its WAL/shared-memory files hold user-supplied API
+        # keys. SQLite gives the -wal and -shm files the database file's mode,
+        # so create that file owner-only first and tighten any left over.
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        except OSError:
+            pass
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.chmod(path + suffix, 0o600)
+            except OSError:
+                pass
+        conn = self._connect()
+        conn.executescript(self._SCHEMA)
+        logging.info(f"SQLite session backend at {path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params=()):
+        return self._connect().execute(sql, params)
+
+    def create(self, session_id: str) -> SessionRecord:
+        # Another worker may have just created it; keep its row rather than resetting it
+        record = SessionRecord(session_id)
+        self._write(
+            "INSERT OR IGNORE INTO sessions (session_id, persona, personas_used, api_keys, summary, created_at, last_seen) "
+            "VALUES (?, ?, ?, ?, '', ?, ?)",
+            (session_id, record.persona, json.dumps(record.personas_used), "{}", record.created_at, record.last_seen),
+        )
+        return self.load(session_id, touch=False) or record
+
+    def load(self, session_id: str, touch: bool = True, history: bool = True) -> Optional[SessionRecord]:
+        conn = self._connect()
+        if touch:
+            conn.execute("UPDATE sessions SET last_seen = ? WHERE session_id = ?", (time.time(), session_id))
+        row = conn.execute(
+            "SELECT persona, personas_used, api_keys, summary, created_at, total_messages, last_seen, connections "
+            "FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = SessionRecord(session_id, row[0])
+        record.personas_used = json.loads(row[1])
+        record.api_keys = json.loads(row[2])
+        record.summary = row[3]
+        record.created_at = row[4]
+        record.total_messages = row[5]
+        record.last_seen = row[6]
+        record.connections = row[7]
+        if not history:
+            return record
+        record.history = [
+            {"role": role, "parts": [{"text": text}]}
+            for role, text in conn.execute("SELECT role, text FROM turns WHERE session_id = ? ORDER BY id", (session_id,))
+        ]
+        return record
+
+    def delete(self, session_id: str):
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def set_persona(self, session_id: str, persona: str):
+        conn = self._connect()
+        with _transaction(conn):
+            row = conn.execute("SELECT personas_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return
+            used = json.loads(row[0])
+            if persona not in used:
+                used.append(persona)
+            conn.execute(
+                "UPDATE sessions SET persona = ?, personas_used = ?, last_seen = ? WHERE session_id = ?",
+                (persona, json.dumps(used), time.time(), session_id),
+            )
+
+    def set_api_keys(self, session_id: str, api_keys: dict):
+        self._write(
+            "UPDATE sessions SET api_keys = ?, last_seen = ? WHERE session_id = ?",
+            (json.dumps(api_keys), time.time(), session_id),
+        )
+
+    def append_turns(self, session_id: str, turns: List[dict], messages: int = 1):
+        conn = self._connect()
+        with _transaction(conn):
+            conn.executemany(
+                "INSERT INTO turns (session_id, role, text) VALUES (?, ?, ?)",
+                [(session_id, turn["role"], " ".join(p.get("text", "") for p in turn["parts"])) for turn in turns],
+            )
+            conn.execute(
+                "UPDATE sessions SET total_messages = total_messages + ?, last_seen = ? WHERE session_id = ?",
+                (messages, time.time(), session_id),
+            )
+
+    def fold_history(self, session_id: str, start: int, count: int, summary: str):
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute(
+                "DELETE FROM turns WHERE id IN (SELECT id FROM turns WHERE session_id = ? ORDER BY id LIMIT ? OFFSET ?)",
+                (session_id, count, start),
+            )
+            conn.execute("UPDATE sessions SET summary = ? WHERE session_id = ?", (summary, session_id))
+
+    def add_connection(self, session_id: str, delta: int):
+        self._write(
+            "UPDATE sessions SET connections = MAX(0, connections + ?), last_seen = ? WHERE session_id = ?",
+            (delta, time.time(), session_id),
+        )
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def evict_oldest_idle(self) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT session_id FROM sessions WHERE connections = 0 ORDER BY last_seen LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        self.delete(row[0])
+        return row[0]
+
+    def expire_idle(self, cutoff: float) -> int:
+        conn = self._connect()
+        with _transaction(conn):
+            conn.execute(
+                "DELETE FROM turns WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_seen < ? AND connections = 0)", (cutoff,)
+            )
+            return conn.execute("DELETE FROM sessions WHERE last_seen < ? AND connections = 0", (cutoff,)).rowcount
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        active, connected = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(connections > 0), 0) FROM sessions"
+        ).fetchone()
+        turns = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        size = 0
+        for suffix in ("", "-wal"):
+            try:
+                size += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "active_sessions": active,
+            "connected_sessions": connected,
+            "history_turns": turns,
+            "approx_bytes": size,
+        }
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def create_session_backend(name: str = "memory", path: str = "sessions.db") -> SessionBackend:
+    """Builds the backend selected by SESSION_BACKEND ("memory" or "sqlite")."""
+    if name == "sqlite":
+        return SQLiteSessionBackend(path)
+    if name != "memory":
+        logging.warning(f"Unknown session backend '{name}', using in-memory sessions")
+    return InMemorySessionBackend()
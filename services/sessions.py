@@ -0,0 +1,177 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from services.http_pool import run_blocking
+
+
+class SessionStoreFull(Exception):
+    """Raised when the store is at capacity and no idle session can be evicted."""
+
+
+class SessionRecord:
+    """Everything the server keeps for one session, in a single compact record."""
+
+    __slots__ = (
+        "session_id", "history", "summary", "persona", "api_keys", "created_at",
+        "total_messages", "personas_used", "last_seen", "connections",
+    )
+
+    def __init__(self, session_id: str, persona: str = "default"):
+        self.session_id = session_id
+        self.history = []
+        self.summary = ""  # Rolling summary of turns folded out of history
+        self.persona = persona
+        self.api_keys = {}
+        self.created_at = datetime.now().isoformat()
+        self.total_messages = 0
+        self.personas_used = [persona]
+        self.last_seen = time.time()
+        self.connections = 0
+
+    def set_persona(self, persona: str):
+        self.persona = persona
+        if persona not in self.personas_used:
+            self.personas_used.append(persona)
+
+    @property
+    def metadata(self) -> dict:
+        """The session metadata shape returned by /session/{id}/status."""
+        return {
+            "created_at": self.created_at,
+            "total_messages": self.total_messages,
+            "personas_used": list(self.personas_used),
+            "api_keys_configured": list(self.api_keys.keys()),
+        }
+
+    def approx_bytes(self) -> int:
+        """Rough memory footprint: the record plus the history text it holds."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.history) + sys.getsizeof(self.summary)
+        for turn in self.history:
+            for part in turn.get("parts", ()):
+                size += sys.getsizeof(part.get("text", ""))
+        return size
+
+
+class SessionStore:
+    """
+    Session store in front of a pluggable SessionBackend. Caps the number of
+    sessions at max_sessions (evicting the least recently seen session
+    without a websocket when full) and runs a background sweeper that evicts
+    sessions idle for longer than idle_timeout. Its methods call the backend
+    directly; code on the event loop goes through run(), which moves them to
+    the skill thread pool when the backend blocks (SQLite).
+    """
+
+    def __init__(self, backend, max_sessions: int = 10000, idle_timeout: float = 1800.0, sweep_interval: float = 60.0):
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_capacity = 0
+
+    async def run(self, func, *args):
+        """Awaits func(*args), a call into this store, off the event loop if the backend blocks."""
+        if self.backend.blocking:
+            return await run_blocking(func, *args)
+        return func(*args)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.backend.load(session_id, touch=False, history=False) is not None
+
+    def __len__(self) -> int:
+        return self.backend.count()
+
+    def create(self, session_id: str) -> SessionRecord:
+        with self._lock:
+            if self.backend.count() >= self.max_sessions:
+                evicted = self.backend.evict_oldest_idle()
+                if evicted is None:
+                    raise SessionStoreFull(f"Session limit of {self.max_sessions} reached")
+                self.evicted_capacity += 1
+                logging.info(f"Evicted session {evicted} (capacity)")
+            self.created += 1
+            return self.backend.create(session_id)
+
+    def get(self, session_id: str) -> Optional[SessionRecord]:
+        """Returns the session and marks it as recently seen."""
+        return self.backend.load(session_id)
+
+    def peek(self, session_id: str, history: bool = True) -> Optional[SessionRecord]:
+        """Returns the session without refreshing its idle timer (and without its history if not asked for)."""
+        return self.backend.load(session_id, touch=False, history=history)
+
+    def get_or_create(self, session_id: str) -> SessionRecord:
+        return self.get(session_id) or self.create(session_id)
+
+    def remove(self, session_id: str):
+        self.backend.delete(session_id)
+
+    def set_persona(self, session_id: str, persona: str):
+        self.backend.set_persona(session_id, persona)
+
+    def set_api_keys(self, session_id: str, api_keys: dict):
+        self.backend.set_api_keys(session_id, api_keys)
+
+    def append_turns(self, session_id: str, turns: list, messages: int = 1):
+        self.backend.append_turns(session_id, turns, messages)
+
+    def fold_history(self, session_id: str, start: int, count: int, summary: str):
+        self.backend.fold_history(session_id, start, count, summary)
+
+    def connect(self, session_id: str) -> SessionRecord:
+        """Marks a websocket as attached; connected sessions are never evicted."""
+        record = self.get_or_create(session_id)
+        self.backend.add_connection(session_id, 1)
+        return record
+
+    def disconnect(self, session_id: str):
+        self.backend.add_connection(session_id, -1)
+
+    def sweep(self) -> int:
+        """Evicts idle sessions; returns how many were removed."""
+        expired = self.backend.expire_idle(time.time() - self.idle_timeout)
+        self.evicted_idle += expired
+        if expired:
+            logging.info(f"Session sweeper evicted {expired} idle session(s)")
+        return expired
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.run(self.sweep)
+            except Exception as e:
+                logging.error(f"Session sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_forever())
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def stats(self) -> dict:
+        stats = self.backend.stats()
+        stats.update({
+            "max_sessions": self.max_sessions,
+            "idle_timeout_seconds": self.idle_timeout,
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_capacity": self.evicted_capacity,
+        })
+        return stats
@@ -0,0 +1,156 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.intents import IntentMatch, IntentRouter
+
+# --- Configuration ---
+# A skill is started on interim transcripts only once its prefetch key (the
+# location, topic or query it would fetch) has stayed the same for
+# SPECULATION_STABLE_SECONDS, and never on a transcript ending in a word
+# that promises more ("weather in", "news about the"). The recognizer takes
+# longer than that to finalize after the last word.
+SPECULATION_STABLE_SECONDS = 0.3
+DANGLING_WORDS = frozenset({
+    "a", "an", "the", "in", "at", "for", "of", "on", "about", "to", "from", "near", "and", "or", "with"
+})
+
+_stats_lock = threading.Lock()
+SPECULATION_STATS = {
+    "partials": 0,
+    "started": 0,
+    "throttled": 0,  # Stable, but refused by the admit hook
+    "hits": 0,
+    "misses": 0,  # Started, then cancelled or not what the final transcript asked for
+    "seconds_saved": 0.0,
+}
+
+
+def record_speculation(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            SPECULATION_STATS[key] += value
+
+
+def get_speculation_stats() -> dict:
+    with _stats_lock:
+        stats = dict(SPECULATION_STATS)
+    settled = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / settled, 3) if settled else 0.0
+    stats["avg_saved_ms"] = round(stats["seconds_saved"] / stats["hits"] * 1000, 1) if stats["hits"] else 0.0
+    stats["seconds_saved"] = round(stats["seconds_saved"], 3)
+    return stats
+
+
+class _Speculation:
+    __slots__ = ("key", "task", "started", "finished")
+
+    def __init__(self, key, task: asyncio.Task):
+        self.key = key
+        self.task = task
+        self.started = time.perf_counter()
+        self.finished = None
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self.finished = time.perf_counter()
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unclaimed failure is not logged as unhandled
+
+    @property
+    def usable(self) -> bool:
+        return not self.task.done() or (not self.task.cancelled() and self.task.exception() is None)
+
+
+class SpeculativeExecutor:
+    """
+    Starts skills early from a websocket's interim transcripts. observe()
+    routes each partial_transcript and, once a skill's prefetch key has held
+    for stable_seconds, runs its handler in the background (at most one
+    speculation per skill; a changed key replaces it). When the final transcript is routed,
+    take() hands over the speculations whose key matches a request and
+    cancels the rest. A cancelled handler's blocking upstream call still
+    completes in its worker thread and fills the cache. admit(), if given,
+    is asked before each start; a False skips it (admission control).
+    """
+
+    def __init__(self, router: IntentRouter, *args, stable_seconds: float = SPECULATION_STABLE_SECONDS,
+                 admit: Optional[Callable[[], bool]] = None):
+        self.router = router
+        self.args = args
+        self.stable_seconds = stable_seconds
+        self.admit = admit
+        self._candidates: Dict[str, Tuple[object, asyncio.TimerHandle]] = {}  # skill -> (key, pending start)
+        self._running: Dict[str, _Speculation] = {}
+
+    def observe(self, text: str):
+        record_speculation(partials=1)
+        words = text.lower().split()
+        if not words or words[-1].strip(".,;:!?") in DANGLING_WORDS:
+            self._postpone()  # Mid-phrase: whatever was about to start may still change
+            return
+        heard = set()
+        for match, clause in self.router.split(text):
+            intent = match.intent
+            if intent.prefetch_key is None or intent.handler is None:
+                continue
+            key = intent.prefetch_key(clause)
+            heard.add(intent.name)
+            running = self._running.get(intent.name)
+            candidate = self._candidates.get(intent.name)
+            if (running is not None and running.key == key) or (candidate is not None and candidate[0] == key):
+                continue
+            if candidate is not None:
+                candidate[1].cancel()
+            start = asyncio.get_running_loop().call_later(self.stable_seconds, self._start, match, clause, key)
+            self._candidates[intent.name] = (key, start)
+        # A skill must be stable afresh once the recognizer stops hearing it
+        for name in [name for name in self._candidates if name not in heard]:
+            self._candidates.pop(name)[1].cancel()
+
+    def _start(self, match: IntentMatch, clause: str, key):
+        name = match.name
+        del self._candidates[name]
+        if name in self._running:
+            self._discard(name)
+        if self.admit is not None and not self.admit():
+            record_speculation(throttled=1)
+            return
+        self._running[name] = _Speculation(key, asyncio.ensure_future(match.intent.handler(clause, *self.args)))
+        record_speculation(started=1)
+        logging.info(f"Speculatively started '{name}' for {key!r}")
+
+    def take(self, requests: List[Tuple[IntentMatch, str]]) -> dict:
+        """
+        Claims the speculations matching the routed final transcript, as the
+        {request index: task} mapping IntentRouter.run_all() accepts, and
+        cancels every other one.
+        """
+        prefetched = {}
+        now = time.perf_counter()
+        for index, (match, clause) in enumerate(requests):
+            speculation = self._running.get(match.name)
+            if speculation is None or not speculation.usable or speculation.key != match.intent.prefetch_key(clause):
+                continue
+            del self._running[match.name]
+            prefetched[index] = speculation.task
+            record_speculation(hits=1, seconds_saved=(speculation.finished or now) - speculation.started)
+        self.cancel()
+        return prefetched
+
+    def cancel(self):
+        """Drops every unclaimed speculation, as on disconnect."""
+        for name in list(self._running):
+            self._discard(name)
+        self._postpone()
+
+    def _postpone(self):
+        for _, start in self._candidates.values():
+            start.cancel()
+        self._candidates.clear()
+
+    def _discard(self, name: str):
+        self._running.pop(name).task.cancel()
+        record_speculation(misses=1)
@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Optional
+
+from services.http_pool import run_blocking
+
+# --- Configuration ---
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class SpoolQuotaExceeded(Exception):
+    """Raised when an upload would push its session or the whole spool past a byte quota."""
+
+
+class SpoolEntry:
+    """One file in the spool. state is "writing", "ready" or "done" (awaiting GC)."""
+
+    __slots__ = ("upload_id", "session_id", "path", "bytes", "created", "state")
+
+    def __init__(self, upload_id: str, session_id: Optional[str], path: str, created: float,
+                 size: int = 0, state: str = "writing"):
+        self.upload_id = upload_id
+        self.session_id = session_id
+        self.path = path
+        self.bytes = size
+        self.created = created
+        self.state = state
+
+
+class UploadSpool:
+    """
+    Owns the uploads directory.
+
+    Incoming audio is streamed to <upload_id><suffix>.part in fixed-size
+    chunks and renamed into place once complete, so only one chunk per
+    upload is ever held in memory. Bytes are charged against a per-session
+    and a global quota as they arrive; an upload that crosses either is
+    aborted and its partial file removed. Every file is tracked in an
+    in-memory index (files left over from a previous run are adopted on
+    startup), and a background GC deletes files once they are released
+    after transcription, or once they are older than retention seconds.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 ** 3, session_max_bytes: int = 50 * 1024 ** 2,
+                 retention: float = 3600.0, gc_interval: float = 60.0, chunk_bytes: int = UPLOAD_CHUNK_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self.retention = retention
+        self.gc_interval = gc_interval
+        self.chunk_bytes = chunk_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # upload_id -> SpoolEntry
+        self._session_bytes = defaultdict(int)
+        self._total_bytes = 0
+        self._gc_task = None
+        self.uploads = 0
+        self.rejected = 0
+        self.gc_runs = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._adopt()
+
+    def _adopt(self):
+        # Files from a previous run have no owner; retention decides when they go
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isfile(path):
+                continue
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            upload_id = os.path.splitext(name)[0]
+            self._entries[upload_id] = SpoolEntry(upload_id, None, path, stat.st_mtime, stat.st_size, "ready")
+            self._total_bytes += stat.st_size
+        if self._entries:
+            logging.info(f"Upload spool adopted {len(self._entries)} existing file(s) ({self._total_bytes} bytes)")
+
+    def check_quota(self, session_id: str, size: int):
+        """Raises SpoolQuotaExceeded if size more bytes would not fit."""
+        with self._lock:
+            self._check(session_id, size)
+
+    def _check(self, session_id: str, size: int):
+        if self._session_bytes.get(session_id, 0) + size > self.session_max_bytes:
+            self.rejected += 1
+            raise SpoolQuotaExceeded(f"Session upload quota of {self.session_max_bytes} bytes exceeded")
+        if self._total_bytes + size > self.max_bytes:
+            self.rejected += 1
+            raise SpoolQuotaExceeded(f"Upload spool is full ({self.max_bytes} bytes)")
+
+    def _charge(self, entry: SpoolEntry, size: int):
+        with self._lock:
+            self._check(entry.session_id, size)
+            entry.bytes += size
+            self._session_bytes[entry.session_id] += size
+            self._total_bytes += size
+
+    def _forget(self, entry: SpoolEntry):
+        with self._lock:
+            if self._entries.pop(entry.upload_id, None) is None:
+                return
+            self._total_bytes -= entry.bytes
+            if entry.session_id is not None:
+                self._session_bytes[entry.session_id] -= entry.bytes
+                if self._session_bytes[entry.session_id] <= 0:
+                    del self._session_bytes[entry.session_id]
+
+    async def receive(self, session_id: str, chunks: AsyncIterator[bytes], suffix: str = ".webm",
+                      expected_bytes: Optional[int] = None) -> SpoolEntry:
+        """
+        Streams an upload into the spool and returns its entry (state "ready").
+        expected_bytes, when known (Content-Length), rejects oversized
+        uploads before anything is read.
+        """
+        if expected_bytes:
+            self.check_quota(session_id, expected_bytes)
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.root, f"{upload_id}{suffix}")
+        entry = SpoolEntry(upload_id, session_id, path, time.time())
+        with self._lock:
+            self._entries[upload_id] = entry
+
+        part_path = f"{path}.part"
+        spool_file = await run_blocking(open, part_path, "wb")
+        pending = bytearray()
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                self._charge(entry, len(chunk))
+                pending += chunk
+                while len(pending) >= self.chunk_bytes:
+                    await run_blocking(spool_file.write, bytes(pending[:self.chunk_bytes]))
+                    del pending[:self.chunk_bytes]
+            if pending:
+                await run_blocking(spool_file.write, bytes(pending))
+            await run_blocking(spool_file.close)
+            await run_blocking(os.replace, part_path, path)
+        except BaseException:
+            spool_file.close()
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            self._forget(entry)
+            raise
+
+        entry.state = "ready"
+        self.uploads += 1
+        return entry
+
+    def release(self, upload_id: str):
+        """Marks an upload as finished with; the next GC run deletes it."""
+        entry = self._entries.get(upload_id)
+        if entry is not None and entry.state == "ready":
+            entry.state = "done"
+
+    def gc(self) -> int:
+        """Deletes released and expired files; returns how many were removed."""
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [
+                entry for entry in self._entries.values()
+                if entry.state == "done" or (entry.state == "ready" and entry.created < cutoff)
+            ]
+        removed = 0
+        for entry in expired:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning(f"Upload spool could not delete {entry.path}: {e}")
+                continue
+            self._forget(entry)
+            self.deleted_files += 1
+            self.deleted_bytes += entry.bytes
+            removed += 1
+        self.gc_runs += 1
+        if removed:
+            logging.info(f"Upload spool GC deleted {removed} file(s)")
+        return removed
+
+    async def _gc_forever(self):
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await run_blocking(self.gc)
+            except Exception as e:
+                logging.error(f"Upload spool GC failed: {e}")
+
+    def start_gc(self):
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.get_running_loop().create_task(self._gc_forever())
+
+    async def stop_gc(self):
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = defaultdict(int)
+            for entry in self._entries.values():
+                states[entry.state] += 1
+            return {
+                "files": len(self._entries),
+                "bytes": self._total_bytes,
+                "writing": states["writing"],
+                "ready": states["ready"],
+                "released": states["done"],
+                "sessions": len(self._session_bytes),
+                "max_bytes": self.max_bytes,
+                "session_max_bytes": self.session_max_bytes,
+                "retention_seconds": self.retention,
+                "uploads": self.uploads,
+                "rejected": self.rejected,
+                "gc_runs": self.gc_runs,
+                "deleted_files": self.deleted_files,
+                "deleted_bytes": self.deleted_bytes,
+            }
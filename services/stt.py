@@ -1,55 +1,305 @@
 import os
-import requests
 import time
+import asyncio
 import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+
+from services.http_pool import run_blocking
+from services.resilience import Upstream, UpstreamUnavailable
 
 # --- Configuration ---
 # It's good practice to load secrets from environment variables,
 # but for this challenge, we'll define them here.
 ASSEMBLYAI_API_KEY = os.getenv("ASSEMBLYAI_API_KEY", "your_assemblyai_api_key")
-FFMPEG_PATH = os.getenv("FFMPEG_PATH", "C:\\ffmpeg\\bin\\ffmpeg.exe")
+# Point at a local fake server (benchmarks/fake_assemblyai.py) for testing
+ASSEMBLYAI_BASE_URL = os.getenv("ASSEMBLYAI_BASE_URL", "https://api.assemblyai.com/v2").rstrip("/")
+
+# Transcription jobs: concurrency caps (whole process / per API key), status
+# polling that starts tight and backs off, and an overall deadline per job.
+# The next poll comes after STT_POLL_FRACTION of the time already waited, so
+# a transcript is picked up at most that fraction later than it finished.
+STT_MAX_CONCURRENT = int(os.getenv("STT_MAX_CONCURRENT", "16"))
+STT_MAX_PER_KEY = int(os.getenv("STT_MAX_PER_KEY", "4"))
+STT_POLL_INITIAL = float(os.getenv("STT_POLL_INITIAL", "0.25"))
+STT_POLL_MAX = float(os.getenv("STT_POLL_MAX", "3.0"))
+STT_POLL_FRACTION = float(os.getenv("STT_POLL_FRACTION", "0.2"))
+STT_TIMEOUT = float(os.getenv("STT_TIMEOUT", "120"))
+STT_REQUEST_TIMEOUT = 30
+
+# Breaker per API key; status checks get a timeout from their own latency,
+# uploads (as slow as the audio is long) keep STT_REQUEST_TIMEOUT
+assemblyai_upstream = Upstream("assemblyai", default_timeout=STT_REQUEST_TIMEOUT, min_timeout=3)
 
 if ASSEMBLYAI_API_KEY == "your_assemblyai_api_key":
     logging.warning("AssemblyAI API key is not set. Please set the ASSEMBLYAI_API_KEY environment variable.")
 
+# Progress callback: (status, details) where status is one of
+# "uploading", "queued", "processing", "completed" or "error"
+ProgressCallback = Callable[[str, dict], Awaitable[None]]
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+class TranscriptionTimeout(TranscriptionError):
+    pass
+
+
+# ---- AssemblyAI REST calls (blocking, run on the shared thread pool) ----
+
+def _request(method: str, path: str, api_key: str, **kwargs):
+    url = f"{ASSEMBLYAI_BASE_URL}{path}"
+    try:
+        response = assemblyai_upstream.request(method, url, api_key, headers={"authorization": api_key}, **kwargs)
+    except UpstreamUnavailable as e:
+        raise TranscriptionError(str(e)) from e
+    if response.status_code != 200:
+        raise TranscriptionError(f"AssemblyAI {method} {path} failed ({response.status_code}): {response.text[:200]}")
+    return response.json()
+
+
+def _upload(audio, api_key: str) -> str:
+    """Uploads raw audio (bytes or a file object) and returns its upload_url."""
+    upload_url = _request("POST", "/upload", api_key, data=audio, sample=False, timeout=STT_REQUEST_TIMEOUT)["upload_url"]
+    logging.info("Audio file uploaded to AssemblyAI.")
+    return upload_url
+
+
+def _request_transcript(upload_url: str, api_key: str) -> str:
+    transcript_id = _request("POST", "/transcript", api_key, json={"audio_url": upload_url})["id"]
+    logging.info(f"Transcription requested with ID: {transcript_id}")
+    return transcript_id
+
+
+def _get_transcript(transcript_id: str, api_key: str) -> dict:
+    return _request("GET", f"/transcript/{transcript_id}", api_key)
+
+
+def _list_transcripts(api_key: str, limit: int) -> dict:
+    """Status of the account's most recent transcripts: {id: status}."""
+    listing = _request("GET", "/transcript", api_key, params={"limit": limit})
+    return {item["id"]: item["status"] for item in listing.get("transcripts", ())}
+
+
 def transcribe_audio(audio_path: str) -> str:
     """
     Transcribes the audio file at the given path using the AssemblyAI API.
+    Blocking; async callers should use TranscriptionManager instead.
     """
-    headers = {"authorization": ASSEMBLYAI_API_KEY}
-    
-    # 1. Upload the audio file
     with open(audio_path, 'rb') as audio_file:
-        upload_response = requests.post("https://api.assemblyai.com/v2/upload", headers=headers, data=audio_file)
-    
-    if upload_response.status_code != 200:
-        raise Exception(f"AssemblyAI Upload Error: {upload_response.text}")
-    
-    upload_url = upload_response.json()["upload_url"]
-    logging.info("Audio file uploaded to AssemblyAI.")
-
-    # 2. Request transcription
-    transcript_req_data = {"audio_url": upload_url}
-    transcript_req = requests.post("https://api.assemblyai.com/v2/transcript", json=transcript_req_data, headers=headers)
-    
-    if transcript_req.status_code != 200:
-        raise Exception(f"AssemblyAI Transcription Request Error: {transcript_req.text}")
-    
-    transcript_id = transcript_req.json()["id"]
-    logging.info(f"Transcription requested with ID: {transcript_id}")
+        upload_url = _upload(audio_file, ASSEMBLYAI_API_KEY)
+    transcript_id = _request_transcript(upload_url, ASSEMBLYAI_API_KEY)
 
-    # 3. Poll for the result
-    while True:
-        status_check_res = requests.get(f"https://api.assemblyai.com/v2/transcript/{transcript_id}", headers=headers)
-        
-        if status_check_res.status_code != 200:
-            raise Exception(f"AssemblyAI Status Check Error: {status_check_res.text}")
-        
-        status_check = status_check_res.json()
+    start = time.monotonic()
+    while time.monotonic() - start < STT_TIMEOUT:
+        time.sleep(_poll_interval(time.monotonic() - start, STT_POLL_INITIAL, STT_POLL_MAX, STT_POLL_FRACTION))
+        status_check = _get_transcript(transcript_id, ASSEMBLYAI_API_KEY)
         if status_check["status"] == "completed":
             return status_check["text"]
         elif status_check["status"] == "error":
-            raise Exception(f"AssemblyAI Transcription Error: {status_check.get('error')}")
-        
+            raise TranscriptionError(f"AssemblyAI Transcription Error: {status_check.get('error')}")
         logging.info("Transcription in progress...")
-        time.sleep(2)
+    raise TranscriptionTimeout(f"Transcription {transcript_id} did not finish within {STT_TIMEOUT:.0f}s")
+
+
+def _poll_interval(waited: float, initial: float, maximum: float, fraction: float) -> float:
+    return min(maximum, max(initial, waited * fraction))
+
+
+class _Job:
+    __slots__ = ("transcript_id", "api_key", "future", "on_progress", "status", "queued_at", "next_poll")
+
+    def __init__(self, transcript_id, api_key, future, on_progress, now, first_poll):
+        self.transcript_id = transcript_id
+        self.api_key = api_key
+        self.future = future
+        self.on_progress = on_progress
+        self.status = "queued"
+        self.queued_at = now
+        self.next_poll = now + first_poll
+
+
+class TranscriptionManager:
+    """
+    Runs AssemblyAI transcriptions as async jobs.
+
+    At most max_concurrent jobs are in flight per process and max_per_key per
+    API key; further callers wait for a slot. Uploads and transcript requests
+    go through the shared HTTP pool off the event loop. Every pending job is
+    then polled by a single background task: polling starts every
+    poll_initial seconds and backs off to poll_fraction of the time already
+    waited (capped at poll_max). When one key has several jobs pending, one
+    list request returns all their statuses, so only finished transcripts
+    are fetched individually. Jobs that take longer than timeout seconds
+    fail with TranscriptionTimeout.
+    """
+
+    def __init__(self, max_concurrent: int = STT_MAX_CONCURRENT, max_per_key: int = STT_MAX_PER_KEY,
+                 poll_initial: float = STT_POLL_INITIAL, poll_max: float = STT_POLL_MAX,
+                 poll_fraction: float = STT_POLL_FRACTION, timeout: float = STT_TIMEOUT, list_limit: int = 100):
+        self.max_concurrent = max_concurrent
+        self.max_per_key = max_per_key
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.poll_fraction = poll_fraction
+        self.timeout = timeout
+        self.list_limit = list_limit
+        self._loop = None
+        self._pending = {}  # transcript_id -> _Job
+        self.jobs = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.status_requests = 0
+        self.batched_requests = 0
+        self.total_seconds = 0.0
+
+    def _bind_loop(self):
+        # Semaphores, futures and the poller belong to one event loop
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._global_slots = asyncio.Semaphore(self.max_concurrent)
+            self._key_slots = {}  # api_key -> [Semaphore, users]
+            self._pending = {}
+            self._wakeup = asyncio.Event()
+            self._poller = None
+        return loop
+
+    async def transcribe(self, audio, api_key: Optional[str] = None,
+                         on_progress: Optional[ProgressCallback] = None) -> str:
+        """Uploads audio (bytes or file object), waits for the transcript and returns its text."""
+        api_key = api_key or ASSEMBLYAI_API_KEY
+        loop = self._bind_loop()
+        start = loop.time()
+        self.jobs += 1
+
+        key_slot = self._key_slots.setdefault(api_key, [asyncio.Semaphore(self.max_per_key), 0])
+        key_slot[1] += 1
+        try:
+            async with self._global_slots, key_slot[0]:
+                try:
+                    text = await asyncio.wait_for(
+                        self._run_job(audio, api_key, on_progress, loop),
+                        self.timeout - (loop.time() - start)
+                    )
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    await _notify(on_progress, "error", {"error": "timeout"})
+                    raise TranscriptionTimeout(f"Transcription did not finish within {self.timeout:.0f}s")
+                except TranscriptionError as e:
+                    self.failed += 1
+                    await _notify(on_progress, "error", {"error": str(e)})
+                    raise
+        finally:
+            key_slot[1] -= 1
+            if key_slot[1] == 0 and self._key_slots.get(api_key) is key_slot:
+                del self._key_slots[api_key]
+
+        elapsed = loop.time() - start
+        self.completed += 1
+        self.total_seconds += elapsed
+        await _notify(on_progress, "completed", {"elapsed_ms": int(elapsed * 1000)})
+        return text
+
+    async def _run_job(self, audio, api_key: str, on_progress, loop) -> str:
+        await _notify(on_progress, "uploading", {})
+        upload_url = await run_blocking(_upload, audio, api_key)
+        transcript_id = await run_blocking(_request_transcript, upload_url, api_key)
+
+        job = _Job(transcript_id, api_key, loop.create_future(), on_progress, loop.time(), self.poll_initial)
+        self._pending[transcript_id] = job
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll_loop())
+        self._wakeup.set()
+        await _notify(on_progress, "queued", {"transcript_id": transcript_id})
+        try:
+            return await job.future
+        finally:
+            self._pending.pop(transcript_id, None)
+
+    async def _poll_loop(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            now = loop.time()
+            due = [job for job in self._pending.values() if job.next_poll <= now]
+            if not due:
+                self._wakeup.clear()
+                next_poll = min(job.next_poll for job in self._pending.values())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), next_poll - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # One list request answers for every pending job of a key, so
+            # jobs not yet due ride along with the ones that are
+            due_keys = {job.api_key for job in due}
+            by_key = defaultdict(list)
+            for job in self._pending.values():
+                if job.api_key in due_keys:
+                    by_key[job.api_key].append(job)
+            await asyncio.gather(*(self._check(api_key, jobs) for api_key, jobs in by_key.items()))
+
+    async def _check(self, api_key: str, jobs: list):
+        statuses = {}
+        if len(jobs) > 1:
+            try:
+                self.status_requests += 1
+                self.batched_requests += 1
+                statuses = await run_blocking(_list_transcripts, api_key, self.list_limit)
+            except Exception as e:
+                logging.warning(f"Batched transcript status check failed: {e}")
+        await asyncio.gather(*(self._check_job(job, statuses.get(job.transcript_id)) for job in jobs))
+
+    async def _check_job(self, job: _Job, status: Optional[str]):
+        if job.future.done():
+            return
+        result = {}
+        try:
+            # Finished jobs (and jobs missing from the listing) need the full transcript
+            if status in (None, "completed", "error"):
+                self.status_requests += 1
+                result = await run_blocking(_get_transcript, job.transcript_id, job.api_key)
+                status = result["status"]
+        except Exception as e:
+            logging.warning(f"Status check for transcript {job.transcript_id} failed: {e}")
+            status = job.status
+
+        if job.future.done():
+            return
+        if status == "completed":
+            job.future.set_result(result.get("text") or "")
+        elif status == "error":
+            job.future.set_exception(TranscriptionError(f"AssemblyAI Transcription Error: {result.get('error')}"))
+        else:
+            if status != job.status:
+                job.status = status
+                await _notify(job.on_progress, status, {"transcript_id": job.transcript_id})
+            now = asyncio.get_running_loop().time()
+            job.next_poll = now + _poll_interval(now - job.queued_at, self.poll_initial, self.poll_max, self.poll_fraction)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": self.jobs,
+            "active": len(self._pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "status_requests": self.status_requests,
+            "batched_requests": self.batched_requests,
+            "avg_latency_ms": int(self.total_seconds / self.completed * 1000) if self.completed else 0,
+            "max_concurrent": self.max_concurrent,
+            "max_per_key": self.max_per_key,
+        }
+
+
+async def _notify(on_progress: Optional[ProgressCallback], status: str, details: dict):
+    if on_progress is None:
+        return
+    try:
+        await on_progress(status, details)
+    except Exception as e:
+        logging.debug(f"Transcription progress callback failed: {e}")
@@ -0,0 +1,232 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import platform
+import threading
+from array import array
+from typing import Optional
+
+from services.http_pool import run_blocking
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# --- Configuration ---
+# Host and process stats are sampled every TELEMETRY_INTERVAL seconds into
+# ring buffers holding TELEMETRY_HISTORY_SECONDS of samples (an hour of
+# 5 s samples is 720 per field, under 70 KB in all).
+TELEMETRY_INTERVAL = float(os.getenv("TELEMETRY_INTERVAL", "5"))
+TELEMETRY_HISTORY_SECONDS = float(os.getenv("TELEMETRY_HISTORY_SECONDS", "3600"))
+
+# Sampled fields, in ring order; rates are per second since the previous sample
+FIELDS = (
+    "cpu_percent",
+    "load_1m",
+    "memory_percent",
+    "memory_used_bytes",
+    "disk_percent",
+    "net_sent_bps",
+    "net_recv_bps",
+    "process_cpu_percent",
+    "process_rss_bytes",
+    "process_threads",
+    "process_fds",
+)
+
+
+class RingSeries:
+    """
+    Fixed-size columns of float samples with their timestamps: one
+    array("d") per field, overwritten oldest first. latest() is O(1);
+    window() walks back only over the samples it covers.
+    """
+
+    def __init__(self, fields, capacity: int):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.times = array("d", [0.0]) * capacity
+        self.columns = {field: array("d", [math.nan]) * capacity for field in self.fields}
+        self.count = 0  # Samples ever appended; the next one goes to count % capacity
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, values: dict):
+        with self._lock:
+            slot = self.count % self.capacity
+            self.times[slot] = timestamp
+            for field, column in self.columns.items():
+                column[slot] = values.get(field, math.nan)
+            self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self) -> Optional[dict]:
+        with self._lock:
+            if not self.count:
+                return None
+            slot = (self.count - 1) % self.capacity
+            values = {field: column[slot] for field, column in self.columns.items()}
+            values["timestamp"] = self.times[slot]
+        return values
+
+    def window(self, seconds: float, now: float = None) -> dict:
+        """
+        {field: {"min", "max", "avg", "first", "last"}} over the samples of
+        the last seconds, plus "samples" and "span_s" (the time they cover).
+        Fields without a value in the window are left out.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            slots = []
+            for back in range(1, len(self) + 1):
+                slot = (self.count - back) % self.capacity
+                if now - self.times[slot] > seconds:
+                    break
+                slots.append(slot)
+            slots.reverse()  # Oldest first
+            result = {"samples": len(slots), "span_s": round(self.times[slots[-1]] - self.times[slots[0]], 1) if slots else 0.0}
+            for field, column in self.columns.items():
+                values = [column[slot] for slot in slots if not math.isnan(column[slot])]
+                if values:
+                    result[field] = {
+                        "min": min(values),
+                        "max": max(values),
+                        "avg": sum(values) / len(values),
+                        "first": values[0],
+                        "last": values[-1],
+                    }
+        return result
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.itemsize * len(self.times) * (len(self.columns) + 1)
+
+
+class TelemetrySampler:
+    """
+    Samples CPU, load, memory, disk, network and this process's CPU, RSS,
+    threads and open files into a RingSeries, every interval seconds on a
+    background task (sampling itself runs on the skill thread pool). The
+    platform description, which is slow to get, is read once. Without
+    psutil only the load average and the platform are known.
+    """
+
+    def __init__(self, interval: float = TELEMETRY_INTERVAL, history_seconds: float = TELEMETRY_HISTORY_SECONDS,
+                 disk_root: str = "/"):
+        self.interval = interval
+        self.history_seconds = history_seconds
+        self.disk_root = disk_root
+        self.series = RingSeries(FIELDS, max(2, int(history_seconds / interval)))
+        self._task = None
+        self._static = None
+        self._process = None
+        self._last_net = None  # (monotonic time, bytes sent, bytes received)
+        self._sample_lock = threading.Lock()
+        self.sample_seconds = 0.0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return psutil is not None
+
+    def static_info(self) -> dict:
+        if self._static is None:
+            self._static = {
+                "system": platform.system(),
+                "platform": platform.platform(),
+                "processor": platform.processor() or platform.machine(),
+                "cpu_count": os.cpu_count(),
+            }
+            if psutil is not None:
+                self._static["memory_total_bytes"] = psutil.virtual_memory().total
+        return self._static
+
+    def sample(self) -> dict:
+        """Takes one sample into the ring and returns it. Blocking (a few syscalls)."""
+        with self._sample_lock:
+            started = time.perf_counter()
+            self.static_info()
+            values = {}
+            if hasattr(os, "getloadavg"):
+                values["load_1m"] = os.getloadavg()[0]
+            if psutil is not None:
+                if self._process is None:
+                    # cpu_percent() measures since the previous call; the first reading is 0
+                    self._process = psutil.Process()
+                    self._process.cpu_percent(None)
+                    psutil.cpu_percent(None)
+                values["cpu_percent"] = psutil.cpu_percent(None)
+                memory = psutil.virtual_memory()
+                values["memory_percent"] = memory.percent
+                values["memory_used_bytes"] = memory.total - memory.available
+                values["disk_percent"] = psutil.disk_usage(self.disk_root).percent
+                net = psutil.net_io_counters()
+                now = time.monotonic()
+                if net is not None:
+                    if self._last_net is not None and now > self._last_net[0]:
+                        elapsed = now - self._last_net[0]
+                        values["net_sent_bps"] = max(0, net.bytes_sent - self._last_net[1]) / elapsed
+                        values["net_recv_bps"] = max(0, net.bytes_recv - self._last_net[2]) / elapsed
+                    self._last_net = (now, net.bytes_sent, net.bytes_recv)
+                with self._process.oneshot():
+                    values["process_cpu_percent"] = self._process.cpu_percent(None)
+                    values["process_rss_bytes"] = self._process.memory_info().rss
+                    values["process_threads"] = self._process.num_threads()
+                    if hasattr(self._process, "num_fds"):
+                        values["process_fds"] = self._process.num_fds()
+            self.series.append(time.time(), values)
+            self.sample_seconds = time.perf_counter() - started
+            return values
+
+    def latest(self) -> Optional[dict]:
+        """The most recent sample with the platform details, or None before the first one."""
+        values = self.series.latest()
+        if values is None:
+            return None
+        values.update(self.static_info())
+        values["age_s"] = round(time.time() - values["timestamp"], 1)
+        return values
+
+    def window(self, seconds: float) -> dict:
+        return self.series.window(seconds)
+
+    async def _sample_forever(self):
+        while True:
+            try:
+                await run_blocking(self.sample)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Telemetry sample failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start_sampler(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sample_forever())
+
+    async def stop_sampler(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        latest = self.series.latest() or {}
+        return {
+            "psutil": psutil is not None,
+            "running": self._task is not None and not self._task.done(),
+            "interval_s": self.interval,
+            "history_s": self.history_seconds,
+            "capacity": self.series.capacity,
+            "samples": len(self.series),
+            "history_bytes": self.series.nbytes,
+            "last_sample_ms": round(self.sample_seconds * 1000, 2),
+            "errors": self.errors,
+            "latest": {field: value for field, value in latest.items() if field in FIELDS and not math.isnan(value)},
+        }
@@ -0,0 +1,204 @@
+import io
+import os
+import time
+import wave
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from services.audio import pcm_to_wav
+
+# --- Configuration ---
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "C:\\ffmpeg\\bin\\ffmpeg.exe")
+
+# Audio sent to STT is normalized to 16 kHz mono, as FLAC ("flac") or
+# 16-bit PCM in a WAV container ("wav"). At most TRANSCODE_WORKERS ffmpeg
+# processes run at once; further jobs queue.
+TRANSCODE_FORMAT = os.getenv("TRANSCODE_FORMAT", "flac")
+TRANSCODE_SAMPLE_RATE = int(os.getenv("TRANSCODE_SAMPLE_RATE", "16000"))
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", str(os.cpu_count() or 1)))
+TRANSCODE_TIMEOUT = float(os.getenv("TRANSCODE_TIMEOUT", "30"))
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def resolve_ffmpeg(path: Optional[str]) -> Optional[str]:
+    """The configured ffmpeg binary if it exists, else ffmpeg on PATH, else None."""
+    if path and os.path.isfile(path) and os.access(path, os.X_OK):
+        return path
+    return (path and shutil.which(path)) or shutil.which("ffmpeg")
+
+
+def ffmpeg_transcode(ffmpeg_path: str, audio, output: str = TRANSCODE_FORMAT,
+                     sample_rate: int = TRANSCODE_SAMPLE_RATE, timeout: float = TRANSCODE_TIMEOUT) -> bytes:
+    """
+    Converts audio (bytes or a file object) to mono sample_rate FLAC or WAV.
+    Input and output go through ffmpeg's stdin and stdout; a file object is
+    handed to ffmpeg as its stdin directly, without being read here.
+    """
+    args = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-vn",
+            "-ac", "1", "-ar", str(sample_rate)]
+    if output == "flac":
+        args += ["-c:a", "flac", "-f", "flac", "pipe:1"]
+    else:
+        # Raw PCM, wrapped here: ffmpeg cannot fill in WAV sizes on a pipe
+        args += ["-c:a", "pcm_s16le", "-f", "s16le", "pipe:1"]
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        result = subprocess.run(args, input=audio, capture_output=True, timeout=timeout)
+    else:
+        audio.seek(audio.tell())  # Sync the OS file offset with Python's buffer
+        result = subprocess.run(args, stdin=audio, capture_output=True, timeout=timeout)
+    if result.returncode != 0 or not result.stdout:
+        raise TranscodeError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace')[-300:]}")
+    if output == "flac":
+        return result.stdout
+    return pcm_to_wav(np.frombuffer(result.stdout, dtype="<i2"), sample_rate)
+
+
+def wav_transcode(audio, sample_rate: int = TRANSCODE_SAMPLE_RATE) -> bytes:
+    """
+    ffmpeg-free path for PCM WAV input: downmixes to mono and resamples to
+    sample_rate (block averaging for integer ratios such as 48k -> 16k,
+    linear interpolation otherwise).
+    """
+    with wave.open(io.BytesIO(audio) if isinstance(audio, (bytes, bytearray)) else audio, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((b[:, 0] << 8 | b[:, 1] << 16 | b[:, 2] << 24) >> 16).astype(np.float32)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 65536
+    else:
+        raise TranscodeError(f"Unsupported WAV sample width: {width}")
+
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        if rate % sample_rate == 0:
+            factor = rate // sample_rate
+            samples = samples[:len(samples) - len(samples) % factor].reshape(-1, factor).mean(axis=1)
+        else:
+            count = int(len(samples) * sample_rate / rate)
+            samples = np.interp(np.arange(count) * (rate / sample_rate), np.arange(len(samples)), samples)
+    return pcm_to_wav(np.clip(np.round(samples), -32768, 32767).astype(np.int16), sample_rate)
+
+
+def _is_wav(audio) -> bool:
+    if isinstance(audio, (bytes, bytearray)):
+        head = bytes(audio[:12])
+    else:
+        position = audio.tell()
+        head = audio.read(12)
+        audio.seek(position)
+    return head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+def _size_of(audio) -> int:
+    if isinstance(audio, (bytes, bytearray)):
+        return len(audio)
+    return os.fstat(audio.fileno()).st_size - audio.tell()
+
+
+class AudioTranscoder:
+    """
+    Normalizes audio to 16 kHz mono FLAC/WAV before it is uploaded to STT.
+
+    Each job runs one ffmpeg process fed through pipes, on a bounded pool of
+    max_workers threads, so no more than max_workers ffmpeg processes exist
+    at once and no temp files are written. Without ffmpeg, WAV input is
+    resampled in-process and anything else is passed through untouched. The
+    smaller of the original and the transcoded audio is returned, since
+    lossless FLAC is often larger than the browser's Opus.
+    """
+
+    def __init__(self, ffmpeg_path: Optional[str] = FFMPEG_PATH, max_workers: int = TRANSCODE_WORKERS,
+                 output: str = TRANSCODE_FORMAT, sample_rate: int = TRANSCODE_SAMPLE_RATE,
+                 timeout: float = TRANSCODE_TIMEOUT):
+        self.ffmpeg_path = resolve_ffmpeg(ffmpeg_path)
+        self.max_workers = max(1, max_workers)
+        self.output = output
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="transcode")
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.ffmpeg_jobs = 0
+        self.wav_jobs = 0
+        self.kept_original = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_seconds = 0.0
+        if self.ffmpeg_path is None:
+            logging.warning(f"ffmpeg not found at {ffmpeg_path!r} or on PATH; only WAV audio will be transcoded.")
+
+    def transcode_sync(self, audio):
+        """Blocking transcode; returns bytes, or the original audio when that is smaller or unconvertible."""
+        start = time.perf_counter()
+        size = _size_of(audio)
+        position = None if isinstance(audio, (bytes, bytearray)) else audio.tell()
+        result = None
+        try:
+            if self.ffmpeg_path is not None:
+                result = ffmpeg_transcode(self.ffmpeg_path, audio, self.output, self.sample_rate, self.timeout)
+                kind = "ffmpeg_jobs"
+            elif _is_wav(audio):
+                result = wav_transcode(audio, self.sample_rate)
+                kind = "wav_jobs"
+        except Exception as e:
+            logging.warning(f"Transcoding failed, sending original audio: {e}")
+            result = None
+            with self._lock:
+                self.failed += 1
+
+        if result is None or len(result) >= size:
+            if position is not None:
+                audio.seek(position)
+            output, counter = audio, "kept_original"
+        else:
+            output, counter = result, kind
+        with self._lock:
+            self.jobs += 1
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.bytes_in += size
+            self.bytes_out += len(output) if output is result else size
+            self.total_seconds += time.perf_counter() - start
+        return output
+
+    async def transcode(self, audio):
+        """Transcodes on the worker pool; see transcode_sync."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.transcode_sync, audio)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ffmpeg": self.ffmpeg_path is not None,
+                "output": self.output,
+                "sample_rate": self.sample_rate,
+                "max_workers": self.max_workers,
+                "jobs": self.jobs,
+                "ffmpeg_jobs": self.ffmpeg_jobs,
+                "wav_jobs": self.wav_jobs,
+                "kept_original": self.kept_original,
+                "failed": self.failed,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "size_ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else 0.0,
+                "avg_ms": round(self.total_seconds / self.jobs * 1000, 1) if self.jobs else 0.0,
+            }
@@ -1,46 +1,258 @@
 import os
-import requests
+import re
 import base64
+import asyncio
 import logging
+import threading
+from contextlib import closing
+
+from services.http_pool import iterate_blocking
+from services.resilience import Upstream, UpstreamUnavailable
+from services.sentences import split_sentences
+from services.tts_cache import TTSAudioCache
 
 # --- Configuration ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "your_google_gemini_api_key")
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_TTS_MODEL = os.getenv("GEMINI_TTS_MODEL", "gemini-2.5-flash-preview-tts")
+GEMINI_TTS_VOICE = os.getenv("GEMINI_TTS_VOICE", "Kore")
+
+# Server-side TTS: sentences synthesized (or buffered) ahead of the one being
+# sent, and the size of each binary websocket frame (200 ms of audio)
+TTS_MAX_PARALLEL = int(os.getenv("TTS_MAX_PARALLEL", "3"))
+TTS_FRAME_BYTES = int(os.getenv("TTS_FRAME_BYTES", "9600"))
+TTS_REQUEST_TIMEOUT = 30
+# Breaker per API key; the timeout follows the time to the response headers
+tts_upstream = Upstream("gemini_tts", default_timeout=TTS_REQUEST_TIMEOUT, min_timeout=5)
+# Gemini TTS returns 16-bit little-endian mono PCM at 24 kHz
+TTS_SAMPLE_RATE = 24000
 
 if GEMINI_API_KEY == "your_google_gemini_api_key":
     logging.warning("Gemini API key is not set. Please set the GEMINI_API_KEY environment variable.")
 
-def generate_audio(text: str, output_path: str):
+_stats_lock = threading.Lock()
+TTS_STATS = {
+    "responses": 0,
+    "sentences": 0,
+    "audio_bytes": 0,
+    "errors": 0,
+    "first_audio_ms_total": 0,
+}
+
+# Markdown emphasis, headings and code marks are not meant to be read aloud
+_MARKDOWN = re.compile(r"[*_#`>|~]+")
+
+
+class TTSError(Exception):
+    pass
+
+
+def record_tts(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            TTS_STATS[key] += value
+
+
+def get_tts_stats() -> dict:
+    with _stats_lock:
+        stats = dict(TTS_STATS)
+    first_audio_total = stats.pop("first_audio_ms_total")
+    stats["avg_first_audio_ms"] = int(first_audio_total / stats["responses"]) if stats["responses"] else 0
+    return stats
+
+
+class InlineAudioDecoder:
     """
-    Generates audio for a given text using Google's Gemini TTS
-    and saves it to the specified output path.
+    Extracts the base64 audio from a generateContent response as the body
+    streams in. Only the bytes before the "data" field and a carry of fewer
+    than four base64 characters are buffered; everything else is decoded and
+    handed back chunk by chunk, so the full base64 string is never held in
+    memory.
+    """
+
+    _DATA = re.compile(rb'"data"\s*:\s*"')
+    _MIME = re.compile(rb'"mimeType"\s*:\s*"([^"]+)"')
+
+    def __init__(self):
+        self._head = b""
+        self._carry = b""
+        self.in_data = False
+        self.done = False
+        self.mime_type = None
+        self.decoded = 0
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self.done:
+            return b""
+        if not self.in_data:
+            self._head += chunk
+            if self.mime_type is None:
+                mime = self._MIME.search(self._head)
+                if mime:
+                    self.mime_type = mime.group(1).decode()
+            marker = self._DATA.search(self._head)
+            if marker is None:
+                self._head = self._head[-256:]
+                return b""
+            chunk = self._head[marker.end():]
+            self._head = b""
+            self.in_data = True
+
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self.done = True
+        data = self._carry + chunk
+        usable = len(data) if self.done else len(data) - len(data) % 4
+        self._carry = data[usable:]
+        audio = base64.b64decode(data[:usable]) if usable else b""
+        self.decoded += len(audio)
+        return audio
+
+
+def synthesize_stream(text: str, api_key: str = GEMINI_API_KEY, voice: str = GEMINI_TTS_VOICE):
     """
-    google_tts_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-tts:generateContent?key={GEMINI_API_KEY}"
-    
-    google_payload = {
+    Synthesizes text with Gemini TTS and yields raw PCM chunks as the
+    response body arrives. Blocking; run it through iterate_blocking.
+    """
+    url = f"{GEMINI_API_BASE_URL}/models/{GEMINI_TTS_MODEL}:generateContent"
+    payload = {
         "contents": [{"parts": [{"text": text}]}],
         "generationConfig": {
             "responseModalities": ["AUDIO"],
-            "speechConfig": {"voiceConfig": {"prebuiltVoiceConfig": {"voiceName": "Kore"}}}
+            "speechConfig": {"voiceConfig": {"prebuiltVoiceConfig": {"voiceName": voice}}}
         },
-        "model": "gemini-2.5-flash-preview-tts"
+        "model": GEMINI_TTS_MODEL
     }
-    
-    google_res = requests.post(google_tts_url, json=google_payload)
+    try:
+        response = tts_upstream.request(
+            "POST", url, api_key, json=payload, headers={"x-goog-api-key": api_key}, stream=True
+        )
+    except UpstreamUnavailable as e:
+        raise TTSError(str(e)) from e
+    with closing(response):
+        if response.status_code != 200:
+            raise TTSError(f"Google TTS API request failed: {response.text[:200]}")
+        decoder = InlineAudioDecoder()
+        for chunk in response.iter_content(chunk_size=32768):
+            audio = decoder.feed(chunk)
+            if audio:
+                yield audio
+            if decoder.done:
+                break
+    if not decoder.decoded:
+        raise TTSError("Could not parse audio data from the Google TTS API response.")
 
-    if google_res.status_code != 200:
-        raise Exception(f"Google TTS API request failed: {google_res.text}")
 
-    response_json = google_res.json()
-    
-    # Safely extract the audio data
-    try:
-        audio_data_base64 = response_json['candidates'][0]['content']['parts'][0]['inlineData']['data']
-        audio_bytes = base64.b64decode(audio_data_base64)
-        
-        with open(output_path, "wb") as audio_file:
-            audio_file.write(audio_bytes)
-        logging.info(f"Audio content successfully saved to {output_path}")
-            
-    except (KeyError, IndexError) as e:
-        logging.error(f"Error parsing Google TTS response: {response_json} - {e}")
-        raise Exception("Could not parse audio data from the Google TTS API response.")
+def speech_sentences(text: str):
+    """The sentences the pipeline synthesizes for text (markdown stripped)."""
+    return [
+        sentence for sentence in split_sentences(_MARKDOWN.sub("", text))
+        if any(ch.isalnum() for ch in sentence)
+    ]
+
+
+def generate_audio(text: str, output_path: str):
+    """
+    Generates audio for a given text using Google's Gemini TTS
+    and saves it to the specified output path.
+    """
+    with open(output_path, "wb") as audio_file:
+        for audio in synthesize_stream(text, GEMINI_API_KEY):
+            audio_file.write(audio)
+    logging.info(f"Audio content successfully saved to {output_path}")
+
+
+class SentenceTTSPipeline:
+    """
+    Speaks a response sentence by sentence. Text is added as it becomes
+    available (whole responses or streamed LLM chunks) and split into
+    sentences, each synthesized on its own request. Up to max_parallel
+    sentences are synthesized or buffered ahead of the one being sent, and
+    frames() yields their audio strictly in order, so the first sentence can
+    play while later ones are still being generated. With a cache, sentences
+    spoken before are read from disk instead of synthesized again.
+    """
+
+    def __init__(self, api_key: str, voice: str = GEMINI_TTS_VOICE, max_parallel: int = TTS_MAX_PARALLEL,
+                 frame_bytes: int = TTS_FRAME_BYTES, cache: TTSAudioCache = None):
+        self.api_key = api_key
+        self.voice = voice
+        self.cache = cache
+        self.frame_bytes = frame_bytes - frame_bytes % 2
+        self._slots = asyncio.Semaphore(max_parallel)
+        self._order = asyncio.Queue()  # (index, sentence, chunk queue), None once closed
+        self._tasks = []
+        self._stopped = False
+        self.sentences = 0
+        self.sent = 0
+
+    def add(self, text: str):
+        """Queues the sentences in text for synthesis."""
+        if self._stopped:
+            return
+        for sentence in speech_sentences(text):
+            chunks = asyncio.Queue()
+            self._tasks.append(asyncio.create_task(self._synthesize(sentence, chunks)))
+            self._order.put_nowait((self.sentences, sentence, chunks))
+            self.sentences += 1
+
+    def close(self):
+        """Marks the end of the response text."""
+        self._order.put_nowait(None)
+
+    async def _synthesize(self, sentence: str, chunks: asyncio.Queue):
+        # The slot is released by frames() once this sentence has been sent
+        await self._slots.acquire()
+        try:
+            async for audio in iterate_blocking(self._sentence_audio, sentence):
+                chunks.put_nowait(audio)
+        except Exception as e:
+            chunks.put_nowait(e)
+        else:
+            chunks.put_nowait(None)
+
+    def _sentence_audio(self, sentence: str):
+        # Runs on a worker thread: the cache lookup touches the disk index
+        if self.cache is None:
+            return synthesize_stream(sentence, self.api_key, self.voice)
+        path = self.cache.lookup(sentence, self.voice, GEMINI_TTS_MODEL)
+        if path is not None:
+            return self.cache.read_chunks(path)
+        return self.cache.store_stream(
+            sentence, self.voice, GEMINI_TTS_MODEL, synthesize_stream(sentence, self.api_key, self.voice)
+        )
+
+    async def frames(self):
+        """
+        Yields (index, sentence, frame) in sentence order. A None frame
+        announces the start of a sentence; the rest are PCM frames.
+        """
+        try:
+            while True:
+                entry = await self._order.get()
+                if entry is None:
+                    return
+                index, sentence, chunks = entry
+                yield index, sentence, None
+                pending = b""
+                try:
+                    while True:
+                        audio = await chunks.get()
+                        if audio is None:
+                            break
+                        if isinstance(audio, Exception):
+                            raise TTSError(f"TTS failed for sentence {index}: {audio}") from audio
+                        pending += audio
+                        while len(pending) >= self.frame_bytes:
+                            yield index, sentence, pending[:self.frame_bytes]
+                            pending = pending[self.frame_bytes:]
+                    if pending:
+                        yield index, sentence, pending
+                finally:
+                    self._slots.release()
+                self.sent += 1
+        finally:
+            self._stopped = True
+            for task in self._tasks:
+                task.cancel()
@@ -0,0 +1,222 @@
+import os
+import time
+import wave
+import uuid
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Iterable, Iterator, Optional
+
+# --- Configuration ---
+TTS_CACHE_CHUNK_BYTES = 32768
+# Unindexed files younger than this may still be in the middle of being added
+TTS_CACHE_ORPHAN_GRACE_SECONDS = 300
+
+
+class TTSAudioCache:
+    """
+    Content-addressed store for synthesized speech.
+
+    Each entry is keyed by sha256(model, voice, text) and kept as a WAV file
+    under root/<2 hex>/<2 hex>/<key>.wav, so no directory grows large. A
+    SQLite index (WAL mode, shared by all workers on the host) records size
+    and last access for every file; once the total passes max_bytes the
+    least recently used files are deleted. Files are written to a temporary
+    name and renamed into place, so readers never see partial audio.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            voice TEXT NOT NULL,
+            model TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 1024 * 1024, sample_rate: int = 24000):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        self._connect().executescript(self._SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._reconcile()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, "index.db"), timeout=5.0, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key_for(text: str, voice: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{voice}\0{text}".encode()).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}.wav")
+
+    def lookup(self, text: str, voice: str, model: str) -> Optional[str]:
+        """Returns the cached WAV path for this text and voice, or None."""
+        return self.lookup_key(self.key_for(text, voice, model))
+
+    def lookup_key(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        updated = self._connect().execute(
+            "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+        ).rowcount
+        if updated and os.path.exists(path):
+            self.hits += 1
+            return path
+        if updated:
+            self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.misses += 1
+        return None
+
+    def store_stream(self, text: str, voice: str, model: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Passes PCM chunks through while writing them to the cache. The entry
+        is only committed if the stream finishes; a failed or abandoned
+        synthesis leaves nothing behind.
+        """
+        key = self.key_for(text, voice, model)
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        completed = False
+        try:
+            with wave.open(tmp_path, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.sample_rate)
+                for chunk in chunks:
+                    wav.writeframesraw(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self._add(key, text, voice, model, os.path.getsize(path))
+
+    def store(self, text: str, voice: str, model: str, chunks: Iterable[bytes]) -> str:
+        """Writes a whole synthesis into the cache and returns its path."""
+        for _ in self.store_stream(text, voice, model, chunks):
+            pass
+        return self.path_for(self.key_for(text, voice, model))
+
+    def read_chunks(self, path: str, chunk_bytes: int = TTS_CACHE_CHUNK_BYTES) -> Iterator[bytes]:
+        """Yields the PCM frames of a cached WAV file."""
+        with wave.open(path, "rb") as wav:
+            frames = chunk_bytes // 2
+            while True:
+                chunk = wav.readframes(frames)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _add(self, key: str, text: str, voice: str, model: str, size: int):
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, text, voice, model, bytes, created, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, text[:500], voice, model, size, now, now)
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        removed = 0
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, bytes FROM entries ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                try:
+                    os.remove(self.path_for(key))
+                except OSError:
+                    pass
+                total -= size
+                removed += 1
+        if removed:
+            self.evictions += removed
+            logging.info(f"TTS cache evicted {removed} entries ({total} bytes kept)")
+        return removed
+
+    def _reconcile(self):
+        # Drop index rows whose files were deleted behind our back
+        conn = self._connect()
+        indexed = {key for (key,) in conn.execute("SELECT key FROM entries")}
+        missing = [key for key in indexed if not os.path.exists(self.path_for(key))]
+        for key in missing:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if missing:
+            logging.info(f"TTS cache dropped {len(missing)} index entries without files")
+        self._remove_orphans(indexed)
+        self.evict()
+
+    def _remove_orphans(self, indexed: set):
+        """
+        Deletes WAV files the index does not know (left by a crash between
+        rename and insert) and abandoned temporary files. Their text and
+        voice are not on disk, so they cannot be re-indexed, and left alone
+        they would sit outside max_bytes forever.
+        """
+        cutoff = time.time() - TTS_CACHE_ORPHAN_GRACE_SECONDS
+        removed = freed = 0
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_path):
+                continue
+            for subdir, _, files in os.walk(shard_path):
+                for name in files:
+                    if name.endswith(".wav"):
+                        if name[:-4] in indexed:
+                            continue
+                    elif not name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(subdir, name)
+                    try:
+                        stat = os.stat(path)
+                        if stat.st_mtime > cutoff:
+                            continue
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    removed += 1
+                    freed += stat.st_size
+        if removed:
+            logging.info(f"TTS cache deleted {removed} unindexed files ({freed} bytes)")
+
+    def stats(self) -> dict:
+        entries, total = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
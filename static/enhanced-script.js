@@ -31,6 +31,35 @@ let recognitionTimeout = null;
 let currentUserMessage = "";
 let currentBotMessage = "";
 let sessionStats = { totalMessages: 0, currentPersona: "default" };
+let pendingUtterances = 0;
+let streamingResponse = false;
+
+// Server-side TTS (open the page with ?tts=server): the server streams
+// 16-bit PCM as binary frames, scheduled back to back with Web Audio.
+const serverTtsEnabled = new URLSearchParams(window.location.search).get("tts") === "server";
+let ttsContext = null;
+let ttsSampleRate = 24000;
+let ttsPlayhead = 0;
+let ttsSources = [];
+let ttsStreamDone = true;
+
+// Websocket protocol v2: events arrive batched in JSON arrays, fields listed
+// in the hello message's "sticky" are only sent when they change, and binary
+// frames carry a two-byte [kind, 0] header (kind 2 = PCM audio).
+const WS_PROTOCOL = 2;
+const WS_FRAME_AUDIO = 2;
+let stickyFields = [];
+let stickyValues = {};
+
+// Interim recognition results go to the server as partial_transcript so it
+// can start fetching a skill's data before the user stops speaking; sent at
+// most every PARTIAL_INTERVAL_MS, and only when the text changed.
+const PARTIAL_INTERVAL_MS = 250;
+let lastPartialText = "";
+let lastPartialAt = 0;
+
+// Session creation refused with 503/429 is retried after its Retry-After
+const SESSION_RETRIES = 3;
 
 function wsUrl(path) {
   const isSecure = window.location.protocol === "https:";
@@ -94,7 +123,9 @@ function sendTextMessage() {
   if (ws && ws.readyState === WebSocket.OPEN) {
     ws.send(JSON.stringify({ 
       type: "user_transcript", 
-      text: message 
+      text: message,
+      stream: true,
+      tts: serverTtsEnabled ? "server" : "browser"
     }));
     updateButtonState("processing");
   } else {
@@ -198,14 +229,19 @@ function hideAudioStatus() {
 }
 
 // ---- Browser TTS ----
-function speakTextWithBrowserTTS(text, persona = "default") {
+// queue=true appends to whatever is already being spoken (used for streamed
+// llm_chunk sentences); otherwise any current speech is cancelled first.
+function speakTextWithBrowserTTS(text, persona = "default", queue = false) {
   if (!('speechSynthesis' in window)) {
     showAudioStatus("❌ Browser TTS not supported", "error");
     return false;
   }
 
   try {
-    speechSynthesis.cancel();
+    if (!queue) {
+      speechSynthesis.cancel();
+      pendingUtterances = 0;
+    }
     
     const utterance = new SpeechSynthesisUtterance(text);
     const voices = speechSynthesis.getVoices();
@@ -242,6 +278,8 @@ function speakTextWithBrowserTTS(text, persona = "default") {
     };
     
     utterance.onend = () => {
+      pendingUtterances = Math.max(0, pendingUtterances - 1);
+      if (pendingUtterances > 0 || streamingResponse) return;
       console.log("🔊 TTS completed");
       updateButtonState("idle");
       showAudioStatus(`✅ ${config.displayName} finished speaking`);
@@ -249,12 +287,14 @@ function speakTextWithBrowserTTS(text, persona = "default") {
     };
     
     utterance.onerror = (event) => {
+      pendingUtterances = Math.max(0, pendingUtterances - 1);
       console.error("❌ TTS error:", event.error);
       updateButtonState("error");
       showAudioStatus(`❌ Voice error: ${event.error}`);
       setTimeout(() => updateButtonState("idle"), 3000);
     };
     
+    pendingUtterances++;
     speechSynthesis.speak(utterance);
     return true;
     
@@ -267,6 +307,57 @@ function speakTextWithBrowserTTS(text, persona = "default") {
   }
 }
 
+// ---- Server TTS Playback ----
+function startServerAudio(sampleRate) {
+  stopServerAudio();
+  ttsSampleRate = sampleRate || 24000;
+  ttsStreamDone = false;
+  if (!ttsContext) {
+    ttsContext = new (window.AudioContext || window.webkitAudioContext)();
+  }
+  if (ttsContext.state === "suspended") ttsContext.resume();
+  ttsPlayhead = ttsContext.currentTime + 0.05;
+  updateButtonState("responding");
+  showAudioStatus("🔊 Assistant is speaking...", "speaking");
+}
+
+function playServerAudio(data, offset = 0) {
+  if (!ttsContext) return;
+  const pcm = new Int16Array(data, offset);
+  if (!pcm.length) return;
+  const buffer = ttsContext.createBuffer(1, pcm.length, ttsSampleRate);
+  const channel = buffer.getChannelData(0);
+  for (let i = 0; i < pcm.length; i++) channel[i] = pcm[i] / 32768;
+
+  const source = ttsContext.createBufferSource();
+  source.buffer = buffer;
+  source.connect(ttsContext.destination);
+  ttsPlayhead = Math.max(ttsPlayhead, ttsContext.currentTime);
+  source.start(ttsPlayhead);
+  ttsPlayhead += buffer.duration;
+  ttsSources.push(source);
+  source.onended = () => {
+    ttsSources = ttsSources.filter((s) => s !== source);
+    finishServerAudioIfDone();
+  };
+}
+
+function finishServerAudioIfDone() {
+  if (!ttsStreamDone || ttsSources.length) return;
+  updateButtonState("idle");
+  showAudioStatus("✅ Assistant finished speaking");
+  setTimeout(() => hideAudioStatus(), 3000);
+}
+
+function stopServerAudio() {
+  ttsSources.forEach((source) => {
+    source.onended = null;
+    try { source.stop(); } catch (e) {}
+  });
+  ttsSources = [];
+  ttsStreamDone = true;
+}
+
 // ---- API Configuration Functions ----
 function updateApiStatus() {
   const geminiStatus = document.getElementById('gemini-status');
@@ -474,14 +565,24 @@ async function init() {
   await loadVoices();
   
   try {
-    const resp = await fetch("/session");
+    let resp = await fetch("/session");
+    // Busy or rate limited: try again when the server says to, a few times
+    for (let attempt = 1; (resp.status === 503 || resp.status === 429) && attempt <= SESSION_RETRIES; attempt++) {
+      const wait = Number(resp.headers.get("Retry-After")) || 2;
+      showAudioStatus(`⏳ Server busy, retrying in ${wait}s...`);
+      await new Promise((resolve) => setTimeout(resolve, wait * 1000));
+      resp = await fetch("/session");
+    }
     if (!resp.ok) throw new Error(`Session creation failed: ${resp.status}`);
     
     const data = await resp.json();
     sessionId = data.session_id;
     console.log("✅ Session created:", sessionId);
 
-    ws = new WebSocket(wsUrl(`/ws/${sessionId}`));
+    stickyFields = [];
+    stickyValues = {};
+    ws = new WebSocket(wsUrl(`/ws/${sessionId}?protocol=${WS_PROTOCOL}`));
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("✅ WebSocket connected");
@@ -501,63 +602,25 @@ async function init() {
     };
 
     ws.onmessage = (event) => {
-      try {
-        const msg = JSON.parse(event.data);
-        console.log("📥 Server message:", msg.type);
-
-        switch (msg.type) {
-          case "ack_transcript":
-            updateButtonState("processing");
-            break;
-
-          case "final":
-            currentUserMessage = msg.text;
-            userTranscriptText.textContent = msg.text;
-            transcriptContainer.classList.remove("hidden");
-            break;
-
-          case "llm_response":
-            currentBotMessage = msg.text;
-            llmResponseText.textContent = msg.text;
-            responseContainer.classList.remove("hidden");
-            
-            const currentPersona = msg.persona || personaSelect.value || "default";
-            
-            if (currentUserMessage && currentBotMessage) {
-              addToHistory(currentUserMessage, currentBotMessage, currentPersona);
-            }
-            
-            // Update API status if provided
-            if (msg.api_keys_status) {
-              updateApiStatusFromServer({
-                ai_chat: msg.api_keys_status.gemini,
-                weather: msg.api_keys_status.openweather,
-                web_search: msg.api_keys_status.tavily
-              });
-            }
-            
-            audioStatus.classList.remove("hidden");
-            speakTextWithBrowserTTS(msg.text, currentPersona);
-            
-            if (msg.persona) {
-              llmResponseText.textContent += `\n\n[Persona: ${msg.persona}]`;
-            }
-            break;
-
-          case "audio_end":
-            audioBuffer = "";
-            updateButtonState("idle");
-            break;
-
-          case "error":
-            console.error("❌ Server error:", msg.message);
-            updateButtonState("error");
-            showAudioStatus(`❌ ${msg.message}`);
-            setTimeout(() => updateButtonState("idle"), 3000);
-            break;
+      if (event.data instanceof ArrayBuffer) {
+        if (new Uint8Array(event.data, 0, 1)[0] === WS_FRAME_AUDIO) {
+          playServerAudio(event.data, 2);
         }
+        return;
+      }
+      let payload;
+      try {
+        payload = JSON.parse(event.data);
       } catch (error) {
         console.error("❌ Error parsing message:", error);
+        return;
+      }
+      for (const msg of Array.isArray(payload) ? payload : [payload]) {
+        try {
+          handleServerMessage(restoreStickyFields(msg));
+        } catch (error) {
+          console.error("❌ Error handling message:", msg.type, error);
+        }
       }
     };
 
@@ -584,6 +647,131 @@ async function init() {
   setupSpeechRecognition();
 }
 
+// ---- Server Messages ----
+function restoreStickyFields(msg) {
+  for (const field of stickyFields) {
+    if (field in msg) stickyValues[field] = msg[field];
+    else if (field in stickyValues) msg[field] = stickyValues[field];
+  }
+  return msg;
+}
+
+function handleServerMessage(msg) {
+  console.log("📥 Server message:", msg.type);
+
+  switch (msg.type) {
+    case "hello":
+      stickyFields = msg.sticky || [];
+      console.log(`🤝 Protocol v${msg.protocol} (${msg.encoding})`);
+      break;
+
+    case "ack_transcript":
+      updateButtonState("processing");
+      break;
+
+    case "final":
+      currentUserMessage = msg.text;
+      userTranscriptText.textContent = msg.text;
+      transcriptContainer.classList.remove("hidden");
+      break;
+
+    case "llm_chunk":
+      // Streamed sentence group: show it and start speaking right away
+      if (!streamingResponse) {
+        streamingResponse = true;
+        llmResponseText.textContent = "";
+        responseContainer.classList.remove("hidden");
+        audioStatus.classList.remove("hidden");
+      }
+      llmResponseText.textContent += (llmResponseText.textContent ? " " : "") + msg.text;
+      if (!serverTtsEnabled) {
+        speakTextWithBrowserTTS(msg.text, msg.persona || personaSelect.value || "default", msg.index > 0);
+      }
+      break;
+
+    case "llm_done":
+    case "llm_response":
+      const wasStreamed = msg.type === "llm_done";
+      streamingResponse = false;
+      currentBotMessage = msg.text;
+      llmResponseText.textContent = msg.text;
+      responseContainer.classList.remove("hidden");
+      
+      const currentPersona = msg.persona || personaSelect.value || "default";
+      
+      if (currentUserMessage && currentBotMessage) {
+        addToHistory(currentUserMessage, currentBotMessage, currentPersona);
+      }
+      
+      // Update API status if provided
+      if (msg.api_keys_status) {
+        updateApiStatusFromServer({
+          ai_chat: msg.api_keys_status.gemini,
+          weather: msg.api_keys_status.openweather,
+          web_search: msg.api_keys_status.tavily
+        });
+      }
+      
+      audioStatus.classList.remove("hidden");
+      if (serverTtsEnabled) {
+        // Audio arrives as binary frames; see tts_start / audio_end
+      } else if (!wasStreamed) {
+        speakTextWithBrowserTTS(msg.text, currentPersona);
+      } else if (pendingUtterances === 0) {
+        updateButtonState("idle");
+      }
+      
+      if (msg.persona) {
+        llmResponseText.textContent += `\n\n[Persona: ${msg.persona}]`;
+      }
+      break;
+
+    case "turn_cancelled":
+      // Server dropped the in-flight answer because we barged in
+      streamingResponse = false;
+      speechSynthesis.cancel();
+      pendingUtterances = 0;
+      stopServerAudio();
+      break;
+
+    case "tts_start":
+      startServerAudio(msg.sample_rate);
+      break;
+
+    case "tts_sentence":
+      console.log(`🔊 Server TTS sentence ${msg.index}: ${msg.text}`);
+      break;
+
+    case "audio_end":
+      audioBuffer = "";
+      if (msg.source === "server_tts") {
+        ttsStreamDone = true;
+        finishServerAudioIfDone();
+        break;
+      }
+      if (serverTtsEnabled && !msg.sentences_played && currentBotMessage) {
+        // Server could not synthesize this answer; speak it locally
+        speakTextWithBrowserTTS(currentBotMessage, personaSelect.value || "default");
+      }
+      updateButtonState("idle");
+      break;
+
+    case "overloaded":
+      // Turn refused by admission control; nothing was queued
+      console.warn(`⏳ Server ${msg.reason}, retry in ${msg.retry_after}s`);
+      updateButtonState("idle");
+      showAudioStatus(`⏳ ${msg.message}`);
+      break;
+
+    case "error":
+      console.error("❌ Server error:", msg.message);
+      updateButtonState("error");
+      showAudioStatus(`❌ ${msg.message}`);
+      setTimeout(() => updateButtonState("idle"), 3000);
+      break;
+  }
+}
+
 // ---- Speech Recognition ----
 function setupSpeechRecognition() {
   const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
@@ -600,6 +788,7 @@ function setupSpeechRecognition() {
     isRecognitionActive = true;
     manualStop = false;
     finalText = "";
+    lastPartialText = "";
     transcriptContainer.classList.remove("hidden");
     userTranscriptText.textContent = "(listening... speak now!)";
     updateButtonState("recording");
@@ -626,8 +815,19 @@ function setupSpeechRecognition() {
     
     const combined = (finalText + " " + interim).trim();
     userTranscriptText.textContent = combined || "(listening... speak now!)";
+    sendPartialTranscript(combined);
   };
 
+  function sendPartialTranscript(text) {
+    const now = Date.now();
+    if (!text || text === lastPartialText || now - lastPartialAt < PARTIAL_INTERVAL_MS) return;
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      ws.send(JSON.stringify({ type: "partial_transcript", text }));
+      lastPartialText = text;
+      lastPartialAt = now;
+    }
+  }
+
   recognition.onend = () => {
     console.log("🛑 Speech Recognition ended");
     isRecognitionActive = false;
@@ -638,7 +838,7 @@ function setupSpeechRecognition() {
     if (text && text.length >= 2) {
       if (ws && ws.readyState === WebSocket.OPEN) {
         currentUserMessage = text;
-        ws.send(JSON.stringify({ type: "user_transcript", text }));
+        ws.send(JSON.stringify({ type: "user_transcript", text, stream: true, tts: serverTtsEnabled ? "server" : "browser" }));
         updateButtonState("processing");
       } else {
         userTranscriptText.textContent = "Connection error. Please try again.";
@@ -677,7 +877,15 @@ function setupSpeechRecognition() {
   };
 }
 
+// Barge-in: ask the server to drop whatever answer it is still working on
+function interruptServerTurn() {
+  if (ws && ws.readyState === WebSocket.OPEN) {
+    ws.send(JSON.stringify({ type: "interrupt" }));
+  }
+}
+
 function resetUI() {
+  interruptServerTurn();
   userTranscriptText.textContent = "";
   llmResponseText.textContent = "";
   transcriptContainer.classList.add("hidden");
@@ -696,6 +904,7 @@ function resetUI() {
   
   isRecognitionActive = false;
   speechSynthesis.cancel();
+  stopServerAudio();
   hideAudioStatus();
   updateButtonState("idle");
 }
@@ -813,7 +1022,9 @@ document.addEventListener('DOMContentLoaded', () => {
 // ---- Keyboard Shortcuts ----
 document.addEventListener("keydown", (event) => {
   if (event.key === "Escape") {
+    interruptServerTurn();
     speechSynthesis.cancel();
+    stopServerAudio();
     hideAudioStatus();
     closeSettings();
     if (isRecognitionActive && recognition) {